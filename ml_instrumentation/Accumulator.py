@@ -0,0 +1,182 @@
+import numpy as np
+from collections.abc import Sequence
+from typing import Any, NamedTuple
+
+from ml_instrumentation.Collector import Collector
+from ml_instrumentation.Sampler import Identity, Ignore, MovingAverage, Subsample, Window
+
+try:
+    import jax
+    import jax.numpy as jnp
+except ImportError:
+    jax = None
+    jnp = None
+
+
+class AccumulatorState(NamedTuple):
+    # emitted values and their frames, one ring buffer per metric
+    values: dict[str, Any]
+    frames: dict[str, Any]
+    counts: dict[str, Any]
+
+    # on-device sampler state, one entry per metric
+    carry: dict[str, Any]
+
+
+# Records metrics on device inside jitted code, then hands them to the
+# collector in one batched host callback once any buffer fills up or
+# when `flush` is called.
+#
+# Window, Subsample, MovingAverage, and Identity samplers run on device
+# so only emitted values are buffered. Any other sampler receives the
+# raw values on the host after the flush.
+class Accumulator:
+    def __init__(self, collector: Collector, metrics: Sequence[str], capacity: int = 1_000, dtype: Any = None):
+        if jax is None or jnp is None:
+            raise Exception('jax is not installed')
+
+        self._collector = collector
+        self._capacity = capacity
+        self._dtype = dtype if dtype is not None else jnp.float32
+
+        self._samplers: dict[str, Any] = {}
+        for m in metrics:
+            sampler = collector._sampler.get(m, collector._def)
+            if m in collector._ignore or isinstance(sampler, Ignore):
+                continue
+
+            self._samplers[m] = sampler
+
+        self._metrics = list(self._samplers)
+
+        # number of host callbacks issued, useful for diagnostics
+        self.callbacks = 0
+
+    def init(self) -> AccumulatorState:
+        assert jnp is not None
+        return AccumulatorState(
+            values={m: jnp.zeros(self._capacity, dtype=self._dtype) for m in self._metrics},
+            frames={m: jnp.zeros(self._capacity, dtype=jnp.int32) for m in self._metrics},
+            counts={m: jnp.zeros((), dtype=jnp.int32) for m in self._metrics},
+            carry={m: _init_carry(s, self._dtype) for m, s in self._samplers.items()},
+        )
+
+    def record(self, state: AccumulatorState, metrics: dict[str, Any], frame: Any) -> AccumulatorState:
+        assert jax is not None and jnp is not None
+
+        values = dict(state.values)
+        frames = dict(state.frames)
+        counts = dict(state.counts)
+        carry = dict(state.carry)
+
+        for m, v in metrics.items():
+            if m not in values:
+                continue
+
+            v = jnp.asarray(v, dtype=self._dtype)
+            emit, out, carry[m] = _device_next(self._samplers[m], carry[m], v, frame)
+
+            # slots past the count are unused, so write unconditionally
+            # and only advance the count when the sampler emits
+            i = counts[m]
+            values[m] = values[m].at[i].set(out)
+            frames[m] = frames[m].at[i].set(frame)
+            counts[m] = i + emit.astype(jnp.int32)
+
+        state = AccumulatorState(values, frames, counts, carry)
+
+        full = jnp.stack([c >= self._capacity for c in counts.values()]).any()
+        return jax.lax.cond(full, self.flush, lambda s: s, state)
+
+    def flush(self, state: AccumulatorState) -> AccumulatorState:
+        assert jax is not None and jnp is not None
+
+        jax.debug.callback(self._host_flush, state.values, state.frames, state.counts, ordered=False)
+        return state._replace(
+            counts={m: jnp.zeros_like(c) for m, c in state.counts.items()},
+        )
+
+    def end(self, state: AccumulatorState) -> AccumulatorState:
+        # the on-device counterpart of `collector.reset()`: flushes the buffers,
+        # emits partially filled windows, and restarts the device sampler state
+        assert jax is not None and jnp is not None
+
+        windows = {m: state.carry[m] for m, s in self._samplers.items() if isinstance(s, Window)}
+        jax.debug.callback(self._host_end, state.values, state.frames, state.counts, windows, ordered=False)
+        return state._replace(
+            counts={m: jnp.zeros_like(c) for m, c in state.counts.items()},
+            carry={m: _init_carry(s, self._dtype) for m, s in self._samplers.items()},
+        )
+
+    # --------------
+    # -- Internal --
+    # --------------
+    def _host_flush(self, values: dict[str, Any], frames: dict[str, Any], counts: dict[str, Any]):
+        self.callbacks += 1
+        for m in self._metrics:
+            n = int(counts[m])
+            if n == 0:
+                continue
+
+            vs = np.asarray(values[m])[:n].tolist()
+            fs = np.asarray(frames[m])[:n].tolist()
+
+            if _on_device(self._samplers[m]):
+                self._collector._write_array(m, vs, fs)
+            else:
+                self._collector.collect_array(m, vs, fs)
+
+    def _host_end(self, values: dict[str, Any], frames: dict[str, Any], counts: dict[str, Any], windows: dict[str, Any]):
+        # a single callback, so partial windows are always written after the buffered values
+        self._host_flush(values, frames, counts)
+        for m, (total, clock, frame) in windows.items():
+            n = int(clock)
+            if n == 0:
+                continue
+
+            # like `Window.end`, stored on the frame after the last value
+            self._collector._write_array(m, [float(total) / n], [int(frame) + 1])
+
+
+# ---------------------
+# -- Device samplers --
+# ---------------------
+def _on_device(sampler: Any):
+    return isinstance(sampler, (Identity, Window, Subsample, MovingAverage))
+
+
+def _init_carry(sampler: Any, dtype: Any):
+    assert jnp is not None
+    if isinstance(sampler, Window):
+        # running total, number of values in the window, and the frame of the last one
+        return (jnp.zeros((), dtype=dtype), jnp.zeros((), dtype=jnp.int32), jnp.zeros((), dtype=jnp.int32))
+
+    if isinstance(sampler, Subsample):
+        return jnp.zeros((), dtype=jnp.int32)
+
+    if isinstance(sampler, MovingAverage):
+        return jnp.asarray(sampler.z, dtype=dtype)
+
+    return ()
+
+
+def _device_next(sampler: Any, carry: Any, v: Any, frame: Any):
+    assert jnp is not None
+    if isinstance(sampler, Window):
+        total, clock, _ = carry
+        total = total + v
+        clock = clock + 1
+        emit = clock == sampler._size
+        out = total / sampler._size
+        return emit, out, (jnp.where(emit, 0, total), jnp.where(emit, 0, clock), jnp.asarray(frame, dtype=jnp.int32))
+
+    if isinstance(sampler, Subsample):
+        emit = carry % sampler._freq == 0
+        return emit, v, carry + 1
+
+    if isinstance(sampler, MovingAverage):
+        z = sampler._decay * carry + (1. - sampler._decay) * v
+        return jnp.bool_(True), z, z
+
+    # Identity and host-side samplers buffer every raw value
+    return jnp.bool_(True), v, carry
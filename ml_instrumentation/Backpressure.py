@@ -0,0 +1,133 @@
+import logging
+import os
+import pickle
+import tempfile
+import time
+from collections import defaultdict
+from typing import TYPE_CHECKING, Any
+
+from ml_instrumentation.backends.base import Columns
+
+if TYPE_CHECKING:
+    from ml_instrumentation.Writer import Writer
+
+logger = logging.getLogger('ml-instrumentation')
+
+# Backpressure policies decide what happens when the writer buffer passes
+# its high watermark while a background write is still in flight.
+# Each policy keeps counters describing the delay or data loss it caused.
+class Backpressure:
+    def relieve(self, writer: 'Writer') -> None: ...
+    def stats(self) -> dict[str, Any]: ...
+
+# ----------------
+# -- Strategies --
+# ----------------
+class Block(Backpressure):
+    def __init__(self):
+        self.blocked = 0
+        self.blocked_time = 0.
+
+    def relieve(self, writer: 'Writer'):
+        assert writer._write_future is not None
+
+        start = time.perf_counter()
+        writer._write_future.result()
+        self.blocked += 1
+        self.blocked_time += time.perf_counter() - start
+
+        logger.warning(f'Buffer reached high watermark. (last write: {writer._last_write_time}s, avg write: {writer._avg_write_time}s)')
+
+    def stats(self):
+        return {
+            'blocked': self.blocked,
+            'blocked_time': self.blocked_time,
+        }
+
+class Spill(Backpressure):
+    def __init__(self, dir: str | None = None):
+        self._dir = dir
+        self.spills = 0
+        self.spilled_points = 0
+
+    def relieve(self, writer: 'Writer'):
+        data = {m: (c.frames, c.ids, c.values) for m, c in writer._buffer.items()}
+        for m, c in writer._buffer.items():
+            writer._buffered[m] += len(c)
+
+        fd, path = tempfile.mkstemp(suffix='.spill', dir=self._dir)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        self.spills += 1
+        self.spilled_points += writer._i
+
+        writer._spilled.append(path)
+        writer._buffer = defaultdict(Columns)
+        writer._i = 0
+
+    def stats(self):
+        return {
+            'spills': self.spills,
+            'spilled_points': self.spilled_points,
+        }
+
+class Downsample(Backpressure):
+    def __init__(self, factor: int = 2):
+        assert factor > 1
+        self._factor = factor
+        self.downsampled = 0
+        self.dropped = 0
+
+    def relieve(self, writer: 'Writer'):
+        n = 0
+        for cols in writer._buffer.values():
+            cols.keep(slice(None, None, self._factor))
+            n += len(cols)
+
+        self.downsampled += 1
+        self.dropped += writer._i - n
+        writer._i = n
+
+    def stats(self):
+        return {
+            'downsampled': self.downsampled,
+            'dropped': self.dropped,
+        }
+
+class DropOldest(Backpressure):
+    def __init__(self):
+        self.drops = 0
+        self.dropped = 0
+
+    def relieve(self, writer: 'Writer'):
+        # drop the same fraction of every metric to get back to the low watermark
+        frac = writer._lw / writer._i
+        n = 0
+        for cols in writer._buffer.values():
+            keep = int(len(cols) * frac)
+            cols.keep(slice(len(cols) - keep, None))
+            n += keep
+
+        self.drops += 1
+        self.dropped += writer._i - n
+        writer._i = n
+
+    def stats(self):
+        return {
+            'drops': self.drops,
+            'dropped': self.dropped,
+        }
+
+
+def load_spill(path: str) -> dict[str, Columns]:
+    with open(path, 'rb') as f:
+        data = pickle.load(f)
+
+    out: dict[str, Columns] = {}
+    for m, (frames, ids, values) in data.items():
+        cols = Columns()
+        cols.frames, cols.ids, cols.values = frames, ids, values
+        out[m] = cols
+
+    return out
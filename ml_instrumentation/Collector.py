@@ -1,13 +1,17 @@
-from collections.abc import Callable
+import numpy as np
+from collections.abc import Callable, Sequence
 from typing import Any
 
+from ml_instrumentation.Backpressure import Backpressure
 from ml_instrumentation.backends.base import BaseBackend
-from ml_instrumentation.Sampler import Sampler, Ignore, Identity, identity
-from ml_instrumentation.Writer import Writer, Point
-from ml_instrumentation.backends.sqlite import Sqlite
+from ml_instrumentation.Sampler import Batch, Framed, Sampler, Ignore, Identity, VectorSampler, identity
+from ml_instrumentation.ProcessWriter import ProcessWriter
+from ml_instrumentation.Writer import Writer
+from ml_instrumentation.backends.sqlite import LongSqlite, Sqlite
 
 try:
     import jax
+    import jax.core
 except ImportError:
     jax = None
 
@@ -22,21 +26,32 @@ class Collector:
         experiment_id: int | str | None = None,
         low_watermark: int = 1_000,
         high_watermark: int = 100_000,
+        checkpoint_path: str | None = None,
+        backpressure: Backpressure | None = None,
+        out_of_process: bool = False,
+        adaptive_watermarks: bool = False,
+        target_flush_latency: float = 0.05,
+        flush_interval: float | None = None,
+        sqlite_profile: str = 'default',
+        sqlite_layout: str = 'tables',
     ):
         self._c = config or {}
 
         self._ignore = set(k for k, sampler in self._c.items() if isinstance(sampler, Ignore))
         self._sampler: dict[str, Sampler] = {
-            k: sampler for k, sampler in self._c.items() if not isinstance(sampler, Ignore)
+            k: _FramedMetric(self, k, sampler) if getattr(sampler, 'framed', False) else sampler
+            for k, sampler in self._c.items() if not isinstance(sampler, Ignore)
         }
 
-        self._backend = backend or Sqlite(tmp_file)
+        assert sqlite_layout in ('tables', 'long')
+        self._backend = backend or (LongSqlite if sqlite_layout == 'long' else Sqlite)(tmp_file, profile=sqlite_profile)
+        self._backpressure = backpressure
+        self._out_of_process = out_of_process
+        self._adaptive = adaptive_watermarks
+        self._target_latency = target_flush_latency
+        self._flush_interval = flush_interval
 
-        self._writer = Writer(
-            backend=self._backend,
-            low_watermark=low_watermark,
-            high_watermark=high_watermark,
-        )
+        self._writer = self._make_writer(low_watermark, high_watermark)
 
         self._exp_id = experiment_id
         self._frame: int = -1
@@ -49,6 +64,17 @@ class Collector:
         self._idxs = set[int | str]()
         self._keys = set[str]()
 
+        # per-experiment sampler state for collect_vector
+        self._vec: dict[str, VectorSampler] = {}
+        self._slots: dict[int | str, int] = {}
+        self._slot_ids: list[int | str] = []
+
+        # incremental checkpointing state, each pickle only stores
+        # the rows written since the previous pickle in a sidecar file
+        self._checkpoint_path = checkpoint_path
+        self._deltas: list[str] = []
+        self._marks: dict[str, int] = {}
+
     # -------------
     # -- Context --
     # -------------
@@ -77,7 +103,16 @@ class Collector:
             if v is None:
                 continue
 
-            self._write(k, v)
+            if isinstance(v, Batch):
+                self._write_array(k, v, [self._frame] * len(v))
+            else:
+                self._write(k, v)
+
+        ids = np.array(self._slot_ids, dtype=object)
+        for k, vs in self._vec.items():
+            vs.ensure(len(ids))
+            out, emit = vs.end()
+            self._write_vector(k, *_expand_batches(out[emit], ids[emit]))
 
         self._frame = -1
 
@@ -113,20 +148,136 @@ class Collector:
 
         self._write(name, v)
 
-    def collect_jax(self, name: str, value: Any):
+    def _collect_at(self, name: str, value: Any, frame: int):
+        if name in self._ignore:
+            return
+
+        v = self._sampler.get(name, self._def).next(value)
+        if v is None:
+            return
+
+        self._write_array(name, [v], [frame])
+
+    def collect_many(self, metrics: dict[str, Any]):
+        if self._frame == -1:
+            self.next_frame()
+
+        out: dict[str, Any] = {}
+        for name, value in metrics.items():
+            if name in self._ignore:
+                continue
+
+            v = self._sampler.get(name, self._def).next(value)
+            if v is None:
+                continue
+
+            out[name] = v
+
+        if out:
+            self._keys.update(out)
+            self._writer.append_frame(self.get_current_experiment_id(), self._frame, out)
+
+    def collect_array(self, name: str, values: Sequence[Any] | np.ndarray, frames: Sequence[int]):
+        assert len(values) == len(frames)
+        if name in self._ignore:
+            return
+
+        sampler = self._sampler.get(name, self._def)
+        if isinstance(sampler, _FramedMetric):
+            sampler.next_many_at(np.asarray(values), np.asarray(frames))
+            return
+
+        out, offsets = sampler.next_many(np.asarray(values))
+
+        # rows of array-valued metrics stay arrays, so they are stored as blobs
+        vs = list(out) if out.ndim > 1 else out.tolist()
+        self._write_array(name, vs, np.asarray(frames)[offsets].tolist())
+
+    def collect_vector(self, name: str, values: Sequence[Any] | np.ndarray, exp_ids: Sequence[int | str] | np.ndarray):
+        assert len(values) == len(exp_ids)
+        if name in self._ignore:
+            return
+
+        if self._frame == -1:
+            self.next_frame()
+
+        vs = self._vec.get(name)
+        if vs is None:
+            sampler = self._sampler.get(name, self._def)
+            if isinstance(sampler, Ignore):
+                return
+
+            vs = self._vec[name] = sampler.vectorize()
+
+        ids = np.asarray(exp_ids)
+        slots = self._get_slots(ids)
+        vs.ensure(len(self._slot_ids))
+
+        out, emit = vs.next(np.asarray(values), slots)
+        self._write_vector(name, out[emit], ids[emit])
+
+    def will_record(self, name: str) -> bool:
+        # whether the next value collected for `name` can be stored,
+        # useful to avoid computing values that would be thrown away
+        if name in self._ignore:
+            return False
+
+        return self._sampler.get(name, self._def).will_emit()
+
+    def skip(self, name: str):
+        # advances the sampler of `name` without a value,
+        # only valid when `will_record(name)` is False
+        assert not self.will_record(name), f'A value for <{name}> would be recorded, cannot skip it'
+        self.evaluate(name, _unused)
+
+    def metric(self, name: str) -> 'MetricHandle | IgnoredMetric':
+        if name in self._ignore:
+            return IgnoredMetric()
+
+        return MetricHandle(self, name, self._sampler.get(name, self._def))
+
+    def collect_jax(self, name: str, value: Any, when: Any = None, frame: Any = None):
         if jax is None:
             raise Exception('jax is not installed')
 
-        def _callback(metrics: dict[str, Any]):
+        # outside of traced code we can decide right away,
+        # and never copy an unneeded value off the device
+        if when is None and not isinstance(value, jax.core.Tracer) and not self.will_record(name):
+            self.skip(name)
+            return
+
+        # callbacks are ordered, so samplers see the steps in the order they ran.
+        # The host may already be frames ahead by then, so a traced `frame` pins
+        # the frame the value is stored on
+        def _callback(value: Any, frame: Any):
             assert jax is not None
-            for name, value in metrics.items():
-                if isinstance(value, jax.Array):
-                    value = value.item()
+            if isinstance(value, jax.Array):
+                value = np.asarray(value) if value.ndim > 0 else value.item()
 
+            if frame is None:
                 self.collect(name, value)
+            else:
+                self._collect_at(name, value, int(frame))
+
+        if when is None:
+            jax.debug.callback(_callback, value, frame, ordered=True)
+            return
+
+        # the value is only copied to the host on steps where `when` is true,
+        # other steps still advance the sampler, without a value
+        def _record(v: Any, f: Any):
+            assert jax is not None
+            jax.debug.callback(_callback, v, f, ordered=True)
+
+        def _skip(v: Any, f: Any):
+            assert jax is not None
+            jax.debug.callback(_skipped, ordered=True)
 
-        metrics = {name: value}
-        jax.debug.callback(_callback, metrics, ordered=False)
+        def _skipped():
+            if not self.will_record(name):
+                self.skip(name)
+
+        jax.lax.cond(when, _record, _skip, value, frame)
 
     # ---------------
     # -- Accessing --
@@ -143,18 +294,65 @@ class Collector:
     def merge(self, loc: str):
         self._writer.merge(loc)
 
+    def stats(self):
+        return self._writer.stats()
+
     # --------------
     # -- Internal --
     # --------------
     def _write(self, k: str, v: Any):
         self._keys.add(k)
-        d = Point(
-            exp_id=self.get_current_experiment_id(),
-            metric=k,
-            frame=self._frame,
-            data=v,
+        self._writer.append(k, self.get_current_experiment_id(), self._frame, v)
+
+    def _write_array(self, k: str, vs: Sequence[Any], frames: Sequence[int]):
+        if len(vs) == 0:
+            return
+
+        self._keys.add(k)
+        exp_id = self.get_current_experiment_id()
+        self._writer.extend(k, [exp_id] * len(vs), frames, vs)
+
+    def _write_vector(self, k: str, vs: np.ndarray, exp_ids: np.ndarray):
+        if len(vs) == 0:
+            return
+
+        self._keys.add(k)
+        self._writer.extend(k, exp_ids.tolist(), [self._frame] * len(vs), vs.tolist())
+
+    def _make_writer(self, low_watermark: int, high_watermark: int) -> Writer:
+        if self._out_of_process:
+            assert isinstance(self._backend, Sqlite)
+            return ProcessWriter(
+                backend=self._backend,
+                low_watermark=low_watermark,
+                high_watermark=high_watermark,
+                backpressure=self._backpressure,
+                adaptive=self._adaptive,
+                target_latency=self._target_latency,
+                flush_interval=self._flush_interval,
+            )
+
+        return Writer(
+            backend=self._backend,
+            low_watermark=low_watermark,
+            high_watermark=high_watermark,
+            backpressure=self._backpressure,
+            adaptive=self._adaptive,
+            target_latency=self._target_latency,
+            flush_interval=self._flush_interval,
         )
-        self._writer.write(d)
+
+    def _get_slots(self, exp_ids: np.ndarray):
+        slots = np.empty(len(exp_ids), dtype=np.int64)
+        for j, i in enumerate(exp_ids.tolist()):
+            slot = self._slots.get(i)
+            if slot is None:
+                slot = self._slots[i] = len(self._slot_ids)
+                self._slot_ids.append(i)
+
+            slots[j] = slot
+
+        return slots
 
     # -------------------
     # -- Serialization --
@@ -165,25 +363,161 @@ class Collector:
 
         data = None
         if isinstance(self._backend, Sqlite) and self._backend.is_in_memory():
-            data = self._writer.dump()
+            if self._checkpoint_path is not None:
+                path = f'{self._checkpoint_path}.{len(self._deltas)}.delta'
+                self._marks = self._writer.dump_delta(path, self._marks)
+                self._deltas.append(path)
+            else:
+                data = self._writer.dump()
 
         ignore_keys = ['_writer']
         return {
             'data': data,
+            'watermarks': (self._writer._lw, self._writer._hw),
             'sub': {
                 k: v for k, v in self.__dict__.items() if k not in ignore_keys
             },
         }
 
     def __setstate__(self, state: dict[str, Any]):
+        # defaults for fields that older checkpoints do not contain
+        self._vec = {}
+        self._slots = {}
+        self._slot_ids = []
+        self._checkpoint_path = None
+        self._deltas = []
+        self._marks = {}
+        self._backpressure = None
+        self._out_of_process = False
+        self._adaptive = False
+        self._target_latency = 0.05
+        self._flush_interval = None
+
         for k, v in state['sub'].items():
             self.__dict__[k] = v
 
-        self._writer = Writer(
-            backend=self._backend,
-            low_watermark=1_000,
-            high_watermark=100_000,
-        )
+        lw, hw = state.get('watermarks', (1_000, 100_000))
+        self._writer = self._make_writer(lw, hw)
 
         if state['data'] is not None:
             self._writer.load(state['data'])
+
+        # replay the base snapshot followed by each delta, in order
+        if self._checkpoint_path is not None and isinstance(self._backend, Sqlite):
+            for path in self._deltas:
+                self._writer.load_delta(path)
+
+
+def _unused() -> Any:
+    raise Exception('Value was evaluated for a skipped metric')
+
+
+def _expand_batches(vs: np.ndarray, exp_ids: np.ndarray):
+    if vs.dtype != object or not any(isinstance(v, Batch) for v in vs):
+        return vs, exp_ids
+
+    out: list[Any] = []
+    ids: list[Any] = []
+    for v, i in zip(vs, exp_ids, strict=True):
+        batch = v if isinstance(v, Batch) else [v]
+        out.extend(batch)
+        ids.extend([i] * len(batch))
+
+    return _object_array(out), np.array(ids, dtype=object)
+
+
+def _object_array(vs: list[Any]):
+    arr = np.empty(len(vs), dtype=object)
+    arr[:] = vs
+    return arr
+
+
+# --------------------------
+# -- Pre-resolved metrics --
+# --------------------------
+class MetricHandle:
+    __slots__ = ('_c', '_name', '_sampler', '_writer', '_seen')
+
+    def __init__(self, collector: Collector, name: str, sampler: Sampler | Ignore):
+        self._c = collector
+        self._name = name
+        self._sampler = sampler
+        self._writer = collector._writer
+        self._seen = False
+
+    def __call__(self, value: Any):
+        c = self._c
+        if c._frame == -1:
+            c._frame = 0
+
+        v = self._sampler.next(value)
+        if v is None:
+            return
+
+        if not self._seen:
+            self._mark_seen()
+
+        assert c._exp_id is not None
+        self._writer.append(self._name, c._exp_id, c._frame, v)
+
+    def evaluate(self, lmbda: Callable[[], Any]):
+        c = self._c
+        if c._frame == -1:
+            c._frame = 0
+
+        v = self._sampler.next_eval(lmbda)
+        if v is None:
+            return
+
+        if not self._seen:
+            self._mark_seen()
+
+        assert c._exp_id is not None
+        self._writer.append(self._name, c._exp_id, c._frame, v)
+
+    def will_record(self):
+        return self._sampler.will_emit()
+
+    def _mark_seen(self):
+        self._c._keys.add(self._name)
+        self._seen = True
+
+
+# wraps a framed sampler so that it fits everywhere a regular sampler does.
+# Values it emits are written straight away on the frames they were
+# collected on, so nothing is ever returned to the caller.
+class _FramedMetric(Sampler):
+    def __init__(self, collector: Collector, name: str, sampler: Any):
+        self._c = collector
+        self._name = name
+        self._sampler = sampler
+
+    def next(self, v: Any):
+        self._write(self._sampler.next_at(v, self._c._frame))
+
+    def next_eval(self, c: Callable[[], Any]):
+        self._write(self._sampler.next_eval_at(c, self._c._frame))
+
+    def end(self):
+        self._write(self._sampler.end_at())
+
+    def will_emit(self):
+        return self._sampler.will_emit()
+
+    def next_many_at(self, v: np.ndarray, frames: np.ndarray):
+        self._write(self._sampler.next_many_at(v, frames))
+
+    def vectorize(self):
+        return self._sampler.vectorize()
+
+    def _write(self, out: Framed | None):
+        if out is not None:
+            self._c._write_array(self._name, out.values, out.frames)
+
+
+class IgnoredMetric:
+    __slots__ = ()
+
+    def __call__(self, value: Any): return None
+    def evaluate(self, lmbda: Callable[[], Any]): return None
+    def will_record(self): return False
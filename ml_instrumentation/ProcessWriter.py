@@ -0,0 +1,372 @@
+import logging
+import multiprocessing as mp
+import queue
+import time
+import numpy as np
+from array import array
+from collections import defaultdict
+from multiprocessing import shared_memory
+from typing import Any
+
+from ml_instrumentation.Backpressure import Backpressure
+from ml_instrumentation.Writer import Writer
+from ml_instrumentation.backends.base import Columns
+from ml_instrumentation.backends.sqlite import Sqlite
+
+logger = logging.getLogger('ml-instrumentation')
+
+# fixed-size records stored in the shared-memory ring
+RECORD = np.dtype([
+    ('metric', np.int32),
+    ('kind', np.int32),
+    ('frame', np.int64),
+    ('id', np.int64),
+    ('ival', np.int64),
+    ('fval', np.float64),
+])
+
+KIND_FLOAT = 0
+KIND_INT = 1
+
+# the head and tail of the ring, and the last batch the child has written,
+# live in front of the records
+HEADER = 64
+
+
+# A Writer that hands buffered numeric data to a child process through a
+# shared-memory ring buffer, so converting rows and calling into sqlite
+# no longer competes with the training loop for the GIL.
+#
+# While the child is alive it is the only process writing to the file.
+# Metrics whose buffered frames, ids, and values are all ints or floats go
+# through the ring; anything else (e.g. strings) is sent over the control
+# queue and kept until the child reports it as written. If the child process
+# dies, whatever it did not write is written in-process and the writer keeps
+# working as a regular Writer.
+class ProcessWriter(Writer):
+    def __init__(
+        self,
+        backend: Sqlite,
+        low_watermark: int = 64,
+        high_watermark: int = 256,
+        backpressure: Backpressure | None = None,
+        adaptive: bool = False,
+        target_latency: float = 0.05,
+        flush_interval: float | None = None,
+        capacity: int = 1_000_000,
+    ):
+        assert isinstance(backend, Sqlite) and not backend.is_in_memory(), 'ProcessWriter requires a disk-backed Sqlite backend'
+        super().__init__(backend, low_watermark, high_watermark, backpressure, adaptive, target_latency, flush_interval)
+
+        self._capacity = capacity
+        self._metric_ids: dict[str, int] = {}
+        self._metric_names: dict[int, str] = {}
+        self._token = 0
+
+        # batches sent over the control queue that the child has not written yet
+        self._batch = 0
+        self._pending: list[tuple[int, dict[str, Columns]]] = []
+
+        ctx = mp.get_context('spawn')
+        self._shm = shared_memory.SharedMemory(create=True, size=HEADER + capacity * RECORD.itemsize)
+        self._header, self._ring = _views(self._shm, capacity)
+        self._header[:] = 0
+
+        self._control = ctx.Queue()
+        self._response = ctx.Queue()
+        self._proc: Any = ctx.Process(
+            target=_drain,
+            args=(self._shm.name, capacity, backend, self._control, self._response),
+            daemon=True,
+        )
+        self._proc.start()
+
+    # ------------
+    # -- IO API --
+    # ------------
+    def _sync(self):
+        if self._proc is not None and not self._proc.is_alive():
+            self._fallback()
+
+        if self._proc is None:
+            return super()._sync()
+
+        numeric: dict[str, Columns] = {}
+        rest: dict[str, Columns] = defaultdict(Columns)
+        for m, cols in self._buffer.items():
+            if _is_numeric(cols):
+                numeric[m] = cols
+            else:
+                rest[m] = cols
+
+        start = time.perf_counter()
+        recs = self._to_records(numeric)
+
+        # the child may die part way through, keep whatever did not fit
+        done = self._push(recs)
+        if self._proc is None:
+            for m, cols in _to_columns(recs[done:], self._metric_names).items():
+                rest[m] = cols
+
+            self._buffer = rest
+            self._i = sum(len(c) for c in rest.values())
+            return super()._sync()
+
+        if rest:
+            self._send(rest)
+
+        for sd in (numeric, rest):
+            for m, cols in sd.items():
+                self._buffered[m] += len(cols)
+
+        if numeric or rest:
+            self._record_flush([numeric, rest], time.perf_counter() - start)
+
+        self._buffer = defaultdict(Columns)
+        self._i = 0
+
+    def sync_now(self):
+        super().sync_now()
+        if self._proc is not None:
+            self._wait_drained()
+            self._backend.init_db()
+
+    def read_metric(self, metric: str, exp_id: int | str | None = None):
+        # the child commits on its own connection, so there is no consistent
+        # high-water mark to merge buffered points against. Drain first instead.
+        self.sync_now()
+        return self._backend.read_metric(metric, exp_id)
+
+    def load(self, data: Any):
+        # the parent takes the write connection back from the child first
+        self.sync_now()
+        self._stop()
+        super().load(data)
+
+    def load_delta(self, path: str):
+        self.sync_now()
+        self._stop()
+        super().load_delta(path)
+
+    def close(self):
+        self.sync_now()
+        self._stop()
+        super().close()
+
+    # --------------
+    # -- Internal --
+    # --------------
+    def _to_records(self, data: dict[str, Columns]):
+        recs = np.empty(sum(len(c) for c in data.values()), dtype=RECORD)
+
+        start = 0
+        for m, cols in data.items():
+            mid = self._metric_ids.get(m)
+            if mid is None:
+                mid = self._metric_ids[m] = len(self._metric_ids)
+                self._metric_names[mid] = m
+                self._control.put(('metric', mid, m))
+
+            assert isinstance(cols.values, array)
+            sub = recs[start:start + len(cols)]
+            sub['metric'] = mid
+            sub['frame'] = np.frombuffer(cols.frames, dtype=np.int64)
+            assert isinstance(cols.ids, array)
+            sub['id'] = np.frombuffer(cols.ids, dtype=np.int64)
+            if cols.values.typecode == 'd':
+                sub['kind'] = KIND_FLOAT
+                sub['fval'] = np.frombuffer(cols.values, dtype=np.float64)
+            else:
+                sub['kind'] = KIND_INT
+                sub['ival'] = np.frombuffer(cols.values, dtype=np.int64)
+
+            start += len(cols)
+
+        return recs
+
+    def _push(self, recs: np.ndarray) -> int:
+        n = len(recs)
+        start = 0
+        while start < n:
+            head, tail = int(self._header[0]), int(self._header[1])
+            space = self._capacity - (head - tail)
+            if space == 0:
+                if self._proc is None or not self._proc.is_alive():
+                    self._fallback()
+                    return start
+
+                time.sleep(0.001)
+                continue
+
+            # copy up to the end of the ring, wrapping on the next iteration
+            i = head % self._capacity
+            k = min(space, n - start, self._capacity - i)
+            self._ring[i:i + k] = recs[start:start + k]
+
+            # publish the records only once they are fully written
+            self._header[0] = head + k
+            start += k
+
+        return start
+
+    def _send(self, data: dict[str, Columns]):
+        acked = int(self._header[2])
+        self._pending = [p for p in self._pending if p[0] > acked]
+
+        self._batch += 1
+        self._pending.append((self._batch, data))
+        self._control.put(('rows', self._batch, data))
+
+    def _wait_drained(self):
+        self._token += 1
+        self._control.put(('flush', self._token))
+
+        while True:
+            try:
+                if self._response.get(timeout=0.1) == self._token:
+                    self._pending = []
+                    return
+            except queue.Empty:
+                if not self._proc.is_alive():
+                    self._fallback()
+                    return
+
+    def _fallback(self):
+        logger.warning('Writer process exited unexpectedly, falling back to in-process writes.')
+
+        # the child may have added tables and strings since the parent last looked
+        self._backend.init_db()
+
+        # anything between tail and head was never committed by the child
+        head, tail, acked = self._header.tolist()
+        recs = self._ring[np.arange(tail, head) % self._capacity]
+        self._backend.write_many(_to_columns(recs, self._metric_names))
+
+        for batch, data in self._pending:
+            if batch > acked:
+                self._backend.write_many(data)
+
+        self._pending = []
+
+        self._proc = None
+        self._release()
+
+    def _stop(self):
+        if self._proc is None:
+            return
+
+        self._control.put(('close',))
+        self._proc.join()
+        self._proc = None
+        self._release()
+
+    def _release(self):
+        del self._header, self._ring
+        self._shm.close()
+        self._shm.unlink()
+
+
+# -------------------
+# -- Child process --
+# -------------------
+def _drain(shm_name: str, capacity: int, backend: Sqlite, control: Any, response: Any):
+    shm = shared_memory.SharedMemory(name=shm_name)
+
+    # the views into shared memory must be released before closing it,
+    # which happens as soon as the consumer goes out of scope
+    _Consumer(shm, capacity, backend, control, response).run()
+    backend.close()
+    shm.close()
+
+
+class _Consumer:
+    def __init__(self, shm: shared_memory.SharedMemory, capacity: int, backend: Sqlite, control: Any, response: Any):
+        self._header, self._ring = _views(shm, capacity)
+        self._capacity = capacity
+        self._backend = backend
+        self._control = control
+        self._response = response
+        self._names: dict[int, str] = {}
+        self._closing = False
+
+    def run(self):
+        parent = mp.parent_process()
+        while not self._closing:
+            try:
+                self._handle(self._control.get(timeout=0.01))
+            except queue.Empty:
+                if parent is not None and not parent.is_alive():
+                    break
+
+            self._consume()
+
+        self._consume()
+
+    def _consume(self):
+        head, tail = int(self._header[0]), int(self._header[1])
+        if head == tail:
+            return
+
+        recs = self._ring[np.arange(tail, head) % self._capacity]
+
+        # metric names are sent over the control queue and may still be in flight
+        for mid in np.unique(recs['metric']).tolist():
+            while mid not in self._names:
+                self._handle(self._control.get())
+
+        self._backend.write_many(_to_columns(recs, self._names))
+        self._header[1] = head
+
+    def _handle(self, msg: tuple[Any, ...]):
+        if msg[0] == 'metric':
+            self._names[msg[1]] = msg[2]
+        elif msg[0] == 'rows':
+            # rows pushed to the ring before this batch are written first
+            self._consume()
+            self._backend.write_many(msg[2])
+            self._header[2] = msg[1]
+        elif msg[0] == 'flush':
+            self._consume()
+            self._response.put(msg[1])
+        elif msg[0] == 'close':
+            self._closing = True
+
+
+# ---------------
+# -- Utilities --
+# ---------------
+def _views(shm: shared_memory.SharedMemory, capacity: int):
+    header = np.ndarray((3,), dtype=np.int64, buffer=shm.buf)
+    ring = np.ndarray((capacity,), dtype=RECORD, buffer=shm.buf, offset=HEADER)
+    return header, ring
+
+
+def _is_numeric(cols: Columns):
+    return (
+        isinstance(cols.ids, array) and cols.ids.typecode == 'q'
+        and isinstance(cols.values, array)
+    )
+
+
+def _to_columns(recs: np.ndarray, names: dict[int, str]) -> dict[str, Columns]:
+    out: dict[str, Columns] = {}
+    for mid in np.unique(recs['metric']).tolist():
+        sub = recs[recs['metric'] == mid]
+        kind = sub['kind']
+
+        cols = Columns()
+        cols.frames = sub['frame'].tolist()
+        cols.ids = sub['id'].tolist()
+        if (kind == KIND_FLOAT).all():
+            cols.values = sub['fval'].tolist()
+        elif (kind == KIND_INT).all():
+            cols.values = sub['ival'].tolist()
+        else:
+            cols.values = [
+                i if k == KIND_INT else f
+                for k, i, f in zip(kind.tolist(), sub['ival'].tolist(), sub['fval'].tolist(), strict=True)
+            ]
+
+        out[names[mid]] = cols
+
+    return out
@@ -1,16 +1,67 @@
+import copy
+import math
+import random
 import numpy as np
-from collections.abc import Callable
+from collections.abc import Callable, Sequence
+from typing import Any, NamedTuple
+
+from ml_instrumentation.sketch import DDSketch
 
 class Sampler:
-    def next(self, v: float) -> float | None: ...
-    def next_eval(self, c: Callable[[], float]) -> float | None: ...
-    def end(self) -> float | None: ...
+    # framed samplers choose which values to keep only after the frames they
+    # were collected on have passed, see `FramedSampler`
+    framed: bool = False
+
+    # usually a float, but samplers may emit any storable value, e.g. a dict of
+    # statistics, a `Batch` of values, or the `Framed` values of a framed sampler
+    def next(self, v: float) -> Any | None: ...
+    def next_eval(self, c: Callable[[], float]) -> Any | None: ...
+    def end(self) -> Any | None: ...
+
+    # whether the value given to the next `next`/`next_eval` call can be stored.
+    # When this is False the next value is never used, so `next_eval` will not
+    # evaluate its callable. Samplers that cannot know in advance return True.
+    def will_emit(self) -> bool:
+        return True
+
+    # processes a whole array of consecutive values at once, returning the
+    # emitted values and the offsets of the inputs that triggered them.
+    # Must give exactly the same result as calling `next` on each value.
+    def next_many(self, v: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        out: list[Any] = []
+        offsets: list[int] = []
+        for i, x in enumerate(v):
+            y = self.next(x)
+            if y is None:
+                continue
+
+            out.append(y)
+            offsets.append(i)
+
+        return _as_array(out), np.asarray(offsets, dtype=np.int64)
+
+    # builds a fresh sampler holding independent state for many
+    # experiments at once. By default, keeps one copy of this sampler
+    # per experiment; subclasses override this with array-backed state.
+    def vectorize(self) -> 'VectorSampler':
+        return PerSlot(self)
+
+# returned from `end` by samplers that emit several values at once,
+# each value is stored as its own row on the final frame
+class Batch(list): ...
+
+# returned by framed samplers, each value is stored on the frame it was collected on
+class Framed(NamedTuple):
+    frames: list[int]
+    values: list[Any]
 
 class Ignore:
     def __init__(self): ...
     def next(self, v: float): return None
     def next_eval(self, v: Callable[[], float]): return None
     def end(self): return None
+    def will_emit(self): return False
+    def next_many(self, v: np.ndarray): return v[:0], np.empty(0, dtype=np.int64)
 
 # by definition, this must be a stateless object
 # safe to instantiate a singleton instance for default parameters
@@ -26,6 +77,12 @@ class Identity(Sampler):
     def end(self):
         return None
 
+    def next_many(self, v: np.ndarray):
+        return v, np.arange(len(v), dtype=np.int64)
+
+    def vectorize(self):
+        return VectorIdentity()
+
 # by definition, this must be a stateless object
 # safe to instantiate a singleton instance for default parameters
 identity = Identity()
@@ -40,11 +97,15 @@ class Window(Sampler):
         self._size = size
 
     def next(self, v: float):
+        # array-valued metrics are averaged element-wise
+        if self._clock == 0 and isinstance(v, np.ndarray):
+            self._reshape(v.shape)
+
         self._b[self._clock] = v
         self._clock += 1
 
         if self._clock == self._size:
-            m = self._b.mean()
+            m = self._b.mean() if self._b.ndim == 1 else self._b.mean(axis=0)
             self._clock = 0
             return m
 
@@ -54,11 +115,57 @@ class Window(Sampler):
     def end(self):
         out = None
         if self._clock > 0:
-            out = self._b[:self._clock].mean()
+            b = self._b[:self._clock]
+            out = b.mean() if b.ndim == 1 else b.mean(axis=0)
 
         self._clock = 0
         return out
 
+    def next_many(self, v: np.ndarray):
+        v = np.asarray(v, dtype=np.float64)
+        if v.ndim > 1:
+            return super().next_many(v)
+
+        size = self._size
+
+        # top up a partially filled window before handling whole windows
+        head = 0
+        first = None
+        if self._clock > 0:
+            head = min(size - self._clock, len(v))
+            self._b[self._clock:self._clock + head] = v[:head]
+            self._clock += head
+
+            if self._clock < size:
+                return np.empty(0), np.empty(0, dtype=np.int64)
+
+            first = self._b.mean()
+            self._clock = 0
+
+        # each full window is a contiguous row, so the row means are
+        # summed in the same order as the scalar path
+        rest = v[head:]
+        k = len(rest) // size
+        out = rest[:k * size].reshape(k, size).mean(axis=1)
+        offsets = head + np.arange(1, k + 1, dtype=np.int64) * size - 1
+
+        tail = rest[k * size:]
+        self._b[:len(tail)] = tail
+        self._clock = len(tail)
+
+        if first is not None:
+            out = np.concatenate(([first], out))
+            offsets = np.concatenate(([head - 1], offsets))
+
+        return out, offsets
+
+    def vectorize(self):
+        return VectorWindow(self._size)
+
+    def _reshape(self, shape: tuple[int, ...]):
+        if self._b.shape[1:] != shape:
+            self._b = np.empty((self._size, *shape), dtype=np.float64)
+
 class Subsample(Sampler):
     def __init__(self, freq: int):
         self._clock = 0
@@ -82,6 +189,125 @@ class Subsample(Sampler):
         self._clock = 0
         return None
 
+    def will_emit(self):
+        return self._clock % self._freq == 0
+
+    def next_many(self, v: np.ndarray):
+        offsets = np.arange((-self._clock) % self._freq, len(v), self._freq, dtype=np.int64)
+        self._clock += len(v)
+        return v[offsets], offsets
+
+    def vectorize(self):
+        return VectorSubsample(self._freq)
+
+class LogSubsample(Sampler):
+    # keeps every value until the gap between kept values would grow
+    # past `ratio`, then keeps geometrically spaced values. The number of
+    # stored values grows with the log of the run length.
+    def __init__(self, ratio: float = 1.01):
+        assert ratio > 1
+        self._ratio = ratio
+        self._clock = 0
+        self._next = 0
+
+    def next(self, v: float):
+        if self._tick():
+            return v
+
+    def next_eval(self, c: Callable[[], float]):
+        if self._tick():
+            return c()
+
+    def end(self):
+        self._clock = 0
+        self._next = 0
+        return None
+
+    def will_emit(self):
+        return self._clock == self._next
+
+    def next_many(self, v: np.ndarray):
+        # only the (few) kept positions are visited
+        start = self._clock
+        offsets: list[int] = []
+        while self._next < start + len(v):
+            offsets.append(self._next - start)
+            self._advance()
+
+        self._clock += len(v)
+        idx = np.asarray(offsets, dtype=np.int64)
+        return v[idx], idx
+
+    def _tick(self):
+        tick = self._clock == self._next
+        self._clock += 1
+
+        if tick:
+            self._advance()
+
+        return tick
+
+    def _advance(self):
+        self._next = max(self._next + 1, math.ceil(self._next * self._ratio))
+
+class Reservoir(Sampler):
+    # keeps a uniform random sample of `size` values out of everything
+    # collected (Algorithm L), and only emits them at `end`. Each value is
+    # stored as {'index': i, 'value': v} where `i` counts the values seen.
+    def __init__(self, size: int, seed: int | None = None):
+        self._size = size
+        self._rng = random.Random(seed)
+        self._reset()
+
+    def next(self, v: float):
+        n = self._n
+        self._n += 1
+
+        if n < self._size:
+            self._items.append((n, v))
+            if self._n == self._size:
+                self._skip()
+
+        elif n == self._skip_to:
+            self._items[self._rng.randrange(self._size)] = (n, v)
+            self._w *= math.exp(math.log(self._rng.random()) / self._size)
+            self._skip()
+
+        return None
+
+    def next_eval(self, c: Callable[[], float]):
+        # whether a value is kept is known before it is needed
+        if self.will_emit():
+            return self.next(c())
+
+        self._n += 1
+        return None
+
+    def will_emit(self):
+        return self._n < self._size or self._n == self._skip_to
+
+    def end(self):
+        items = sorted(self._items)
+        self._reset()
+
+        if not items:
+            return None
+
+        return Batch({'index': i, 'value': v} for i, v in items)
+
+    def _skip(self):
+        if self._n == self._size:
+            self._w = math.exp(math.log(self._rng.random()) / self._size)
+
+        gap = math.floor(math.log(self._rng.random()) / math.log(1 - self._w))
+        self._skip_to = self._n + gap
+
+    def _reset(self):
+        self._items: list[tuple[int, Any]] = []
+        self._n = 0
+        self._w = 1.
+        self._skip_to = -1
+
 class MovingAverage(Sampler):
     def __init__(self, decay: float):
         self._decay = decay
@@ -97,3 +323,382 @@ class MovingAverage(Sampler):
 
     def end(self):
         return None
+
+    def next_many(self, v: np.ndarray):
+        # a closed-form filter (powers of the decay) rounds differently from
+        # the recurrence, so run the recurrence on plain floats instead
+        d = self._decay
+        z = self.z
+        out: list[float] = []
+        for x in np.asarray(v).tolist():
+            z = d * z + (1. - d) * x
+            out.append(z)
+
+        self.z = z
+        return np.asarray(out, dtype=np.float64), np.arange(len(out), dtype=np.int64)
+
+    def vectorize(self):
+        return VectorMovingAverage(self._decay)
+
+class Sketch(Sampler):
+    # emits a serialized DDSketch of each window of `size` values, which can be
+    # merged across windows or runs when reading, see `reader.read_quantiles`
+    def __init__(self, size: int, alpha: float = 0.01, max_bins: int = 2048):
+        self._size = size
+        self._alpha = alpha
+        self._max_bins = max_bins
+
+        self._sketch = DDSketch(alpha, max_bins)
+        self._clock = 0
+
+    def next(self, v: float):
+        self._sketch.add(v)
+        self._clock += 1
+
+        if self._clock == self._size:
+            return self._emit()
+
+    def next_eval(self, c: Callable[[], float]):
+        return self.next(c())
+
+    def end(self):
+        if self._clock > 0:
+            return self._emit()
+
+    def _emit(self) -> Any:
+        out = self._sketch.to_bytes()
+        self._sketch = DDSketch(self._alpha, self._max_bins)
+        self._clock = 0
+        return out
+
+class Quantile(Sketch):
+    # emits the `q`-th quantile of each window of `size` values,
+    # within a relative error of `alpha`
+    def __init__(self, size: int, q: float, alpha: float = 0.01, max_bins: int = 2048):
+        super().__init__(size, alpha, max_bins)
+        self._q = q
+
+    def _emit(self):
+        out = self._sketch.quantile(self._q)
+        self._sketch = DDSketch(self._alpha, self._max_bins)
+        self._clock = 0
+        return out
+
+SUMMARY_STATS = ('count', 'mean', 'var', 'std', 'min', 'max')
+
+class Summary(Sampler):
+    # emits several statistics of each window of `size` values as a single
+    # multi-column measurement, computed in one pass with Welford's method
+    def __init__(self, size: int, stats: Sequence[str] = ('mean', 'std', 'min', 'max')):
+        assert all(s in SUMMARY_STATS for s in stats), f'Unknown statistic, expected one of {SUMMARY_STATS}'
+        self._size = size
+        self._stats = tuple(stats)
+        self._reset()
+
+    def next(self, v: float):
+        self._n += 1
+        d = v - self._mean
+        self._mean += d / self._n
+        self._m2 += d * (v - self._mean)
+
+        if v < self._min: self._min = v
+        if v > self._max: self._max = v
+
+        if self._n == self._size:
+            return self._emit()
+
+    def next_eval(self, c: Callable[[], float]):
+        return self.next(c())
+
+    def end(self):
+        if self._n > 0:
+            return self._emit()
+
+    def _emit(self):
+        var = self._m2 / self._n
+        values = {
+            'count': self._n,
+            'mean': self._mean,
+            'var': var,
+            'std': var ** 0.5,
+            'min': self._min,
+            'max': self._max,
+        }
+
+        self._reset()
+        return {s: values[s] for s in self._stats}
+
+    def _reset(self):
+        self._n = 0
+        self._mean = 0.
+        self._m2 = 0.
+        self._min = np.inf
+        self._max = -np.inf
+
+class FramedSampler(Sampler):
+    # buffers windows of `size` values along with their frames, and emits a
+    # subset of each window on the original frames. The collector passes the
+    # frame of every value through `next_at`; `next` numbers the values itself.
+    framed = True
+
+    def __init__(self, size: int):
+        self._size = size
+        self._n = 0
+        self._reset()
+
+    def next_at(self, v: float, frame: int) -> Framed | None:
+        self._frames.append(frame)
+        self._values.append(v)
+
+        if len(self._values) == self._size:
+            return self._emit()
+
+    def next_eval_at(self, c: Callable[[], float], frame: int) -> Framed | None:
+        return self.next_at(c(), frame)
+
+    def end_at(self) -> Framed | None:
+        if self._values:
+            return self._emit()
+
+    def next_many_at(self, v: np.ndarray, frames: np.ndarray) -> Framed | None:
+        out = Framed([], [])
+        for x, f in zip(v.tolist(), frames.tolist(), strict=True):
+            y = self.next_at(x, f)
+            if y is not None:
+                out.frames.extend(y.frames)
+                out.values.extend(y.values)
+
+        return out if out.values else None
+
+    def next(self, v: float):
+        frame = self._n
+        self._n += 1
+        return self.next_at(v, frame)
+
+    def next_eval(self, c: Callable[[], float]):
+        return self.next(c())
+
+    def end(self):
+        self._n = 0
+        return self.end_at()
+
+    def next_many(self, v: np.ndarray):
+        raise TypeError('Framed samplers need the frame of each value, use `next_many_at`')
+
+    def vectorize(self):
+        raise TypeError('Framed samplers cannot be used with `collect_vector`')
+
+    def _select(self, x: np.ndarray, y: np.ndarray) -> np.ndarray: ...
+
+    def _emit(self):
+        x = np.asarray(self._frames, dtype=np.float64)
+        y = np.asarray(self._values, dtype=np.float64)
+        keep = self._select(x, y).tolist()
+
+        out = Framed([self._frames[i] for i in keep], [self._values[i] for i in keep])
+        self._reset()
+        return out
+
+    def _reset(self):
+        self._frames: list[int] = []
+        self._values: list[Any] = []
+
+class LTTB(FramedSampler):
+    # Largest-Triangle-Three-Buckets: keeps `points` values out of each window
+    # of `size`, always including the first and last. Every other kept value is
+    # the one forming the largest triangle with its kept neighbours, which
+    # preserves the visual shape of a curve, including its spikes and dips.
+    def __init__(self, size: int, points: int):
+        assert 3 <= points <= size
+        super().__init__(size)
+        self._points = points
+
+    def _select(self, x: np.ndarray, y: np.ndarray):
+        n = len(y)
+        if n <= self._points:
+            return np.arange(n)
+
+        # the points between the first and last are split into equal buckets
+        edges = np.linspace(1, n - 1, self._points - 1).astype(np.int64)
+        keep = np.empty(self._points, dtype=np.int64)
+        keep[0] = 0
+        keep[-1] = n - 1
+
+        a = 0
+        for b in range(self._points - 2):
+            lo, hi = edges[b], edges[b + 1]
+
+            # the third corner is the average of the next bucket
+            if b + 2 < len(edges):
+                cx = x[hi:edges[b + 2]].mean()
+                cy = y[hi:edges[b + 2]].mean()
+            else:
+                cx, cy = x[-1], y[-1]
+
+            area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+            a = lo + int(np.argmax(area))
+            keep[b + 1] = a
+
+        return keep
+
+class MinMax(FramedSampler):
+    # splits each window of `size` values into `buckets` and keeps the
+    # smallest and largest value of each, so at most `2 * buckets` values
+    # are stored per window and no extreme value is ever lost
+    def __init__(self, size: int, buckets: int):
+        assert 1 <= buckets <= size
+        super().__init__(size)
+        self._buckets = buckets
+
+    def _select(self, x: np.ndarray, y: np.ndarray):
+        n = len(y)
+        edges = np.linspace(0, n, min(self._buckets, n) + 1).astype(np.int64)
+
+        keep: list[int] = []
+        for lo, hi in zip(edges[:-1].tolist(), edges[1:].tolist(), strict=True):
+            seg = y[lo:hi]
+            keep.append(lo + int(np.argmin(seg)))
+            keep.append(lo + int(np.argmax(seg)))
+
+        return np.unique(keep)
+
+# ---------------------
+# -- Vector Samplers --
+# ---------------------
+# Vector samplers hold the state of one sampler for many experiments.
+# Each experiment is assigned an integer slot, and every call receives
+# the slots that the values belong to. Calls return the emitted values
+# alongside a boolean mask over the inputs marking which emitted.
+class VectorSampler:
+    _n: int = 0
+
+    def next(self, v: np.ndarray, slots: np.ndarray) -> tuple[np.ndarray, np.ndarray]: ...
+    def end(self) -> tuple[np.ndarray, np.ndarray]: ...
+    def _grow(self, n: int) -> None: ...
+
+    def ensure(self, n: int):
+        if n > self._n:
+            self._grow(n)
+            self._n = n
+
+class VectorIdentity(VectorSampler):
+    def next(self, v: np.ndarray, slots: np.ndarray):
+        return v, np.ones(len(v), dtype=np.bool_)
+
+    def end(self):
+        return np.empty(self._n), np.zeros(self._n, dtype=np.bool_)
+
+    def _grow(self, n: int): ...
+
+class VectorWindow(VectorSampler):
+    def __init__(self, size: int):
+        self._size = size
+        self._b = np.empty((0, size), dtype=np.float64)
+        self._clock = np.zeros(0, dtype=np.int64)
+
+    def next(self, v: np.ndarray, slots: np.ndarray):
+        clock = self._clock[slots]
+        self._b[slots, clock] = v
+        clock += 1
+
+        emit = clock == self._size
+        out = np.full(len(v), np.nan)
+        if emit.any():
+            out[emit] = self._b[slots[emit]].mean(axis=1)
+            clock[emit] = 0
+
+        self._clock[slots] = clock
+        return out, emit
+
+    def end(self):
+        emit = self._clock > 0
+        out = np.full(self._n, np.nan)
+        for i in np.flatnonzero(emit):
+            out[i] = self._b[i, :self._clock[i]].mean()
+
+        self._clock[:] = 0
+        return out, emit
+
+    def _grow(self, n: int):
+        b = np.empty((n, self._size), dtype=np.float64)
+        b[:self._n] = self._b
+        self._b = b
+        self._clock = np.concatenate((self._clock, np.zeros(n - self._n, dtype=np.int64)))
+
+class VectorSubsample(VectorSampler):
+    def __init__(self, freq: int):
+        self._freq = freq
+        self._clock = np.zeros(0, dtype=np.int64)
+
+    def next(self, v: np.ndarray, slots: np.ndarray):
+        emit = self._clock[slots] % self._freq == 0
+        self._clock[slots] += 1
+        return v, emit
+
+    def end(self):
+        self._clock[:] = 0
+        return np.empty(self._n), np.zeros(self._n, dtype=np.bool_)
+
+    def _grow(self, n: int):
+        self._clock = np.concatenate((self._clock, np.zeros(n - self._n, dtype=np.int64)))
+
+class VectorMovingAverage(VectorSampler):
+    def __init__(self, decay: float):
+        self._decay = decay
+        self.z = np.zeros(0, dtype=np.float64)
+
+    def next(self, v: np.ndarray, slots: np.ndarray):
+        z = self._decay * self.z[slots] + (1. - self._decay) * v
+        self.z[slots] = z
+        return z, np.ones(len(v), dtype=np.bool_)
+
+    def end(self):
+        return np.empty(self._n), np.zeros(self._n, dtype=np.bool_)
+
+    def _grow(self, n: int):
+        self.z = np.concatenate((self.z, np.zeros(n - self._n, dtype=np.float64)))
+
+# fallback for samplers without an array-backed implementation,
+# keeps an independent copy of the sampler for each slot
+class PerSlot(VectorSampler):
+    def __init__(self, sampler: Sampler):
+        self._proto = sampler
+        self._subs: list[Sampler] = []
+
+    def next(self, v: np.ndarray, slots: np.ndarray):
+        out = np.empty(len(v), dtype=object)
+        emit = np.zeros(len(v), dtype=np.bool_)
+        for i, (x, slot) in enumerate(zip(v, slots, strict=True)):
+            y = self._subs[slot].next(x)
+            if y is not None:
+                out[i] = y
+                emit[i] = True
+
+        return out, emit
+
+    def end(self):
+        out = np.empty(self._n, dtype=object)
+        emit = np.zeros(self._n, dtype=np.bool_)
+        for i, sub in enumerate(self._subs):
+            y = sub.end()
+            if y is not None:
+                out[i] = y
+                emit[i] = True
+
+        return out, emit
+
+    def _grow(self, n: int):
+        self._subs += [copy.deepcopy(self._proto) for _ in range(n - self._n)]
+
+
+# ---------------
+# -- Utilities --
+# ---------------
+def _as_array(out: list[Any]) -> np.ndarray:
+    if all(type(x) in (int, float, bool) or isinstance(x, np.number) for x in out):
+        return np.asarray(out)
+
+    # keep arbitrary values (strings, bytes, dicts, ...) exactly as emitted
+    arr = np.empty(len(out), dtype=object)
+    arr[:] = out
+    return arr
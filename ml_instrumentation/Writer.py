@@ -1,25 +1,52 @@
+import bisect
+import os
+import threading
 import time
 import logging
+import weakref
 from collections import defaultdict
+from collections.abc import Sequence
 from typing import Any
 from concurrent.futures import ThreadPoolExecutor, Future
 
-from ml_instrumentation.backends.base import BaseBackend, Point, SqlPoint
+from ml_instrumentation.Backpressure import Backpressure, Block, load_spill
+from ml_instrumentation.backends.base import BaseBackend, Columns, Point, SqlPoint
 
 logger = logging.getLogger('ml-instrumentation')
 
+# upper edges (seconds) of the flush latency histogram buckets,
+# the last bucket catches everything slower
+LATENCY_BOUNDS = (1e-4, 1e-3, 1e-2, 1e-1, 1., 10.)
+
+# bounds on the low watermark chosen by adaptive writers
+MIN_WATERMARK = 16
+MAX_WATERMARK = 1_000_000
+
 class Writer:
     def __init__(
         self,
         backend: BaseBackend,
         low_watermark: int = 64,
         high_watermark: int = 256,
+        backpressure: Backpressure | None = None,
+        adaptive: bool = False,
+        target_latency: float = 0.05,
+        flush_interval: float | None = None,
     ):
         # ------------
         # -- config --
         # ------------
         self._lw = low_watermark
         self._hw = high_watermark
+        self._backpressure = backpressure or Block()
+
+        # when adaptive, the watermarks are retuned after every flush so that
+        # a flush of `low_watermark` points takes about `target_latency` seconds
+        self._adaptive = adaptive
+        self._target_latency = target_latency
+
+        # when set, buffered data is flushed at least every `flush_interval` seconds
+        self._flush_interval = flush_interval
 
         # ---------------
         # -- externals --
@@ -32,11 +59,47 @@ class Writer:
         # -- state --
         # -----------
         self._i = 0
-        self._buffer: dict[str, dict[int, Point]] = defaultdict(dict)
+        self._buffer: dict[str, Columns] = defaultdict(Columns)
+        self._spilled: list[str] = []
+
+        # the timer thread flushes on its own, so anything touching the
+        # buffer holds this lock. Reentrant since writes may trigger a sync
+        self._lock = threading.RLock()
+        self._stop_timer = threading.Event()
+        self._timer: threading.Thread | None = None
+        if flush_interval is not None:
+            # only a weak reference, so a writer that is never closed can still be collected
+            args = (weakref.ref(self), self._stop_timer, flush_interval)
+            self._timer = threading.Thread(target=_tick, args=args, daemon=True)
+            self._timer.start()
 
+        # read-your-writes bookkeeping. The background thread publishes the
+        # per-metric rowid high-water marks after every committed flush, so
+        # reads can take committed rows from the backend and the rest from memory
+        self._submitted = 0
+        self._committed: tuple[int, dict[str, int]] = (0, {})
+        self._in_flight: tuple[int, dict[str, Columns], list[str]] = (0, {}, [])
+        self._marks: dict[str, int] = {}
+
+        # ---------------
+        # -- telemetry --
+        # ---------------
         self._avg_write_time = -1
         self._last_write_time = -1
 
+        self._buffered = defaultdict[str, int](int)
+        self._flushed = defaultdict[str, int](int)
+        self._bytes_written = 0
+        self._latency_counts = [0] * (len(LATENCY_BOUNDS) + 1)
+        self._blocked = 0
+        self._blocked_time = 0.
+        self._skipped_syncs = 0
+
+        # throughput estimates in points per second
+        self._write_rate = -1.
+        self._produce_rate = -1.
+        self._last_sync = -1.
+
         # -------------------------
         # -- load existing state --
         # -------------------------
@@ -46,53 +109,160 @@ class Writer:
     # -- IO API --
     # ------------
     def write(self, d: Point):
-        self._buffer[d.metric][self._i] = d
-        self._i += 1
+        self.append(d.metric, d.exp_id, d.frame, d.data)
 
-        if self._i > self._hw:
-            assert self._write_future is not None
-            self._write_future.result()
-            logger.warning(f'Buffer reached high watermark. (last write: {self._last_write_time}s, avg write: {self._avg_write_time}s)')
-            self.sync()
+    def append(self, metric: str, exp_id: int | str, frame: int, data: Any):
+        with self._lock:
+            self._buffer[metric].append(exp_id, frame, data)
+            self._i += 1
+            self._check_watermark()
 
-        elif self._i > self._lw:
-            self.sync()
+    def append_frame(self, exp_id: int | str, frame: int, data: dict[str, Any]):
+        with self._lock:
+            buffer = self._buffer
+            for metric, v in data.items():
+                buffer[metric].append(exp_id, frame, v)
+
+            self._i += len(data)
+            self._check_watermark()
+
+    def extend(self, metric: str, exp_ids: Sequence[int | str], frames: Sequence[int], data: Sequence[Any]):
+        with self._lock:
+            self._buffer[metric].extend(exp_ids, frames, data)
+            self._i += len(data)
+            self._check_watermark()
 
     def sync(self):
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        # callers hold the lock
         if self._write_future is not None and not self._write_future.done():
+            self._skipped_syncs += 1
             return
 
+        self._release_spilled()
+
         data = self._buffer
-        self._buffer = defaultdict(dict)
+        for m, cols in data.items():
+            self._buffered[m] += len(cols)
+
+        if self._adaptive:
+            self._measure_producer(self._i)
+
+        # nothing is in flight, so the backend can be queried for
+        # the starting marks of metrics this writer has not flushed yet
+        new = [m for m in data if m not in self._marks and m not in self._committed[1]]
+        if new:
+            self._marks.update(self._backend.get_marks(new))
+
+        spilled = self._spilled
+        self._buffer = defaultdict(Columns)
+        self._spilled = []
         self._i = 0
-        self._write_future = self._exec.submit(self._sync_async, data)
+        self._submitted += 1
+        self._in_flight = (self._submitted, data, spilled)
+        self._write_future = self._exec.submit(self._sync_async, self._submitted, data, spilled)
 
     def sync_now(self):
-        if self._write_future is not None:
-            self._write_future.result()
+        with self._lock:
+            if self._write_future is not None:
+                self._write_future.result()
 
-        self.sync()
-        assert self._write_future is not None
-        self._write_future.result()
+            self.sync()
+            if self._write_future is not None:
+                self._write_future.result()
 
     def read_metric(self, metric: str, exp_id: int | str | None = None) -> list[SqlPoint]:
-        self.sync_now()
-        return self._backend.read_metric(metric, exp_id)
+        with self._lock:
+            return self._read_metric(metric, exp_id)
+
+    def _read_metric(self, metric: str, exp_id: int | str | None) -> list[SqlPoint]:
+        # reads never wait on the background writer. Rows come from the backend
+        # up to the last committed flush, then from the in-flight and current buffers
+        fut = self._write_future
+        if fut is None or fut.done():
+            # metrics that were never flushed only live in the buffer
+            if metric in self._buffer and metric not in self._backend.get_tables():
+                rows = []
+            else:
+                rows = self._backend.read_metric(metric, exp_id)
+
+            pending = []
+        else:
+            committed, marks = self._committed
+            until = marks.get(metric, self._marks.get(metric))
+            rows = [] if until == 0 else self._backend.read_metric(metric, exp_id, until)
+
+            pending = []
+            idx, data, spilled = self._in_flight
+            if idx > committed:
+                pending = [load_spill(path).get(metric) for path in spilled]
+                pending.append(data.get(metric))
 
-    def dump(self) -> str:
+        pending.extend(load_spill(path).get(metric) for path in self._spilled)
+        pending.append(self._buffer.get(metric))
+
+        for cols in pending:
+            if cols is None:
+                continue
+
+            rows.extend(
+                SqlPoint(frame, i, v) for frame, i, v in cols.rows()
+                if exp_id is None or i == exp_id
+            )
+
+        return rows
+
+    def dump(self) -> str | bytes:
         self.sync_now()
         return self._backend.dump()
 
     def load(self, data: Any):
         self._backend.load(data)
+        self._reset_marks()
+
+    def dump_delta(self, path: str, marks: dict[str, int]) -> dict[str, int]:
+        self.sync_now()
+        return self._backend.dump_delta(path, marks)
+
+    def load_delta(self, path: str):
+        self._backend.load_delta(path)
+        self._reset_marks()
 
     def close(self):
+        self._stop_timer.set()
+        if self._timer is not None:
+            self._timer.join()
+
         self.sync_now()
+        self._release_spilled()
         self._backend.close()
 
     # -----------------
     # -- Utility API --
     # -----------------
+    def stats(self) -> dict[str, Any]:
+        return {
+            'buffered': dict(self._buffered),
+            'flushed': dict(self._flushed),
+            'pending': self._i,
+            'bytes_written': self._bytes_written,
+            'flush_latency': {
+                'bounds': list(LATENCY_BOUNDS),
+                'counts': list(self._latency_counts),
+            },
+            'last_write_time': self._last_write_time,
+            'avg_write_time': self._avg_write_time,
+            'blocked': self._blocked,
+            'blocked_time': self._blocked_time,
+            'skipped_syncs': self._skipped_syncs,
+            'low_watermark': self._lw,
+            'high_watermark': self._hw,
+            'backpressure': self._backpressure.stats(),
+        }
+
     def metrics(self):
         buffered_keys = set(self._buffer.keys())
         return buffered_keys | self._backend.get_tables()
@@ -105,13 +275,121 @@ class Writer:
     # -------------------
     # -- Backend logic --
     # -------------------
-    def _sync_async(self, d: dict[str, dict[int, Point]]):
+    def _check_watermark(self):
+        if self._i > self._hw:
+            if self._write_future is not None and not self._write_future.done():
+                start = time.perf_counter()
+                self._backpressure.relieve(self)
+                self._blocked += 1
+                self._blocked_time += time.perf_counter() - start
+
+            self.sync()
+
+        elif self._i > self._lw:
+            self.sync()
+
+    def _tick(self):
+        with self._lock:
+            # a flush still in flight already bounds the data at risk,
+            # the buffer is picked up on the next tick instead
+            fut = self._write_future
+            if self._i > 0 and (fut is None or fut.done()):
+                self.sync()
+
+    def _sync_async(self, idx: int, d: dict[str, Columns], spilled: list[str]):
         start = time.perf_counter()
+
+        # spilled buffers are older than the current one, write them first
+        written: list[dict[str, Columns]] = []
+        for path in spilled:
+            sd = load_spill(path)
+            self._backend.write_many(sd)
+            written.append(sd)
+
         self._backend.write_many(d)
+        written.append(d)
+
         elapsed = time.perf_counter() - start
 
+        # publish a new dict so readers always see a consistent (index, marks) pair
+        marks = dict(self._committed[1])
+        marks.update(self._backend.get_marks([m for sd in written for m in sd]))
+        self._committed = (idx, marks)
+
+        self._record_flush(written, elapsed)
+
+    def _release_spilled(self):
+        # spill files are kept until their flush is known to be finished,
+        # so that reads can still find points that are not committed yet
+        fut = self._write_future
+        if fut is None or fut.exception() is not None:
+            return
+
+        idx, _, spilled = self._in_flight
+        for path in spilled:
+            os.remove(path)
+
+        self._in_flight = (idx, {}, [])
+
+    def _reset_marks(self):
+        self._committed = (self._committed[0], {})
+        self._marks = {}
+
+    def _record_flush(self, written: list[dict[str, Columns]], elapsed: float):
+        for d in written:
+            for m, cols in d.items():
+                self._flushed[m] += len(cols)
+                self._bytes_written += cols.nbytes()
+
+        self._latency_counts[bisect.bisect_left(LATENCY_BOUNDS, elapsed)] += 1
+
         self._last_write_time = elapsed
         if self._avg_write_time < 0:
             self._avg_write_time = elapsed
         else:
             self._avg_write_time = 0.9 * self._avg_write_time + 0.1 * elapsed
+
+        if self._adaptive:
+            n = sum(len(cols) for d in written for cols in d.values())
+            self._adapt(n, elapsed)
+
+    # -------------------------
+    # -- Adaptive watermarks --
+    # -------------------------
+    def _measure_producer(self, n: int):
+        now = time.perf_counter()
+        if self._last_sync > 0 and now > self._last_sync:
+            self._produce_rate = _ema(self._produce_rate, n / (now - self._last_sync))
+
+        self._last_sync = now
+
+    def _adapt(self, n: int, elapsed: float):
+        if n == 0 or elapsed <= 0:
+            return
+
+        self._write_rate = _ema(self._write_rate, n / elapsed)
+
+        # flush as many points as can be written within the target latency
+        lw = int(self._write_rate * self._target_latency)
+        self._lw = min(max(lw, MIN_WATERMARK), MAX_WATERMARK)
+
+        # leave room for everything produced while a flush is in flight
+        headroom = 2 * self._produce_rate * self._avg_write_time
+        self._hw = min(max(4 * self._lw, int(headroom)), 100 * MAX_WATERMARK)
+
+
+def _tick(ref: 'weakref.ref[Writer]', stop: threading.Event, interval: float):
+    while not stop.wait(interval):
+        writer = ref()
+        if writer is None:
+            return
+
+        writer._tick()
+        del writer
+
+
+def _ema(avg: float, x: float):
+    if avg < 0:
+        return x
+
+    return 0.9 * avg + 0.1 * x
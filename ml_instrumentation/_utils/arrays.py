@@ -0,0 +1,51 @@
+import numpy as np
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+# array-valued metrics are stored as raw little-endian blobs, with the
+# dtype and shape of each metric recorded once in this table
+ARRAYS = '_arrays_'
+
+
+class ArraySpec:
+    __slots__ = ('dtype', 'shape')
+
+    def __init__(self, dtype: np.dtype, shape: tuple[int, ...]):
+        self.dtype = dtype
+        self.shape = shape
+
+    @classmethod
+    def of(cls, v: np.ndarray):
+        return cls(v.dtype.newbyteorder('<'), v.shape)
+
+    @classmethod
+    def parse(cls, dtype: str, shape: str):
+        return cls(np.dtype(dtype), tuple(int(s) for s in shape.split(',') if s))
+
+    def dumps(self):
+        return self.dtype.str, ','.join(map(str, self.shape))
+
+    def encode(self, v: Any) -> bytes:
+        arr = np.asarray(v, dtype=self.dtype)
+        if arr.shape != self.shape:
+            raise ValueError(f'Expected an array of shape {self.shape}, got {arr.shape}')
+
+        return arr.tobytes()
+
+    def decode(self, blobs: Sequence[bytes]) -> np.ndarray:
+        # one copy for the whole column instead of decoding row-by-row
+        return np.frombuffer(b''.join(blobs), dtype=self.dtype).reshape(len(blobs), *self.shape)
+
+    def decode_buffer(self, data: Any, start: int, n: int) -> np.ndarray:
+        # decodes `n` contiguous blobs starting at byte `start` of `data`
+        size = n * self.dtype.itemsize * int(np.prod(self.shape))
+        raw = np.frombuffer(data, dtype=np.uint8)[start:start + size]
+        return raw.view(self.dtype).reshape(n, *self.shape)
+
+
+def is_array(v: Any):
+    return isinstance(v, np.ndarray) and v.ndim > 0
+
+
+def read_specs(rows: Iterable[tuple[str, str, str]]) -> dict[str, ArraySpec]:
+    return {m: ArraySpec.parse(dtype, shape) for m, dtype, shape in rows}
@@ -5,7 +5,7 @@ from sqlite3 import Cursor
 
 def get_tables(cur: Cursor) -> set[str]:
     cur.row_factory = None
-    res = cur.execute("SELECT name FROM sqlite_master")
+    res = cur.execute("SELECT name FROM sqlite_master WHERE type='table'")
     return set(r[0] for r in res.fetchall())
 
 
@@ -28,6 +28,20 @@ def get_cols(cur: Cursor, name: str):
     return set(r[1] for r in rows)
 
 
+def get_col_list(cur: Cursor, name: str, schema: str = 'main') -> list[str]:
+    res = cur.execute(f'PRAGMA {schema}.table_info({quote(name)})')
+    return [r[1] for r in res.fetchall()]
+
+
+def get_col_types(cur: Cursor, name: str, schema: str = 'main') -> dict[str, str]:
+    res = cur.execute(f'PRAGMA {schema}.table_info({quote(name)})')
+    return {r[1]: r[2] for r in res.fetchall()}
+
+
+def col_defs(types: dict[str, str]):
+    return ', '.join(f'{quote(c)} {t}'.rstrip() for c, t in types.items())
+
+
 def add_cols(cur: Cursor, table: str, columns: Iterable[str]):
     columns = map(quote, columns)
     for col in columns:
@@ -43,6 +57,22 @@ def ensure_table_compatible(cur: Cursor, name: str, columns: Iterable[str]):
         add_cols(cur, name, needed_cols)
 
 
+def index_name(table: str):
+    return f'_idx_{table}'
+
+
+def get_indexed(cur: Cursor, schema: str = 'main') -> set[str]:
+    # tables that already have an (id, frame) index
+    cur.row_factory = None
+    res = cur.execute(f"SELECT name, tbl_name FROM {schema}.sqlite_master WHERE type='index'")
+    return set(t for name, t in res.fetchall() if name == index_name(t))
+
+
+def build_indexes(cur: Cursor, tables: Iterable[str], schema: str = 'main'):
+    for table in tables:
+        cur.execute(f'CREATE INDEX IF NOT EXISTS {schema}.{quote(index_name(table))} ON {quote(table)}(id, frame)')
+
+
 def maybe_quote(v: Any):
     if isinstance(v, str):
         return quote(v)
@@ -0,0 +1,70 @@
+from collections.abc import Iterable, Sequence
+from typing import Any
+
+# string metrics with many repeated values (e.g. environment names) store an
+# integer code per row, with the distinct strings of each metric kept in this table
+STRINGS = '_strings_'
+
+# declared type of dictionary-encoded measurement columns
+CODE = 'CODE'
+
+STRINGS_SCHEMA = (
+    f'CREATE TABLE IF NOT EXISTS {STRINGS}('
+    'metric TEXT NOT NULL, code INTEGER NOT NULL, value TEXT NOT NULL, '
+    'PRIMARY KEY (metric, code)) WITHOUT ROWID'
+)
+
+
+class StringDict:
+    __slots__ = ('values', 'codes')
+
+    def __init__(self, values: Iterable[str] = ()):
+        self.values = list(values)
+        self.codes = {v: i for i, v in enumerate(self.values)}
+
+    def encode(self, vs: Sequence[Any]) -> list[int | None]:
+        out: list[int | None] = []
+        for v in vs:
+            if v is None:
+                out.append(None)
+                continue
+
+            code = self.codes.get(v)
+            if code is None:
+                if not isinstance(v, str):
+                    raise ValueError(f'Expected a string, got {type(v)}')
+
+                code = self.codes[v] = len(self.values)
+                self.values.append(v)
+
+            out.append(code)
+
+        return out
+
+    def decode(self, codes: Sequence[int | None]) -> list[str | None]:
+        values = self.values
+        return [None if c is None else values[c] for c in codes]
+
+    def truncate(self, n: int):
+        # forgets strings added by a write that was rolled back
+        for v in self.values[n:]:
+            del self.codes[v]
+
+        del self.values[n:]
+
+
+def should_encode(vs: Sequence[Any]) -> bool:
+    # decided from the first flush of a metric: only strings, most of them repeats
+    strings = [v for v in vs if v is not None]
+    if not strings or not all(isinstance(v, str) for v in strings):
+        return False
+
+    return len(set(strings)) <= max(1, len(strings) // 2)
+
+
+def read_dicts(rows: Iterable[tuple[str, int, str]]) -> dict[str, StringDict]:
+    values: dict[str, list[str]] = {}
+    for m, _, v in rows:
+        values.setdefault(m, []).append(v)
+
+    return {m: StringDict(vs) for m, vs in values.items()}
@@ -1,3 +1,6 @@
+import numpy as np
+from array import array
+from collections.abc import Iterable, MutableSequence, Sequence
 from typing import Any, NamedTuple
 
 class SqlPoint(NamedTuple):
@@ -13,19 +16,144 @@ class Point(NamedTuple):
     data: Any
 
 
+# Buffered points for a single metric, stored column-wise.
+# Columns start as typed arrays when the first value is an int or float
+# and are widened to plain lists the first time a value does not fit.
+class Columns:
+    __slots__ = ('frames', 'ids', 'values')
+
+    def __init__(self):
+        self.frames = array('q')
+        self.ids: MutableSequence[Any] = []
+        self.values: MutableSequence[Any] = []
+
+    def __len__(self):
+        return len(self.frames)
+
+    def append(self, exp_id: int | str, frame: int, v: Any):
+        if not self.frames:
+            self.ids = _column_for(exp_id)
+            self.values = _column_for(v)
+
+        self.frames.append(frame)
+
+        try:
+            self.ids.append(exp_id)
+        except (TypeError, OverflowError):
+            self.ids = list(self.ids)
+            self.ids.append(exp_id)
+
+        # float arrays accept ints, but would store them as floats
+        if _coerces(self.values, v):
+            self.values = list(self.values)
+
+        try:
+            self.values.append(v)
+        except (TypeError, OverflowError):
+            self.values = list(self.values)
+            self.values.append(v)
+
+    def extend(self, exp_ids: Sequence[int | str], frames: Sequence[int], vs: Sequence[Any]):
+        if len(vs) == 0:
+            return
+
+        if not self.frames:
+            self.ids = _column_for(exp_ids[0])
+            self.values = _column_for(vs[0])
+
+        self.frames.extend(frames)
+        self.ids = _extend(self.ids, exp_ids)
+        if _coerces_any(self.values, vs):
+            self.values = list(self.values)
+
+        self.values = _extend(self.values, vs)
+
+    def rows(self):
+        return zip(self.frames, self.ids, self.values, strict=True)
+
+    # approximate size of the buffered payload, strings and bytes
+    # count their length and any other object counts as 8 bytes
+    def nbytes(self):
+        return _nbytes(self.frames) + _nbytes(self.ids) + _nbytes(self.values)
+
+    def keep(self, sl: slice):
+        self.frames = self.frames[sl]
+        self.ids = self.ids[sl]
+        self.values = self.values[sl]
+
+
+def _column_for(v: Any) -> MutableSequence[Any]:
+    t = type(v)
+    if t is int or t is bool:
+        return array('q')
+
+    if t is float:
+        return array('d')
+
+    return []
+
+
+def _coerces(col: MutableSequence[Any], v: Any):
+    return type(v) is not float and isinstance(col, array) and col.typecode == 'd'
+
+
+def _coerces_any(col: MutableSequence[Any], vs: Sequence[Any]):
+    if not isinstance(col, array) or col.typecode != 'd':
+        return False
+
+    if isinstance(vs, np.ndarray):
+        return vs.dtype.kind != 'f'
+
+    return any(type(v) is not float for v in vs)
+
+
+def _nbytes(col: MutableSequence[Any]) -> int:
+    if isinstance(col, array):
+        return len(col) * col.itemsize
+
+    return sum(
+        len(v) if isinstance(v, (str, bytes))
+        else v.nbytes if isinstance(v, np.ndarray)
+        else 8
+        for v in col
+    )
+
+
+def _extend(col: MutableSequence[Any], vs: Sequence[Any]) -> MutableSequence[Any]:
+    n = len(col)
+    try:
+        col.extend(vs)
+        return col
+    except (TypeError, OverflowError):
+        # arrays may be partially extended before failing
+        del col[n:]
+        out = list(col)
+        out.extend(vs)
+        return out
+
+
 class BaseBackend:
-    def read_metric(self, metric: str, exp_id: int | str | None = None) -> list[SqlPoint]:
+    def read_metric(self, metric: str, exp_id: int | str | None = None, until: int | None = None) -> list[SqlPoint]:
+        ...
+
+    def get_marks(self, metrics: Iterable[str]) -> dict[str, int]:
         ...
 
     def init_db(self) -> None:
         ...
 
-    def dump(self) -> str:
+    def dump(self) -> str | bytes:
         ...
 
     def load(self, data: Any) -> None:
         ...
 
+    def dump_delta(self, path: str, marks: dict[str, int]) -> dict[str, int]:
+        ...
+
+    def load_delta(self, path: str) -> None:
+        ...
+
     def close(self) -> None:
         ...
 
@@ -35,5 +163,5 @@ class BaseBackend:
     def merge(self, other: str) -> None:
         ...
 
-    def write_many(self, points: dict[str, dict[int, Point]]) -> None:
+    def write_many(self, points: dict[str, Columns]) -> None:
         ...
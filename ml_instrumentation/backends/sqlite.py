@@ -1,42 +1,113 @@
+import contextlib
 import logging
 import os
 import sqlite3
+from collections.abc import Iterable, Sequence
+from itertools import repeat
+from array import array
 from pathlib import Path
 from typing import Any
 import filelock
-from ml_instrumentation.backends.base import BaseBackend, Point, SqlPoint
+import numpy as np
+from ml_instrumentation.backends.base import BaseBackend, Columns, SqlPoint
 import ml_instrumentation._utils.sqlite as sqlu
+from ml_instrumentation._utils.arrays import ARRAYS, ArraySpec, is_array, read_specs
+from ml_instrumentation._utils.strings import CODE, STRINGS, STRINGS_SCHEMA, StringDict, read_dicts, should_encode
 
 logger = logging.getLogger('ml-instrumentation')
 
+# tables of the single-table layout, see `LongSqlite`
+METRICS = '_metrics_'
+POINTS = '_points_'
+
+# pragmas trading durability for ingest throughput, applied in order on connect.
+# `page_size` only takes effect for new database files.
+PROFILES: dict[str, dict[str, Any]] = {
+    # sqlite's own defaults
+    'default': {},
+    # every commit is fsync'd, a crash never loses committed rows
+    'safe': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+    },
+    # the database stays consistent, but a power loss may drop the last commits.
+    # WAL needs shared memory, so avoid this on network filesystems
+    'fast': {
+        'page_size': 16384,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64_000,
+        'temp_store': 'MEMORY',
+    },
+    # never waits on the disk, a crash can corrupt the database file.
+    # Only for disposable runs on a local disk, never a network filesystem
+    'unsafe': {
+        'page_size': 16384,
+        'journal_mode': 'MEMORY',
+        'synchronous': 'OFF',
+        'cache_size': -64_000,
+        'temp_store': 'MEMORY',
+    },
+}
+
 
 class Sqlite(BaseBackend):
-    def __init__(self, path: str | Path):
+    def __init__(self, path: str | Path, profile: str = 'default'):
+        assert profile in PROFILES, f'Unknown profile <{profile}>, expected one of {list(PROFILES)}'
         self._path = path
-        self._con = sqlite3.connect(path, check_same_thread=False)
-        self._con.row_factory = row_factory
+        self._profile = profile
+        self._con = _connect(path, profile)
 
         self._built = set[str]()
+        self._arrays: dict[str, ArraySpec] = {}
+        self._strings: dict[str, StringDict] = {}
+        self._types: dict[str, dict[str, str]] = {}
+
+        # (id, frame) indexes are built in bulk once writing is done,
+        # never maintained row-by-row while ingesting
+        self._indexed = set[str]()
 
     # -----------
     # -- Setup --
     # -----------
     def init_db(self):
+        # declared types are re-read on demand, another connection may have widened them
+        self._types = {}
         if not os.path.exists(self._path) and str(self._path) != ':memory:':
             return
 
         cur = self._con.cursor()
-        self._built |= sqlu.get_tables(cur)
+        tables = sqlu.get_tables(cur)
+        self._built |= tables - {ARRAYS, METRICS, POINTS, STRINGS}
+        self._indexed |= sqlu.get_indexed(cur)
 
+        if ARRAYS in tables:
+            self._arrays = read_specs(cur.execute(f'SELECT metric, dtype, shape FROM {ARRAYS}').fetchall())
 
-    def _setup_table(self, cur: sqlite3.Cursor, name: str):
+        if STRINGS in tables:
+            self._strings = read_dicts(cur.execute(f'SELECT metric, code, value FROM {STRINGS} ORDER BY metric, code'))
+
+    def _setup_table(self, cur: sqlite3.Cursor, name: str, fields: Sequence[str] | None = None, cols: Columns | None = None):
         if name in self._built:
             return
 
+        # column types are inferred from the first flush of a metric,
+        # and multi-statistic measurements get one column per field
+        if fields is None:
+            t = '' if cols is None else CODE if should_encode(cols.values) else _column_type(cols.values)
+            types = {'measurement': t}
+        else:
+            types = {f: '' if cols is None else _column_type([v[f] for v in cols.values]) for f in fields}
+
         try:
-            cur.execute(f'CREATE TABLE "{name}"(frame INTEGER ASC, id, measurement)')
+            cur.execute(f'CREATE TABLE "{name}"(frame INTEGER ASC, id, {sqlu.col_defs(types)})')
         except sqlite3.OperationalError:
             ...
+        else:
+            self._types[name] = types
+            if types.get('measurement') == CODE:
+                cur.execute(STRINGS_SCHEMA)
+                self._strings[name] = StringDict()
 
         self._built.add(name)
 
@@ -44,6 +115,18 @@ class Sqlite(BaseBackend):
         path = str(self._path)
         return path.startswith(':memory:')
 
+    def build_indexes(self):
+        # speeds up reading a single run out of a file holding many
+        todo = self._built - self._indexed - {'_metadata_'}
+        if not todo:
+            return
+
+        cur = self._con.cursor()
+        sqlu.build_indexes(cur, sorted(todo))
+        self._con.commit()
+        cur.close()
+        self._indexed |= todo
+
     # -------------
     # -- Reading --
     # -------------
@@ -51,10 +134,18 @@ class Sqlite(BaseBackend):
     def get_tables(self):
         return self._built
 
-    def read_metric(self, metric: str, exp_id: int | str | None = None):
-        cond = ''
+    def read_metric(self, metric: str, exp_id: int | str | None = None, until: int | None = None):
+        conds = []
         if exp_id is not None:
-            cond = f'WHERE id={sqlu.maybe_quote(exp_id)}'
+            conds.append(f'id={sqlu.maybe_quote(exp_id)}')
+
+        # rows past a high-water mark may be part of a write that is still in progress
+        if until is not None:
+            conds.append(f'rowid <= {until}')
+
+        cond = ''
+        if conds:
+            cond = 'WHERE ' + ' AND '.join(conds)
 
         cur = self._con.cursor()
         try:
@@ -64,46 +155,210 @@ class Sqlite(BaseBackend):
             logger.warning(f'Specified metric/exp_id does not exist: <{metric}, {exp_id}>')
             res = []
 
+        spec = self._arrays.get(metric)
+        strings = self._strings.get(metric)
+        if spec is not None and res:
+            values = spec.decode([r.measurement for r in res])
+            res = [SqlPoint(r.frame, r.id, v) for r, v in zip(res, values, strict=True)]
+        elif strings is not None:
+            values = strings.decode([r.measurement for r in res])
+            res = [SqlPoint(r.frame, r.id, v) for r, v in zip(res, values, strict=True)]
+
         return res
 
+    def get_marks(self, metrics: Iterable[str]):
+        cur = self._con.cursor()
+        cur.row_factory = None
+
+        out: dict[str, int] = {}
+        for m in metrics:
+            if m not in self._built:
+                out[m] = 0
+                continue
+
+            res = cur.execute(f'SELECT MAX(rowid) FROM "{m}"').fetchone()
+            out[m] = res[0] or 0
+
+        cur.close()
+        return out
+
     # -------------
     # -- Writing --
     # -------------
-    def write_many(self, points: dict[str, dict[int, Point]]):
+    def write_many(self, points: dict[str, Columns]):
+        # one transaction for every metric, including any new tables,
+        # so that each flush costs a single commit
+        state = self._state()
+
         cur = self._con.cursor()
-        sql_d = {}
-        for m, sub in points.items():
-            sql_d[m] = [
-                SqlPoint(p.frame, p.exp_id, p.data) for p in sub.values()
-            ]
+        if not self._con.in_transaction:
+            cur.execute('BEGIN')
 
-        for m, sub in sql_d.items():
-            self._setup_table(cur, m)
-            self._write_many(cur, m, sub)
+        try:
+            for m, cols in points.items():
+                self._setup_table(cur, m, _fields(cols), cols)
+                self._write_many(cur, m, cols)
+        except BaseException:
+            self._con.rollback()
+            self._restore(state)
+            raise
 
         self._con.commit()
 
-    def _write_many(self, cur: sqlite3.Cursor, m: str, d: list[SqlPoint]):
-        cur.executemany(f'INSERT INTO "{m}" (frame, id, measurement) VALUES (?,?,?)', d)
+    def _state(self) -> Any:
+        strings = {m: (d, len(d.values)) for m, d in self._strings.items()}
+        return set(self._built), dict(self._arrays), strings, dict(self._types)
+
+    def _restore(self, state: Any):
+        self._built, self._arrays, strings, self._types = state
+        self._strings = {m: d for m, (d, _) in strings.items()}
+        for d, n in strings.values():
+            d.truncate(n)
+
+    def _write_many(self, cur: sqlite3.Cursor, m: str, cols: Columns):
+        if len(cols) > 0 and is_array(cols.values[0]):
+            spec = self._array_spec(cur, m, cols.values[0])
+            cur.executemany(
+                f'INSERT INTO "{m}" (frame, id, measurement) VALUES (?,?,?)',
+                ((frame, i, spec.encode(v)) for frame, i, v in cols.rows()),
+            )
+            return
+
+        strings = self._strings.get(m)
+        if strings is not None:
+            n = len(strings.values)
+            try:
+                codes = strings.encode(cols.values)
+            except ValueError:
+                # a metric that looked like repeated strings also holds other values,
+                # from now on its strings are stored inline like any other value
+                strings.truncate(n)
+                self._decode_strings(m)
+            else:
+                cur.executemany(
+                    f'INSERT INTO {STRINGS} VALUES (?,?,?)',
+                    ((m, n + i, v) for i, v in enumerate(strings.values[n:])),
+                )
+                cur.executemany(f'INSERT INTO "{m}" (frame, id, measurement) VALUES (?,?,?)', zip(cols.frames, cols.ids, codes, strict=True))
+                return
+
+        fields = _fields(cols)
+        self._fit_columns(m, cols, fields)
+        if fields is None:
+            cur.executemany(f'INSERT INTO "{m}" (frame, id, measurement) VALUES (?,?,?)', cols.rows())
+            return
 
-    def merge(self, other: str):
-        with filelock.FileLock(f'{other}.lock'):
+        names = ', '.join(map(sqlu.quote, fields))
+        params = ', '.join('?' * len(fields))
+        cur.executemany(
+            f'INSERT INTO "{m}" (frame, id, {names}) VALUES (?,?,{params})',
+            ((frame, i, *[v[k] for k in fields]) for frame, i, v in cols.rows()),
+        )
+
+    def _fit_columns(self, m: str, cols: Columns, fields: Sequence[str] | None):
+        # declared types coerce the values that do not fit them, e.g. 5 -> '5' in a
+        # TEXT column, so such columns are widened to keep every value as written
+        types = self._col_types(m)
+        if fields is None:
+            misfits = [] if _fits(types.get('measurement', ''), cols.values) else ['measurement']
+        else:
+            misfits = [f for f in fields if not _fits(types.get(f, ''), [v[f] for v in cols.values])]
+
+        if misfits:
+            self._widen_columns(m, misfits)
+
+    def _col_types(self, m: str):
+        types = self._types.get(m)
+        if types is None:
+            cur = self._con.cursor()
+            cur.row_factory = None
+            types = self._types[m] = sqlu.get_col_types(cur, m)
+
+        return types
+
+    def _widen_columns(self, m: str, columns: Sequence[str]):
+        _widen_columns(self._con.cursor(), m, columns, 'main')
+        self._types.pop(m, None)
+        self._indexed.discard(m)
+
+    def _decode_strings(self, m: str):
+        _decode_strings(self._con.cursor(), m, 'main')
+        del self._strings[m]
+        self._types.pop(m, None)
+        self._indexed.discard(m)
+
+    def _array_spec(self, cur: sqlite3.Cursor, m: str, v: Any):
+        spec = self._arrays.get(m)
+        if spec is not None:
+            return spec
+
+        spec = self._arrays[m] = ArraySpec.of(v)
+        cur.execute(f'CREATE TABLE IF NOT EXISTS {ARRAYS}(metric, dtype, shape)')
+        cur.execute(f'INSERT INTO {ARRAYS} VALUES (?,?,?)', (m, *spec.dumps()))
+        return spec
+
+    def merge(self, other: str, lock: bool = True, index: bool = True):
+        # `lock=False` is only safe when nothing else writes to `other`, e.g. the
+        # private intermediate files of `ml_instrumentation.merge.merge_all`
+        with _lock(other, lock):
             other_con = sqlite3.connect(other)
 
             cur = self._con.cursor()
+            cur.row_factory = None
             other_cur = other_con.cursor()
             tables = sqlu.get_tables(cur)
             other_tables = sqlu.get_tables(other_cur)
+            if POINTS in other_tables:
+                other_con.close()
+                raise ValueError(f'Cannot merge into <{other}>, it uses the single-table layout')
 
-            to_build = tables - other_tables
+            metrics = tables - {ARRAYS, STRINGS}
+            columns = {table: sqlu.get_col_types(cur, table) for table in metrics}
+
+            to_build = metrics - other_tables
             for table in to_build:
-                other_cur.execute(f'CREATE TABLE "{table}"(frame, id, measurement)')
+                other_cur.execute(f'CREATE TABLE "{table}"({sqlu.col_defs(columns[table])})')
+
+            # e.g. runs that attached different metadata
+            for table in metrics & other_tables:
+                sqlu.ensure_table_compatible(other_cur, sqlu.quote(table), columns[table])
+
+            other_columns = {table: sqlu.get_col_types(other_cur, table) for table in metrics}
+            if STRINGS in tables:
+                other_cur.execute(STRINGS_SCHEMA)
 
+            other_con.commit()
             other_con.close()
 
             cur.execute(f'ATTACH DATABASE "{other}" AS other_db')
-            for table in tables:
-                cur.execute(f'INSERT INTO other_db.{table} SELECT * FROM {table}')
+            for table in metrics:
+                src = columns[table].get('measurement') == CODE
+                dest = other_columns[table].get('measurement') == CODE
+
+                # values that are not strings cannot be encoded, so the target stores its strings inline too
+                if dest and not src and _has_other_types(cur, table, 'measurement', 'TEXT'):
+                    _decode_strings(cur, table, 'other_db')
+                    dest = False
+
+                # e.g. a job whose ints would land in the TEXT column of another job
+                misfits = _misfits(cur, table, columns[table], other_columns[table])
+                if misfits:
+                    _widen_columns(cur, table, misfits, 'other_db')
+
+                if src or dest:
+                    _copy_strings(cur, table, src, dest)
+                    continue
+
+                cols = ', '.join(map(sqlu.quote, columns[table]))
+                cur.execute(f'INSERT INTO other_db."{table}" ({cols}) SELECT {cols} FROM "{table}"')
+
+            if ARRAYS in tables:
+                cur.execute(f'CREATE TABLE IF NOT EXISTS other_db.{ARRAYS}(metric, dtype, shape)')
+                cur.execute(_copy_specs('other_db', 'main'))
+
+            # indexes are created once, later merges only add to them
+            if index:
+                sqlu.build_indexes(cur, sorted(metrics - {'_metadata_'}), schema='other_db')
 
             self._con.commit()
             cur.execute('DETACH DATABASE other_db')
@@ -113,30 +368,564 @@ class Sqlite(BaseBackend):
     # -- Lifecycle --
     # ---------------
 
-    def dump(self) -> str:
+    def dump(self) -> str | bytes:
+        # binary snapshots are much faster and smaller than a text dump,
+        # but are only available on python>=3.11
+        if hasattr(self._con, 'serialize'):
+            return self._con.serialize()
+
         self._con.row_factory = None
-        return ''.join(self._con.iterdump())
+        data = ''.join(self._con.iterdump())
+        self._con.row_factory = row_factory
+        return data
 
     def load(self, data: Any):
-        self._con.executescript(data)
-        self._con.commit()
+        if isinstance(data, bytes):
+            self._con.deserialize(data)
+        else:
+            self._con.executescript(data)
+            self._con.commit()
+
         self.init_db()
 
+    def dump_delta(self, path: str | Path, marks: dict[str, int]) -> dict[str, int]:
+        if os.path.exists(path):
+            os.remove(path)
+
+        cur = self._con.cursor()
+        cur.row_factory = None
+        cur.execute(f'ATTACH DATABASE "{path}" AS delta_db')
+
+        # rowids only grow as rows are appended, so everything above the
+        # previous high-water mark has been written since the last delta
+        out = dict(marks)
+        if self._arrays:
+            cur.execute(f'CREATE TABLE delta_db.{ARRAYS} AS SELECT * FROM {ARRAYS}')
+
+        if self._strings:
+            cur.execute(f'CREATE TABLE delta_db.{STRINGS} AS SELECT * FROM {STRINGS}')
+
+        for table in self._built:
+            hw = marks.get(table, 0)
+
+            # keep the declared column types, which mark dictionary-encoded columns
+            cur.execute(f'CREATE TABLE delta_db."{table}"({sqlu.col_defs(sqlu.get_col_types(cur, table))})')
+            cur.execute(f'INSERT INTO delta_db."{table}" SELECT * FROM "{table}" WHERE rowid > {hw}')
+            res = cur.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()
+            out[table] = res[0] or hw
+
+        self._con.commit()
+        cur.execute('DETACH DATABASE delta_db')
+        cur.close()
+        return out
+
+    def load_delta(self, path: str | Path):
+        cur = self._con.cursor()
+        cur.execute(f'ATTACH DATABASE "{path}" AS delta_db')
+
+        cur.row_factory = None
+        tables = cur.execute("SELECT name FROM delta_db.sqlite_master WHERE type='table'").fetchall()
+        if (ARRAYS,) in tables:
+            cur.execute(f'CREATE TABLE IF NOT EXISTS {ARRAYS}(metric, dtype, shape)')
+            cur.execute(_copy_specs('main', 'delta_db'))
+            self._arrays = read_specs(cur.execute(f'SELECT metric, dtype, shape FROM {ARRAYS}').fetchall())
+            tables.remove((ARRAYS,))
+
+        # deltas are replayed in order, so the string codes never clash
+        if (STRINGS,) in tables:
+            cur.execute(STRINGS_SCHEMA)
+            cur.execute(f'INSERT OR IGNORE INTO {STRINGS} SELECT * FROM delta_db.{STRINGS}')
+            self._strings = read_dicts(cur.execute(f'SELECT metric, code, value FROM {STRINGS} ORDER BY metric, code'))
+            tables.remove((STRINGS,))
+
+        for (table,) in tables:
+            types = sqlu.get_col_types(cur, table, schema='delta_db')
+
+            # the metric stopped being dictionary-encoded since the previous delta
+            if table in self._strings and types.get('measurement') != CODE:
+                self._decode_strings(table)
+
+            # or some of its columns were widened
+            if table in self._built:
+                main = self._col_types(table)
+                widened = [c for c, t in types.items() if t == '' and main.get(c, '') not in ('', CODE)]
+                if widened:
+                    self._widen_columns(table, widened)
+
+            if table not in self._built:
+                cur.execute(f'CREATE TABLE IF NOT EXISTS "{table}"({sqlu.col_defs(types)})')
+                self._built.add(table)
+
+            names = ', '.join(map(sqlu.quote, types))
+            cur.execute(f'INSERT INTO "{table}" ({names}) SELECT {names} FROM delta_db."{table}"')
+
+        self._con.commit()
+        cur.execute('DETACH DATABASE delta_db')
+        cur.close()
+
     def close(self):
+        if not self.is_in_memory():
+            self.build_indexes()
+
         self._con.close()
 
 
     def __getstate__(self) -> object:
         return {
             'path': str(self._path),
+            'profile': self._profile,
         }
 
     def __setstate__(self, state: dict[str, Any]):
         self._path = Path(state['path'])
-        self._con = sqlite3.connect(self._path, check_same_thread=False)
-        self._con.row_factory = row_factory
+        self._profile = state.get('profile', 'default')
+        self._con = _connect(self._path, self._profile)
         self._built = set[str]()
+        self._arrays = {}
+        self._strings = {}
+        self._types = {}
+        self._indexed = set[str]()
+
+
+# Stores every metric in a single WITHOUT ROWID table clustered by
+# (metric_id, id, frame), with metric names interned in a small dictionary
+# table. With hundreds of metrics this avoids one table (and one sqlite_master
+# entry) per metric, and reading one run of one metric is a range scan.
+#
+# Each field of a multi-field measurement is interned as its own metric id.
+# A per-metric `seq` completes the key, so that several rows can share a frame,
+# and stands in for the rowid as the high-water mark of committed writes.
+class LongSqlite(Sqlite):
+    def __init__(self, path: str | Path, profile: str = 'default'):
+        super().__init__(path, profile)
+        self._reset_ids()
+
+    # -----------
+    # -- Setup --
+    # -----------
+    def init_db(self):
+        if not os.path.exists(self._path) and str(self._path) != ':memory:':
+            return
+
+        cur = self._con.cursor()
+        tables = sqlu.get_tables(cur)
+        if ARRAYS in tables:
+            self._arrays = read_specs(cur.execute(f'SELECT metric, dtype, shape FROM {ARRAYS}').fetchall())
+
+        if POINTS in tables:
+            self._load_ids(cur)
+
+    def _setup_table(self, cur: sqlite3.Cursor, name: str, fields: Sequence[str] | None = None, cols: Columns | None = None):
+        if name in self._built:
+            return
+
+        cur.execute(_LONG_SCHEMA[0])
+        cur.execute(_LONG_SCHEMA[1])
+
+        # the metric may already be in the file, e.g. written by another connection
+        cur.row_factory = None
+        ids: dict[str, int] = {}
+        for field in fields or ['']:
+            cur.execute(f'INSERT OR IGNORE INTO {METRICS} (metric, field, last_seq) VALUES (?,?,0)', (name, field))
+            mid, last = cur.execute(f'SELECT metric_id, last_seq FROM {METRICS} WHERE metric=? AND field=?', (name, field)).fetchone()
+            ids[field] = mid
+            self._last[mid] = last
+
+        self._ids[name] = ids
+        self._built.add(name)
+
+    def build_indexes(self):
+        # the primary key already orders rows by (metric_id, id, frame)
+        ...
+
+    # -------------
+    # -- Reading --
+    # -------------
+    def read_metric(self, metric: str, exp_id: int | str | None = None, until: int | None = None):
+        ids = self._ids.get(metric)
+        if ids is None:
+            logger.warning(f'Specified metric/exp_id does not exist: <{metric}, {exp_id}>')
+            return []
+
+        conds = ''
+        if exp_id is not None:
+            conds += f' AND id={sqlu.maybe_quote(exp_id)}'
+
+        if until is not None:
+            conds += f' AND seq <= {until}'
+
+        cur = self._con.cursor()
+        cur.row_factory = None
+
+        # every field of a row shares the same seq, so the fields line up
+        cols: dict[str, list[Any]] = {}
+        keys: list[tuple[Any, Any]] = []
+        for field, mid in ids.items():
+            res = cur.execute(f'SELECT frame, id, measurement FROM {POINTS} WHERE metric_id={mid}{conds} ORDER BY seq').fetchall()
+            keys = [(r[0], r[1]) for r in res]
+            cols[field] = [r[2] for r in res]
+
+        cur.close()
+
+        spec = self._arrays.get(metric)
+        if '' in cols:
+            values: Any = cols['']
+            if spec is not None and values:
+                values = spec.decode(values)
+        else:
+            values = [dict(zip(cols, v, strict=True)) for v in zip(*cols.values(), strict=True)]
+
+        return [SqlPoint(frame, i, v) for (frame, i), v in zip(keys, values, strict=True)]
+
+    def get_marks(self, metrics: Iterable[str]):
+        out: dict[str, int] = {}
+        for m in metrics:
+            ids = self._ids.get(m)
+            out[m] = 0 if ids is None else self._last[next(iter(ids.values()))]
+
+        return out
+
+    # -------------
+    # -- Writing --
+    # -------------
+    def _write_many(self, cur: sqlite3.Cursor, m: str, cols: Columns):
+        n = len(cols)
+        if n == 0:
+            return
+
+        ids = self._ids[m]
+        if is_array(cols.values[0]):
+            spec = self._array_spec(cur, m, cols.values[0])
+            columns = {'': [spec.encode(v) for v in cols.values]}
+        elif '' in ids:
+            columns = {'': cols.values}
+        else:
+            columns = {field: [v[field] for v in cols.values] for field in ids}
+
+        for field, values in columns.items():
+            mid = ids[field]
+            start = self._last[mid]
+            cur.executemany(
+                f'INSERT INTO {POINTS} VALUES (?,?,?,?,?)',
+                zip(repeat(mid), cols.ids, cols.frames, range(start + 1, start + n + 1), values),
+            )
+
+            self._last[mid] = start + n
+            cur.execute(f'UPDATE {METRICS} SET last_seq=? WHERE metric_id=?', (start + n, mid))
+
+    def _state(self):
+        ids = {m: dict(f) for m, f in self._ids.items()}
+        return super()._state(), ids, dict(self._last)
+
+    def _restore(self, state: Any):
+        base, self._ids, self._last = state
+        super()._restore(base)
+
+    def merge(self, other: str, lock: bool = True, index: bool = True):
+        # the primary key doubles as the index, so `index` has nothing to skip
+        with _lock(other, lock):
+            cur = self._con.cursor()
+            tables = sqlu.get_tables(cur)
+
+            other_con = sqlite3.connect(other)
+            other_cur = other_con.cursor()
+            other_tables = sqlu.get_tables(other_cur)
+            if other_tables - {ARRAYS, METRICS, POINTS, STRINGS, '_metadata_'}:
+                other_con.close()
+                raise ValueError(f'Cannot merge into <{other}>, it uses the per-metric table layout')
+
+            meta = sqlu.get_col_list(cur, '_metadata_') if '_metadata_' in tables else []
+            if meta:
+                sqlu.maybe_make_table(other_cur, '_metadata_', meta)
+                sqlu.ensure_table_compatible(other_cur, '_metadata_', meta)
+                other_con.commit()
+
+            other_con.close()
+            cur.execute(f'ATTACH DATABASE "{other}" AS other_db')
+
+            if POINTS in tables:
+                for sql in _LONG_SCHEMA:
+                    cur.execute(sql.replace(' TABLE IF NOT EXISTS ', ' TABLE IF NOT EXISTS other_db.'))
+
+                # seqs are shifted past the rows the target already holds
+                _copy_points(cur, 'other_db', 'main', shift=True)
+
+            if ARRAYS in tables:
+                cur.execute(f'CREATE TABLE IF NOT EXISTS other_db.{ARRAYS}(metric, dtype, shape)')
+                cur.execute(_copy_specs('other_db', 'main'))
+
+            if meta:
+                cols = ', '.join(map(sqlu.quote, meta))
+                cur.execute(f'INSERT INTO other_db._metadata_ ({cols}) SELECT {cols} FROM _metadata_')
+
+            self._con.commit()
+            cur.execute('DETACH DATABASE other_db')
+            cur.close()
+
+    # ---------------
+    # -- Lifecycle --
+    # ---------------
+    def load(self, data: Any):
+        self._reset_ids()
+        super().load(data)
+
+    def dump_delta(self, path: str | Path, marks: dict[str, int]) -> dict[str, int]:
+        if os.path.exists(path):
+            os.remove(path)
+
+        cur = self._con.cursor()
+        cur.row_factory = None
+        cur.execute(f'ATTACH DATABASE "{path}" AS delta_db')
+
+        if self._arrays:
+            cur.execute(f'CREATE TABLE delta_db.{ARRAYS} AS SELECT * FROM {ARRAYS}')
+
+        out = dict(marks)
+        if self._ids:
+            cur.execute(f'CREATE TABLE delta_db.{METRICS} AS SELECT * FROM {METRICS}')
+            cur.execute(f'CREATE TABLE delta_db.{POINTS} AS SELECT * FROM {POINTS} WHERE 0')
+
+            # seqs only grow, so everything past the previous mark is new
+            for m, ids in self._ids.items():
+                hw = marks.get(m, 0)
+                mids = ','.join(map(str, ids.values()))
+                cur.execute(f'INSERT INTO delta_db.{POINTS} SELECT * FROM {POINTS} WHERE metric_id IN ({mids}) AND seq > {hw}')
+                out[m] = self._last[next(iter(ids.values()))]
+
+        self._con.commit()
+        cur.execute('DETACH DATABASE delta_db')
+        cur.close()
+        return out
+
+    def load_delta(self, path: str | Path):
+        cur = self._con.cursor()
+        cur.execute(f'ATTACH DATABASE "{path}" AS delta_db')
+
+        cur.row_factory = None
+        tables = {r[0] for r in cur.execute("SELECT name FROM delta_db.sqlite_master WHERE type='table'").fetchall()}
+        if ARRAYS in tables:
+            cur.execute(f'CREATE TABLE IF NOT EXISTS {ARRAYS}(metric, dtype, shape)')
+            cur.execute(_copy_specs('main', 'delta_db'))
+
+        if POINTS in tables:
+            for sql in _LONG_SCHEMA:
+                cur.execute(sql)
+
+            # deltas are replayed in order, so seqs keep matching the marks
+            _copy_points(cur, 'main', 'delta_db', shift=False)
+
+        self._con.commit()
+        cur.execute('DETACH DATABASE delta_db')
+        self.init_db()
+        cur.close()
+
+    def __setstate__(self, state: dict[str, Any]):
+        super().__setstate__(state)
+        self._reset_ids()
+
+    # --------------
+    # -- Internal --
+    # --------------
+    def _load_ids(self, cur: sqlite3.Cursor):
+        self._reset_ids()
+        cur.row_factory = None
+        for mid, metric, field, last in cur.execute(f'SELECT metric_id, metric, field, last_seq FROM {METRICS} ORDER BY metric_id'):
+            self._ids.setdefault(metric, {})[field] = mid
+            self._last[mid] = last
+
+        self._built = set(self._ids)
+
+    def _reset_ids(self):
+        # metric -> field -> metric id, scalar metrics have a single '' field
+        self._ids: dict[str, dict[str, int]] = {}
+        self._last: dict[int, int] = {}
+        self._built = set()
+
+
+_LONG_SCHEMA = (
+    f'CREATE TABLE IF NOT EXISTS {METRICS}('
+    'metric_id INTEGER PRIMARY KEY, metric TEXT NOT NULL, field TEXT NOT NULL, '
+    'last_seq INTEGER NOT NULL, UNIQUE (metric, field))',
+    f'CREATE TABLE IF NOT EXISTS {POINTS}('
+    'metric_id INTEGER NOT NULL, id, frame INTEGER NOT NULL, seq INTEGER NOT NULL, measurement, '
+    'PRIMARY KEY (metric_id, id, frame, seq)) WITHOUT ROWID',
+)
+
+
+def _copy_points(cur: sqlite3.Cursor, dest: str, src: str, shift: bool):
+    # metric ids differ between files, so points are matched up by name
+    cur.execute(
+        f'INSERT OR IGNORE INTO {dest}.{METRICS} (metric, field, last_seq) '
+        f'SELECT metric, field, 0 FROM {src}.{METRICS} ORDER BY metric_id'
+    )
+
+    offset = 'd.last_seq' if shift else '0'
+    cur.execute(
+        f'INSERT INTO {dest}.{POINTS} '
+        f'SELECT d.metric_id, p.id, p.frame, p.seq + {offset}, p.measurement '
+        f'FROM {src}.{POINTS} p '
+        f'JOIN {src}.{METRICS} s ON p.metric_id = s.metric_id '
+        f'JOIN {dest}.{METRICS} d ON d.metric = s.metric AND d.field = s.field'
+    )
+
+    last = 'd.last_seq + s.last_seq' if shift else 'MAX(d.last_seq, s.last_seq)'
+    cur.execute(
+        f'UPDATE {dest}.{METRICS} AS d SET last_seq = {last} '
+        f'FROM {src}.{METRICS} s WHERE d.metric = s.metric AND d.field = s.field'
+    )
+
+
+def _lock(path: str, lock: bool):
+    return filelock.FileLock(f'{path}.lock') if lock else contextlib.nullcontext()
+
+
+def _connect(path: str | Path, profile: str):
+    con = sqlite3.connect(path, check_same_thread=False)
+    con.row_factory = row_factory
+
+    for pragma, value in PROFILES[profile].items():
+        con.execute(f'PRAGMA {pragma}={value}')
+
+    return con
 
 
 def row_factory(cur: sqlite3.Cursor, d: tuple[Any, ...]):
-    return SqlPoint(*d)
+    # multi-statistic measurements are read back as a dict of fields, even with
+    # a single field. Anything else keeps its columns, e.g. (metric, dtype, shape)
+    desc = cur.description
+    if len(d) < 3 or desc[2][0] == 'measurement' or desc[0][0] != 'frame':
+        return SqlPoint(*d)
+
+    return SqlPoint(d[0], d[1], {c[0]: v for c, v in zip(desc[2:], d[2:], strict=True)})
+
+
+def _copy_specs(dest: str, src: str):
+    # array specs are only added for metrics the destination does not know yet
+    return (
+        f'INSERT INTO {dest}.{ARRAYS} SELECT * FROM {src}.{ARRAYS} '
+        f'WHERE metric NOT IN (SELECT metric FROM {dest}.{ARRAYS})'
+    )
+
+
+def _copy_strings(cur: sqlite3.Cursor, table: str, src: bool, dest: bool):
+    # string codes differ between files, so rows are matched up by value
+    value = 's.value' if src else 't.measurement'
+    rows = f'"{table}" t'
+    if src:
+        rows += f' LEFT JOIN {STRINGS} s ON s.metric=:m AND s.code=t.measurement'
+
+    if not dest:
+        cur.execute(f'INSERT INTO other_db."{table}" (frame, id, measurement) SELECT t.frame, t.id, {value} FROM {rows}', {'m': table})
+        return
+
+    # strings the target has not seen yet get the next free codes
+    n = cur.execute(f'SELECT COUNT(*) FROM other_db.{STRINGS} WHERE metric=:m', {'m': table}).fetchone()[0]
+    cur.execute(
+        f'INSERT INTO other_db.{STRINGS} (metric, code, value) '
+        f'SELECT :m, :n + ROW_NUMBER() OVER (ORDER BY v) - 1, v FROM (SELECT DISTINCT {value} AS v FROM {rows}) '
+        f'WHERE v IS NOT NULL AND v NOT IN (SELECT value FROM other_db.{STRINGS} WHERE metric=:m)',
+        {'m': table, 'n': n},
+    )
+    cur.execute(
+        f'INSERT INTO other_db."{table}" (frame, id, measurement) SELECT t.frame, t.id, d.code FROM {rows} '
+        f'LEFT JOIN other_db.{STRINGS} d ON d.metric=:m AND d.value={value}',
+        {'m': table},
+    )
+
+
+def _decode_strings(cur: sqlite3.Cursor, table: str, schema: str):
+    # rebuilds a dictionary-encoded table with the strings inline
+    cur.row_factory = None
+    types = sqlu.get_col_types(cur, table, schema)
+    types['measurement'] = ''
+
+    _rebuild_table(
+        cur, table, types, schema,
+        f'SELECT t.rowid, t.frame, t.id, s.value FROM {schema}."{table}" t '
+        f'LEFT JOIN {schema}.{STRINGS} s ON s.metric=:m AND s.code=t.measurement ORDER BY t.rowid',
+        {'m': table},
+    )
+    cur.execute(f'DELETE FROM {schema}.{STRINGS} WHERE metric=:m', {'m': table})
+
+
+def _widen_columns(cur: sqlite3.Cursor, table: str, columns: Sequence[str], schema: str):
+    # columns without a declared type store every value as it is written
+    cur.row_factory = None
+    types = sqlu.get_col_types(cur, table, schema)
+    types.update({c: '' for c in columns})
+
+    names = ', '.join(map(sqlu.quote, types))
+    _rebuild_table(cur, table, types, schema, f'SELECT rowid, {names} FROM {schema}."{table}" ORDER BY rowid')
+
+
+def _rebuild_table(cur: sqlite3.Cursor, table: str, types: dict[str, str], schema: str, select: str, params: dict[str, Any] | None = None):
+    # declared types can only be changed by copying the table. Rowids are
+    # kept, so the high-water marks of checkpoint deltas still line up
+    tmp = f'{table}__rebuilt'
+    names = ', '.join(map(sqlu.quote, types))
+    cur.execute(f'CREATE TABLE {schema}."{tmp}"({sqlu.col_defs(types)})')
+    cur.execute(f'INSERT INTO {schema}."{tmp}" (rowid, {names}) {select}', params or {})
+    cur.execute(f'DROP TABLE {schema}."{table}"')
+    cur.execute(f'ALTER TABLE {schema}."{tmp}" RENAME TO "{table}"')
+
+
+def _misfits(cur: sqlite3.Cursor, table: str, src: dict[str, str], dest: dict[str, str]):
+    # columns of the target whose declared type would coerce values of the source
+    out: list[str] = []
+    for c, t in dest.items():
+        s = src.get(c)
+        if s is None or s == t or t in ('', CODE):
+            continue
+
+        if s == CODE and t != 'TEXT':
+            out.append(c)
+        elif s != CODE and _has_other_types(cur, table, c, t):
+            out.append(c)
+
+    return out
+
+
+def _has_other_types(cur: sqlite3.Cursor, table: str, column: str, t: str):
+    res = cur.execute(f"SELECT 1 FROM \"{table}\" WHERE typeof({sqlu.quote(column)}) NOT IN ('{t.lower()}', 'null') LIMIT 1")
+    return res.fetchone() is not None
+
+
+def _fits(t: str, values: Sequence[Any]):
+    if t in ('', CODE):
+        return True
+
+    if not isinstance(values, array) and all(v is None for v in values):
+        return True
+
+    return _column_type(values) == t
+
+
+def _column_type(values: Sequence[Any]) -> str:
+    if isinstance(values, array):
+        return 'INTEGER' if values.typecode == 'q' else 'REAL'
+
+    types = {type(v) for v in values if v is not None}
+    if not types:
+        return ''
+
+    if all(issubclass(t, int) for t in types):
+        return 'INTEGER'
+
+    # a REAL column would store ints as floats
+    if all(issubclass(t, float) for t in types):
+        return 'REAL'
+
+    if all(issubclass(t, str) for t in types):
+        return 'TEXT'
+
+    if all(issubclass(t, (bytes, np.ndarray)) for t in types):
+        return 'BLOB'
+
+    return ''
+
+
+def _fields(cols: Columns) -> list[str] | None:
+    if len(cols) > 0 and isinstance(cols.values[0], dict):
+        return list(cols.values[0])
+
+    return None
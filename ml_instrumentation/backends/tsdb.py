@@ -1,11 +1,12 @@
 import logging
 import sqlalchemy
 import time
+from collections.abc import Iterable
 from typing import Any
 from sqlalchemy import URL
 from sqlalchemy import text
 from sqlalchemy_utils import create_database, database_exists
-from ml_instrumentation.backends.base import BaseBackend, Point
+from ml_instrumentation.backends.base import BaseBackend, Columns
 
 logger = logging.getLogger('ml-instrumentation')
 
@@ -50,13 +51,17 @@ class TSDB(BaseBackend):
     def get_tables(self):
         return self._built
 
-    def read_metric(self, metric: str, exp_id: int | str | None = None):
+    def read_metric(self, metric: str, exp_id: int | str | None = None, until: int | None = None):
         raise Exception('read_metric is not implemented')
 
+    def get_marks(self, metrics: Iterable[str]):
+        # rows are never read back, so there is nothing to track
+        return {m: 0 for m in metrics}
+
     # -------------
     # -- Writing --
     # -------------
-    def write_many(self, points: dict[str, dict[int, Point]]):
+    def write_many(self, points: dict[str, Columns]):
         self._setup_table()
 
         insert_sql = text("""
@@ -67,9 +72,9 @@ class TSDB(BaseBackend):
         self._con.execute(
             insert_sql,
             [
-                {'frame': p.frame, 'metric': m, 'exp_id': exp_id, 'data': p.data}
-                for m, sub in points.items()
-                for exp_id, p in sub.items()
+                {'frame': frame, 'metric': m, 'exp_id': exp_id, 'data': data}
+                for m, cols in points.items()
+                for frame, exp_id, data in cols.rows()
             ]
         )
         self._con.commit()
@@ -0,0 +1,153 @@
+import argparse
+import glob
+import logging
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import tempfile
+from collections.abc import Iterable, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import ml_instrumentation._utils.sqlite as sqlu
+from ml_instrumentation.backends.sqlite import POINTS, LongSqlite, Sqlite
+
+logger = logging.getLogger('ml-instrumentation')
+
+
+# Merges many per-job databases into one file without ever touching a shared lock.
+# Inputs are merged pairwise in a process pool, halving the number of files at
+# every level, so N inputs take log2(N) rounds of parallel merges instead of N
+# merges serialized on the lock of the shared db. All intermediate files are
+# private, and the result only appears at `out` through one atomic rename.
+def merge_all(
+    sources: str | Path | Iterable[str | Path],
+    out: str | Path,
+    workers: int | None = None,
+) -> Path:
+    out = Path(out).absolute()
+    paths = [p for p in _resolve(sources) if p != out]
+
+    # an existing output is merged into, the same as `Collector.merge` would
+    if out.exists():
+        paths.insert(0, out)
+
+    if not paths:
+        raise ValueError(f'No databases to merge from <{sources}>')
+
+    missing = [str(p) for p in paths if not p.is_file()]
+    if missing:
+        raise FileNotFoundError(f'Cannot merge missing databases: {missing}')
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(prefix=f'.{out.name}-', dir=out.parent))
+    pool = None
+    if workers != 1 and len(paths) > 2:
+        # forking a process that already runs polars or jax threads can deadlock
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    try:
+        # the first level only reads the inputs and writes fresh files,
+        # later levels merge in-place into files that this function owns
+        files, level = paths, 0
+        while level == 0 or len(files) > 1:
+            files = _merge_level(files, tmp, level, pool)
+            level += 1
+
+        # indexes are built once on the final file, not maintained through every level
+        backend = _open(files[0])
+        if backend is not None:
+            backend.init_db()
+            backend.close()
+
+        os.replace(files[0], out)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return out
+
+
+def main(argv: Sequence[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m ml_instrumentation.merge',
+        description='Merge many per-job sqlite databases into one file.',
+    )
+    parser.add_argument('sources', nargs='+', help='database files, directories of .db files, or glob patterns')
+    parser.add_argument('-o', '--out', required=True, help='merged database, rows are appended if it already exists')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of merge processes, defaults to the number of cpus')
+    args = parser.parse_args(argv)
+
+    out = merge_all(args.sources, args.out, workers=args.workers)
+    print(out)
+
+
+# --------------
+# -- Internal --
+# --------------
+def _resolve(sources: str | Path | Iterable[str | Path]) -> list[Path]:
+    if isinstance(sources, (str, Path)):
+        sources = [sources]
+
+    out: list[Path] = []
+    for source in sources:
+        source = str(source)
+        if os.path.isdir(source):
+            out += sorted(Path(source).glob('*.db'))
+        elif glob.has_magic(source):
+            out += sorted(map(Path, glob.glob(source)))
+        else:
+            out.append(Path(source))
+
+    return [p.absolute() for p in out]
+
+
+def _merge_level(paths: list[Path], tmp: Path, level: int, pool: ProcessPoolExecutor | None) -> list[Path]:
+    owned = level > 0
+    groups = [paths[i:i + 2] for i in range(0, len(paths), 2)]
+    logger.info(f'Merging {len(paths)} databases into {len(groups)}')
+
+    # an owned file without a partner is simply carried up to the next level
+    todo = [g for g in groups if len(g) > 1 or not owned]
+    targets = [g[0] if owned else tmp / f'{level}-{i}.db' for i, g in enumerate(todo)]
+    sources = [g[1:] if owned else g for g in todo]
+    run = map if pool is None or len(todo) == 1 else pool.map
+    list(run(_merge_into, sources, targets, [owned] * len(todo)))
+
+    merged = iter(targets)
+    return [g[0] if owned and len(g) == 1 else next(merged) for g in groups]
+
+
+def _merge_into(paths: list[Path], target: Path, owned: bool):
+    # merging in order keeps the rows of earlier inputs first
+    for path in paths:
+        backend = _open(path)
+
+        # e.g. a job that died before writing anything
+        if backend is not None:
+            backend.merge(str(target), lock=False, index=False)
+
+            # the backend was never initialized, so closing it does not write to the input
+            backend.close()
+
+        if owned:
+            path.unlink()
+
+
+def _open(path: Path):
+    # read-only, so a bad path fails instead of leaving an empty database behind
+    con = sqlite3.connect(f'{path.as_uri()}?mode=ro', uri=True)
+    tables = sqlu.get_tables(con.cursor())
+    con.close()
+
+    if not tables:
+        return None
+
+    return LongSqlite(path) if POINTS in tables else Sqlite(path)
+
+
+if __name__ == '__main__':
+    main()
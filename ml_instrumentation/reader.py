@@ -1,11 +1,18 @@
 import sqlite3
-from functools import reduce
+from functools import partial, reduce
 from pathlib import Path
 from collections.abc import Iterable
 from typing import Any
 import connectorx as cx
+import numpy as np
+import polars as pl
+import pyarrow as pa
 
 import ml_instrumentation._utils.sqlite as sqlu
+from ml_instrumentation._utils.arrays import ARRAYS, ArraySpec, read_specs
+from ml_instrumentation._utils.strings import CODE, STRINGS
+from ml_instrumentation.backends.sqlite import METRICS, POINTS
+from ml_instrumentation.sketch import merge_sketches
 
 
 def read_to_df(db_path: str | Path, metric: str, ids: Iterable[int] | None = None):
@@ -16,10 +23,40 @@ def read_to_df(db_path: str | Path, metric: str, ids: Iterable[int] | None = Non
         str_ids = map(str, map(sqlu.maybe_quote, ids))
         constraints = f'WHERE id IN ({",".join(str_ids)})'
 
-    query = f'SELECT * FROM {metric} {constraints}'
+    con = sqlite3.connect(db_path)
+    cur = con.cursor()
+    strings = None
+    if POINTS in sqlu.get_tables(cur):
+        cols, query = _long_query(cur, metric, ids)
+    else:
+        types = sqlu.get_col_types(cur, metric)
+        cols = list(types)
+        query = f'SELECT * FROM {metric} {constraints}'
+        if types.get('measurement') == CODE:
+            strings = [r[0] for r in cur.execute(f'SELECT value FROM {STRINGS} WHERE metric=? ORDER BY code', (metric,))]
+
+    spec = _array_spec(cur, metric)
+    con.close()
+
     df = cx.read_sql(f'sqlite://{db_path}', query, partition_on='id', partition_num=1000, return_type='polars')
     df = df.lazy()
-    df = df.rename({'measurement': metric})
+
+    # multi-statistic measurements (e.g. from `Summary`) are already
+    # stored side-by-side, so each field becomes its own column
+    if spec is not None:
+        dtype = pl.Series(np.empty((0, *spec.shape), dtype=spec.dtype)).dtype
+        df = df.with_columns(pl.col('measurement').map_batches(partial(_decode_blobs, spec=spec), return_dtype=dtype))
+
+    # dictionary-encoded strings are read as an enum over the metric's strings
+    if strings is not None:
+        dtype = pl.Enum(strings)
+        df = df.with_columns(pl.col('measurement').map_batches(partial(_decode_codes, dtype=dtype), return_dtype=dtype))
+
+    if 'measurement' in cols:
+        df = df.rename({'measurement': metric})
+    else:
+        df = df.rename({c: f'{metric}_{c}' for c in cols if c not in ('frame', 'id')})
+
     return df
 
 
@@ -35,8 +72,12 @@ def load_all_results(db_path: str | Path, metrics: Iterable[str] | None = None,
     cur = con.cursor()
 
     tables = sqlu.get_tables(cur)
-    if metrics is None:
-        metrics = tables - {'_metadata_'}
+    if metrics is None and POINTS in tables:
+        metrics = {r[0] for r in cur.execute(f'SELECT DISTINCT metric FROM {METRICS}').fetchall()}
+    elif metrics is None:
+        metrics = tables - {'_metadata_', ARRAYS, STRINGS}
+
+    con.close()
 
     df = read_metrics(db_path, metrics, ids)
 
@@ -48,6 +89,92 @@ def load_all_results(db_path: str | Path, metrics: Iterable[str] | None = None,
     return df.join(meta, how='left', on=['id']).collect()
 
 
+def build_indexes(db_path: str | Path):
+    # adds the (id, frame) indexes that make reading a few runs fast
+    # to files written without them, e.g. by older versions
+    con = sqlite3.connect(db_path)
+    cur = con.cursor()
+    tables = sqlu.get_tables(cur)
+    if POINTS not in tables:
+        sqlu.build_indexes(cur, sorted(tables - {'_metadata_', ARRAYS, STRINGS} - sqlu.get_indexed(cur)))
+
+    con.commit()
+    con.close()
+
+
+def read_quantiles(
+    db_path: str | Path,
+    metric: str,
+    quantiles: Iterable[float],
+    ids: Iterable[int] | None = None,
+    by: str | list[str] = 'frame',
+):
+    # merges the sketches stored by a `Sketch` sampler within each group,
+    # e.g. across all runs at every frame, then reads off the quantiles
+    quantiles = list(quantiles)
+    df = read_to_df(db_path, metric, ids).collect()
+
+    rows: list[dict[str, Any]] = []
+    for key, group in df.group_by(by, maintain_order=True):
+        sketch = merge_sketches(group[metric].to_list())
+        assert sketch is not None
+
+        row = dict(zip([by] if isinstance(by, str) else by, key, strict=True))
+        for q, v in zip(quantiles, sketch.quantiles(quantiles), strict=True):
+            row[f'{metric}_{q}'] = v
+
+        rows.append(row)
+
+    return pl.DataFrame(rows).sort(by)
+
+
+def _long_query(cur: sqlite3.Cursor, metric: str, ids: Iterable[int] | None):
+    # reading one metric of the single-table layout is a range scan over its
+    # metric id. Each field of a multi-field measurement has its own metric id,
+    # and rows of different fields are matched up by their shared seq.
+    res = cur.execute(f'SELECT metric_id, field FROM {METRICS} WHERE metric=? ORDER BY metric_id', (metric,)).fetchall()
+    assert res, f'Metric <{metric}> does not exist'
+
+    (first, field), rest = res[0], res[1:]
+    cols = ['frame', 'id', field or 'measurement'] + [f for _, f in rest]
+
+    select = ['p0.frame AS frame', 'p0.id AS id', f'p0.measurement AS {sqlu.quote(cols[2])}']
+    joins = []
+    for j, (mid, f) in enumerate(rest, start=1):
+        select.append(f'p{j}.measurement AS {sqlu.quote(f)}')
+        joins.append(f'JOIN {POINTS} p{j} ON p{j}.metric_id={mid} AND p{j}.id=p0.id AND p{j}.frame=p0.frame AND p{j}.seq=p0.seq')
+
+    query = f'SELECT {", ".join(select)} FROM {POINTS} p0 {" ".join(joins)} WHERE p0.metric_id={first}'
+    if ids is not None:
+        query += f' AND p0.id IN ({",".join(map(str, map(sqlu.maybe_quote, ids)))})'
+
+    return cols, query
+
+
+def _array_spec(cur: sqlite3.Cursor, metric: str):
+    if ARRAYS not in sqlu.get_tables(cur):
+        return None
+
+    res = cur.execute(f'SELECT metric, dtype, shape FROM {ARRAYS} WHERE metric=?', (metric,)).fetchall()
+    return read_specs(res).get(metric)
+
+
+def _decode_blobs(s: pl.Series, spec: ArraySpec):
+    # every blob of a metric has the same size, so the arrow data
+    # buffer is already the stacked array and needs no per-row decoding
+    arr = s.to_arrow(compat_level=pl.CompatLevel.oldest())
+    if isinstance(arr, pa.ChunkedArray):
+        arr = arr.combine_chunks()
+
+    offsets = np.frombuffer(arr.buffers()[1], dtype=np.int64)
+    values = spec.decode_buffer(arr.buffers()[2], int(offsets[arr.offset]), len(arr))
+    return pl.Series(s.name, values)
+
+
+def _decode_codes(s: pl.Series, dtype: pl.Enum):
+    return dtype.categories.gather(s).cast(dtype).alias(s.name)
+
+
 def get_run_ids(db_path: str | Path, params: dict[str, Any]):
     constraints = ' AND '.join(
         f'[{k}]={sqlu.maybe_quote(v)}' for k, v in params.items()
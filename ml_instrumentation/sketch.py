@@ -0,0 +1,188 @@
+import math
+import struct
+import numpy as np
+from collections.abc import Iterable
+
+# alpha, max_bins, zero count, min, max, positive bins, negative bins
+HEADER = struct.Struct('<dIqddII')
+
+# -inf, +inf and nan counts, stored after the bins. Older sketches end at the bins
+TRAILER = struct.Struct('<qqq')
+
+
+# A DDSketch: values are counted in logarithmically sized bins so that any
+# quantile is recovered within a relative error of `alpha`. Sketches with the
+# same `alpha` can be merged exactly, e.g. to combine quantiles across seeds.
+#
+# Memory is bounded by `max_bins` per sign. Past that, the bins closest to
+# zero are collapsed together, which keeps the tails accurate.
+#
+# Infinite values are counted on their own and rank below or above every
+# finite value. NaNs have no rank, so they are only counted in `nan_count`.
+class DDSketch:
+    def __init__(self, alpha: float = 0.01, max_bins: int = 2048):
+        assert 0 < alpha < 1
+        self.alpha = alpha
+        self.max_bins = max_bins
+
+        self._gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self._gamma)
+
+        self._pos: dict[int, int] = {}
+        self._neg: dict[int, int] = {}
+        self._zero = 0
+        self._neg_inf = 0
+        self._pos_inf = 0
+        self._nan = 0
+        self._min = math.inf
+        self._max = -math.inf
+
+    @property
+    def count(self):
+        finite = self._zero + sum(self._pos.values()) + sum(self._neg.values())
+        return finite + self._neg_inf + self._pos_inf
+
+    @property
+    def nan_count(self):
+        return self._nan
+
+    def add(self, v: float):
+        if math.isnan(v):
+            self._nan += 1
+            return
+
+        if v < self._min: self._min = v
+        if v > self._max: self._max = v
+
+        if math.isinf(v):
+            if v > 0:
+                self._pos_inf += 1
+            else:
+                self._neg_inf += 1
+        elif v > 0:
+            _bump(self._pos, math.ceil(math.log(v) / self._log_gamma), 1, self.max_bins)
+        elif v < 0:
+            _bump(self._neg, math.ceil(math.log(-v) / self._log_gamma), 1, self.max_bins)
+        else:
+            self._zero += 1
+
+    def merge(self, other: 'DDSketch'):
+        assert self.alpha == other.alpha, 'Can only merge sketches with the same alpha'
+        for i, c in other._pos.items():
+            _bump(self._pos, i, c, self.max_bins)
+
+        for i, c in other._neg.items():
+            _bump(self._neg, i, c, self.max_bins)
+
+        self._zero += other._zero
+        self._neg_inf += other._neg_inf
+        self._pos_inf += other._pos_inf
+        self._nan += other._nan
+        self._min = min(self._min, other._min)
+        self._max = max(self._max, other._max)
+        return self
+
+    def quantile(self, q: float) -> float:
+        assert 0 <= q <= 1
+        n = self.count
+        if n == 0:
+            return math.nan
+
+        rank = q * (n - 1)
+
+        # walk the bins from the most negative value up to the most positive
+        total = self._neg_inf
+        if total > rank:
+            return -math.inf
+
+        for i in sorted(self._neg, reverse=True):
+            total += self._neg[i]
+            if total > rank:
+                return max(-self._value(i), self._min)
+
+        total += self._zero
+        if total > rank:
+            return 0.
+
+        for i in sorted(self._pos):
+            total += self._pos[i]
+            if total > rank:
+                return min(self._value(i), self._max)
+
+        return self._max
+
+    def quantiles(self, qs: Iterable[float]) -> list[float]:
+        return [self.quantile(q) for q in qs]
+
+    # -------------------
+    # -- Serialization --
+    # -------------------
+    def to_bytes(self) -> bytes:
+        pos_i, pos_c = _arrays(self._pos)
+        neg_i, neg_c = _arrays(self._neg)
+        header = HEADER.pack(self.alpha, self.max_bins, self._zero, self._min, self._max, len(pos_i), len(neg_i))
+        trailer = TRAILER.pack(self._neg_inf, self._pos_inf, self._nan)
+        return b''.join((header, pos_i.tobytes(), pos_c.tobytes(), neg_i.tobytes(), neg_c.tobytes(), trailer))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'DDSketch':
+        alpha, max_bins, zero, lo, hi, n_pos, n_neg = HEADER.unpack_from(data)
+        sketch = cls(alpha, max_bins)
+        sketch._zero = zero
+        sketch._min = lo
+        sketch._max = hi
+
+        off = HEADER.size
+        for store, n in ((sketch._pos, n_pos), (sketch._neg, n_neg)):
+            idx = np.frombuffer(data, dtype='<i4', count=n, offset=off)
+            off += 4 * n
+            counts = np.frombuffer(data, dtype='<u4', count=n, offset=off)
+            off += 4 * n
+            store.update(zip(idx.tolist(), counts.tolist(), strict=True))
+
+        if len(data) >= off + TRAILER.size:
+            sketch._neg_inf, sketch._pos_inf, sketch._nan = TRAILER.unpack_from(data, off)
+
+        return sketch
+
+    # --------------
+    # -- Internal --
+    # --------------
+    def _value(self, i: int):
+        # midpoint of the bin (gamma^(i-1), gamma^i] in relative terms
+        return 2 * self._gamma ** i / (self._gamma + 1)
+
+
+def merge_sketches(data: Iterable[bytes]) -> DDSketch | None:
+    out: DDSketch | None = None
+    for d in data:
+        sketch = DDSketch.from_bytes(d)
+        out = sketch if out is None else out.merge(sketch)
+
+    return out
+
+
+# ---------------
+# -- Utilities --
+# ---------------
+def _bump(store: dict[int, int], i: int, c: int, max_bins: int):
+    if i in store:
+        store[i] += c
+        return
+
+    store[i] = c
+    if len(store) > max_bins:
+        _collapse(store, max_bins)
+
+
+def _collapse(store: dict[int, int], max_bins: int):
+    keys = sorted(store)
+    extra = len(keys) - max_bins
+    total = sum(store.pop(k) for k in keys[:extra])
+    store[keys[extra]] += total
+
+
+def _arrays(store: dict[int, int]):
+    idx = np.fromiter(store.keys(), dtype='<i4', count=len(store))
+    counts = np.fromiter(store.values(), dtype='<u4', count=len(store))
+    return idx, counts
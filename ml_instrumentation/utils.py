@@ -1,10 +1,24 @@
+import numpy as np
 from collections.abc import Callable
-from ml_instrumentation.Sampler import Sampler
+from typing import Any
+from ml_instrumentation.Sampler import Batch, Framed, FramedSampler, Identity, LogSubsample, Sampler, Subsample
+
+# stages that pass values through unchanged, so whether the value is
+# kept also depends on the stages after them
+_FILTERS = (Identity, Subsample, LogSubsample)
+
+# stands in for a value that no stage will use
+_SKIPPED = object()
 
 class Pipe(Sampler):
     def __init__(self, *args: Sampler) -> None:
+        assert not any(isinstance(sub, FramedSampler) for sub in args[:-1]), 'Only the last stage can be a framed sampler'
         self._subs = args
 
+        # a framed last stage makes the whole pipe framed
+        self.framed = isinstance(args[-1], FramedSampler)
+        self._frame = -1
+
     def next(self, v: float) -> float | None:
         out: float | None = v
         for sub in self._subs:
@@ -15,6 +29,12 @@ class Pipe(Sampler):
         return out
 
     def next_eval(self, c: Callable[[], float]) -> float | None:
+        # a later stage would drop the value, so keep the clocks
+        # moving with a placeholder instead of evaluating it
+        if not self.will_emit():
+            self.next(_SKIPPED)  # type: ignore
+            return None
+
         subs = iter(self._subs)
         first = next(subs)
         out = first.next_eval(c)
@@ -26,5 +46,115 @@ class Pipe(Sampler):
 
         return out
 
+    def will_emit(self):
+        for sub in self._subs:
+            if not sub.will_emit():
+                return False
+
+            if not isinstance(sub, _FILTERS):
+                return True
+
+        return True
+
+    def next_many(self, v: np.ndarray):
+        # each stage only sees what the previous stage emitted,
+        # so map the offsets back to the original inputs as we go
+        out = v
+        offsets = np.arange(len(v), dtype=np.int64)
+        for sub in self._subs:
+            out, idx = sub.next_many(out)
+            offsets = offsets[idx]
+
+        return out, offsets
+
+    def vectorize(self):
+        # the per-experiment copies would buffer `Framed` outputs as measurements
+        if self.framed:
+            raise TypeError('Framed samplers cannot be used with `collect_vector`')
+
+        return super().vectorize()
+
     def end(self):
-        return None
+        out = _drain(self._subs)
+        if not out:
+            return None
+
+        if len(out) == 1:
+            return out[0]
+
+        return Batch(out)
+
+    # ------------------
+    # -- Framed pipes --
+    # ------------------
+    def next_at(self, v: float, frame: int) -> Framed | None:
+        self._frame = frame
+        out: Any = v
+        for sub in self._subs[:-1]:
+            out = sub.next(out)
+            if out is None:
+                return None
+
+        return self._last().next_at(out, frame)
+
+    def next_eval_at(self, c: Callable[[], float], frame: int) -> Framed | None:
+        if not self.will_emit():
+            return self.next_at(_SKIPPED, frame)  # type: ignore
+
+        return self.next_at(c(), frame)
+
+    def next_many_at(self, v: np.ndarray, frames: np.ndarray) -> Framed | None:
+        out = v
+        frames = np.asarray(frames)
+        offsets = np.arange(len(v), dtype=np.int64)
+        for sub in self._subs[:-1]:
+            out, idx = sub.next_many(out)
+            offsets = offsets[idx]
+
+        if len(frames):
+            self._frame = int(frames[-1])
+
+        return self._last().next_many_at(out, frames[offsets])
+
+    def end_at(self) -> Framed | None:
+        # values held by earlier stages are given the last frame seen
+        last = self._last()
+        out = Framed([], [])
+        for v in _drain(self._subs[:-1]):
+            _extend(out, last.next_at(v, self._frame))
+
+        _extend(out, last.end_at())
+        return out if out.values else None
+
+    def _last(self) -> FramedSampler:
+        last = self._subs[-1]
+        assert isinstance(last, FramedSampler)
+        return last
+
+
+def _drain(subs: tuple[Sampler, ...]) -> list[Any]:
+    # values still held by earlier stages are pushed through the
+    # later stages before those are ended in turn
+    out: list[Any] = []
+    for sub in subs:
+        nxt: list[Any] = []
+        for v in out:
+            y = sub.next(v)
+            if y is not None:
+                nxt.append(y)
+
+        last = sub.end()
+        if isinstance(last, Batch):
+            nxt.extend(last)
+        elif last is not None:
+            nxt.append(last)
+
+        out = nxt
+
+    return out
+
+
+def _extend(out: Framed, more: Framed | None):
+    if more is not None:
+        out.frames.extend(more.frames)
+        out.values.extend(more.values)
@@ -1,5 +1,8 @@
+import time
+import sqlite3
 import pytest
 from ml_instrumentation.Writer import Writer
+from ml_instrumentation.backends.base import Columns
 from ml_instrumentation.backends.sqlite import Sqlite
 
 @pytest.fixture
@@ -11,3 +14,26 @@ def writer():
     )
     yield writer
     writer.close()
+
+
+class SlowSqlite(Sqlite):
+    def __init__(self, path: str, delay: float, per_point: float = 0.):
+        super().__init__(path)
+        self._delay = delay
+        self._per_point = per_point
+
+    def write_many(self, points: dict[str, Columns]):
+        n = sum(len(cols) for cols in points.values())
+        time.sleep(self._delay + n * self._per_point)
+        super().write_many(points)
+
+
+class SlowCommitSqlite(Sqlite):
+    # rows are inserted right away but only committed after `delay`
+    def __init__(self, path: str, delay: float):
+        super().__init__(path)
+        self._delay = delay
+
+    def _write_many(self, cur: sqlite3.Cursor, m: str, cols: Columns):
+        super()._write_many(cur, m, cols)
+        time.sleep(self._delay)
@@ -1,5 +1,11 @@
 import pickle
+import sqlite3
+import numpy as np
+import pytest
+from pathlib import Path
 from ml_instrumentation.Collector import Collector
+from ml_instrumentation.Sampler import LTTB, Ignore, LogSubsample, MinMax, MovingAverage, Reservoir, Subsample, Summary, Window
+from ml_instrumentation.utils import Pipe
 from ml_instrumentation.Writer import SqlPoint
 
 def test_collector_rw1(basic_collector: Collector):
@@ -62,3 +68,325 @@ def test_collector_serde(basic_collector: Collector):
     ]
 
     collector2.close()
+
+
+def test_collector_collect_many1(basic_collector: Collector):
+    basic_collector.set_experiment_id(0)
+
+    basic_collector.collect_many({'m1': 0, 'm2': 'a', 'm3': 1})
+    basic_collector.next_frame()
+    basic_collector.collect_many({'m1': 1})
+
+    assert basic_collector.get('m1', 0) == [
+        SqlPoint(frame=0, id=0, measurement=0),
+        SqlPoint(frame=1, id=0, measurement=1),
+    ]
+
+    assert basic_collector.get('m2', 0) == [
+        SqlPoint(frame=0, id=0, measurement='a'),
+    ]
+
+    # m3 falls through to the default Ignore sampler
+    assert basic_collector.keys() == {'m1', 'm2'}
+
+
+def test_collector_collect_array1(basic_collector: Collector):
+    basic_collector.set_experiment_id(0)
+
+    basic_collector.collect_array('m1', [0.5, 1.5, 2.5], [10, 11, 12])
+    basic_collector.collect_array('m3', [0.5, 1.5, 2.5], [10, 11, 12])
+
+    assert basic_collector.get('m1', 0) == [
+        SqlPoint(frame=10, id=0, measurement=0.5),
+        SqlPoint(frame=11, id=0, measurement=1.5),
+        SqlPoint(frame=12, id=0, measurement=2.5),
+    ]
+
+    assert basic_collector.keys() == {'m1'}
+
+
+def test_collector_collect_array2():
+    collector = Collector(config={'q': Window(2)}, experiment_id=0)
+
+    # one array-valued measurement per frame
+    q = np.arange(12, dtype=np.float64).reshape(4, 3)
+    collector.collect_array('raw', q, [0, 1, 2, 3])
+    collector.collect_array('q', q, [0, 1, 2, 3])
+    collector._writer.sync_now()
+
+    raw = collector.get('raw', 0)
+    assert [p.frame for p in raw] == [0, 1, 2, 3]
+    assert np.array_equal(np.stack([p.measurement for p in raw]), q)
+
+    # windows are averaged element-wise
+    windowed = collector.get('q', 0)
+    assert [p.frame for p in windowed] == [1, 3]
+    assert np.array_equal(np.stack([p.measurement for p in windowed]), [q[:2].mean(axis=0), q[2:].mean(axis=0)])
+    collector.close()
+
+
+def test_collector_metric_handle1(basic_collector: Collector):
+    m1 = basic_collector.metric('m1')
+    m3 = basic_collector.metric('m3')
+
+    basic_collector.set_experiment_id(0)
+    m1(0)
+    m3(0)
+    basic_collector.next_frame()
+    m1.evaluate(lambda: 1)
+
+    # handles follow experiment id changes made on the collector
+    basic_collector.set_experiment_id(1)
+    m1(2)
+
+    assert basic_collector.get('m1', 0) == [
+        SqlPoint(frame=0, id=0, measurement=0),
+        SqlPoint(frame=1, id=0, measurement=1),
+    ]
+
+    assert basic_collector.get('m1', 1) == [
+        SqlPoint(frame=0, id=1, measurement=2),
+    ]
+
+    assert basic_collector.get('m3', 0) == []
+    assert basic_collector.keys() == {'m1'}
+
+
+def test_collector_collect_vector1():
+    collector = Collector(
+        config={
+            'm1': Window(2),
+            'm2': MovingAverage(0.5),
+        },
+    )
+
+    for t in range(3):
+        collector.next_frame()
+        collector.collect_vector('m1', np.array([t, 10. * t]), [0, 1])
+        collector.collect_vector('m2', np.array([t, 10. * t]), [0, 1])
+        collector.collect_vector('m3', np.array([t]), [1])
+
+    collector.reset()
+
+    assert collector.get('m1', 0) == [
+        SqlPoint(frame=1, id=0, measurement=0.5),
+        SqlPoint(frame=3, id=0, measurement=2.0),
+    ]
+    assert collector.get('m1', 1) == [
+        SqlPoint(frame=1, id=1, measurement=5.0),
+        SqlPoint(frame=3, id=1, measurement=20.0),
+    ]
+    assert collector.get('m2', 1) == [
+        SqlPoint(frame=0, id=1, measurement=0.0),
+        SqlPoint(frame=1, id=1, measurement=5.0),
+        SqlPoint(frame=2, id=1, measurement=12.5),
+    ]
+    assert collector.get('m3', 1) == [
+        SqlPoint(frame=t, id=1, measurement=t) for t in range(3)
+    ]
+
+    collector.close()
+
+
+def test_collector_incremental_checkpoint1(tmp_path: Path):
+    collector = Collector(
+        checkpoint_path=str(tmp_path / 'chk'),
+        experiment_id=0,
+    )
+
+    collector.collect('m1', 0)
+    collector.next_frame()
+    collector.collect('m1', 1)
+    byts1 = pickle.dumps(collector)
+
+    collector.next_frame()
+    collector.collect('m1', 2)
+    collector.collect('m2', 'a')
+    byts2 = pickle.dumps(collector)
+
+    # the second delta only holds the rows added since the first
+    con = sqlite3.connect(tmp_path / 'chk.1.delta')
+    assert con.execute('SELECT * FROM m1').fetchall() == [(2, 0, 2)]
+    con.close()
+
+    c1: Collector = pickle.loads(byts1)
+    assert c1.get('m1', 0) == [
+        SqlPoint(frame=0, id=0, measurement=0),
+        SqlPoint(frame=1, id=0, measurement=1),
+    ]
+
+    c2: Collector = pickle.loads(byts2)
+    assert c2.get('m1', 0) == [
+        SqlPoint(frame=0, id=0, measurement=0),
+        SqlPoint(frame=1, id=0, measurement=1),
+        SqlPoint(frame=2, id=0, measurement=2),
+    ]
+    assert c2.get('m2', 0) == [
+        SqlPoint(frame=2, id=0, measurement='a'),
+    ]
+
+    collector.close()
+    c1.close()
+    c2.close()
+
+
+def test_collector_serde_watermarks1():
+    collector = Collector(
+        experiment_id=0,
+        low_watermark=123,
+        high_watermark=4_567,
+    )
+    collector.collect('m1', 0)
+
+    collector2: Collector = pickle.loads(pickle.dumps(collector))
+    assert collector2._writer._lw == 123
+    assert collector2._writer._hw == 4_567
+
+    collector.close()
+    collector2.close()
+
+
+def test_reservoir_reset1():
+    collector = Collector(
+        config={
+            'a': Pipe(Window(10), Reservoir(5, seed=0)),
+            'b': LogSubsample(1.5),
+        },
+    )
+
+    for seed in range(2):
+        collector.set_experiment_id(seed)
+        for i in range(1_000):
+            collector.next_frame()
+            collector.collect('a', i)
+            collector.collect('b', i)
+
+        collector.reset()
+
+    points = collector.get('a', 1)
+    assert len(points) == 5
+    assert all(p.frame == 1_000 for p in points)
+    assert all(p.measurement['value'] == 10 * p.measurement['index'] + 4.5 for p in points)
+
+    points = collector.get('b', 0)
+    assert [p.frame for p in points][:6] == [0, 1, 2, 3, 5, 8]
+
+    collector.close()
+
+
+def test_framed_samplers1():
+    collector = Collector(
+        config={
+            'a': LTTB(100, 10),
+            'b': MinMax(100, 5),
+        },
+        experiment_id=0,
+    )
+
+    v = np.sin(np.linspace(0, 10, 1_000))
+    v[500] = 10.
+    for i in range(1_000):
+        collector.next_frame()
+        collector.collect('a', float(v[i]))
+        collector.metric('b')(float(v[i]))
+
+    collector.reset()
+
+    # values are stored on the frames they were collected on
+    for metric in ('a', 'b'):
+        points = collector.get(metric, 0)
+        assert len(points) <= 100
+        assert all(p.measurement == v[p.frame] for p in points)
+        assert any(p.frame == 500 for p in points)
+
+    # frames given to collect_array are kept as well
+    collector.set_experiment_id(1)
+    collector.collect_array('a', v[:150].tolist(), list(range(0, 300, 2)))
+    collector.reset()
+
+    points = collector.get('a', 1)
+    assert [p.frame for p in points][:2] == [0, 22]
+    assert points[-1].frame == 298
+    assert len(points) == 20
+
+    collector.close()
+
+
+def test_framed_samplers_vector1():
+    collector = Collector(
+        config={
+            'a': LTTB(10, 3),
+            'b': Pipe(Window(2), LTTB(10, 3)),
+        },
+    )
+
+    # framed samplers need the frame of every value, so they are rejected up front
+    collector.next_frame()
+    ids = np.arange(4)
+    for metric in ('a', 'b'):
+        with pytest.raises(TypeError):
+            collector.collect_vector(metric, np.ones(4), ids)
+
+    collector.close()
+
+
+def test_reservoir_vector1():
+    collector = Collector(
+        config={
+            'a': Reservoir(3, seed=0),
+        },
+    )
+
+    ids = np.arange(4)
+    for _ in range(50):
+        collector.next_frame()
+        collector.collect_vector('a', np.ones(4), ids)
+
+    collector.reset()
+    for i in range(4):
+        assert len(collector.get('a', i)) == 3
+
+    collector.close()
+
+
+def test_will_record1():
+    collector = Collector(
+        config={
+            'a': Subsample(10),
+            'b': Ignore(),
+        },
+        experiment_id=0,
+    )
+
+    computed = 0
+    for i in range(100):
+        collector.next_frame()
+        assert not collector.will_record('b')
+
+        if collector.will_record('a'):
+            computed += 1
+            collector.collect('a', i)
+        else:
+            collector.skip('a')
+
+    assert computed == 10
+    assert [p.frame for p in collector.get('a', 0)] == list(range(0, 100, 10))
+    collector.close()
+
+
+def test_collector_summary_single1():
+    collector = Collector(config={'s': Summary(2, stats=['mean'])}, experiment_id=0)
+    for i in range(4):
+        collector.next_frame()
+        collector.collect('s', float(i))
+
+    # a single statistic reads back as a dict, whether buffered or flushed
+    expected = [
+        SqlPoint(frame=1, id=0, measurement={'mean': 0.5}),
+        SqlPoint(frame=3, id=0, measurement={'mean': 2.5}),
+    ]
+    assert collector.get('s', 0) == expected
+
+    collector._writer.sync_now()
+    assert collector.get('s', 0) == expected
+    collector.close()
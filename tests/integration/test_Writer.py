@@ -1,10 +1,20 @@
+import gc
+import pickle
 import sqlite3
+import time
+import weakref
+import numpy as np
+import pytest
 from functools import partial
 from pathlib import Path
 from ml_instrumentation.Writer import Point, SqlPoint, Writer
 from multiprocessing.pool import Pool
 
-from ml_instrumentation.backends.sqlite import Sqlite
+from ml_instrumentation.ProcessWriter import ProcessWriter
+from ml_instrumentation.Backpressure import Backpressure, Block, Downsample, DropOldest, Spill
+from ml_instrumentation.backends.base import Columns
+from ml_instrumentation.backends.sqlite import LongSqlite, Sqlite
+from tests.fixtures.writer import SlowCommitSqlite, SlowSqlite
 
 def test_write1(writer: Writer):
     d = Point(
@@ -96,6 +106,177 @@ def test_merge1(tmp_path: Path):
     w2.close()
 
 
+def test_string_dict_rollback1():
+    backend = Sqlite(':memory:')
+
+    cols = Columns()
+    cols.extend([0] * 4, [0, 1, 2, 3], ['a', 'b', 'a', 'b'])
+    backend.write_many({'phase': cols})
+
+    # a failed write does not leave new codes behind, nor a decoded table
+    bad = Columns()
+    bad.extend([0, 0], [4, 5], ['c', object()])
+    with pytest.raises(sqlite3.ProgrammingError):
+        backend.write_many({'phase': bad})
+
+    assert backend._strings['phase'].values == ['a', 'b']
+
+    cols = Columns()
+    cols.extend([0, 0], [4, 5], ['c', None])
+    backend.write_many({'phase': cols})
+    assert [p.measurement for p in backend.read_metric('phase')] == ['a', 'b', 'a', 'b', 'c', None]
+    backend.close()
+
+
+def test_string_dict_mixed1(tmp_path: Path):
+    writer = Writer(backend=Sqlite(tmp_path / 'w.db'))
+    writer.write(Point(exp_id=0, metric='status', frame=0, data='ok'))
+    writer.sync_now()
+
+    # a metric that starts out as strings can still hold other values
+    writer.write(Point(exp_id=0, metric='status', frame=1, data=5))
+    writer.write(Point(exp_id=0, metric='status', frame=2, data='ok'))
+    writer.sync_now()
+
+    assert [p.measurement for p in writer.read_metric('status')] == ['ok', 5, 'ok']
+    writer.close()
+
+    con = sqlite3.connect(tmp_path / 'w.db')
+    assert con.execute('SELECT measurement FROM status').fetchall() == [('ok',), (5,), ('ok',)]
+    assert con.execute('SELECT COUNT(*) FROM _strings_').fetchone() == (0,)
+    con.close()
+
+
+def test_column_types_mixed1(tmp_path: Path):
+    writer = Writer(backend=Sqlite(tmp_path / 'w.db'))
+    writer.write(Point(exp_id=0, metric='status', frame=0, data='start'))
+    writer.write(Point(exp_id=0, metric='n', frame=0, data=1))
+    writer.write(Point(exp_id=0, metric='stats', frame=0, data={'a': 1, 'b': 'x'}))
+    writer.write(Point(exp_id=0, metric='x', frame=0, data=0.5))
+    writer.write(Point(exp_id=0, metric='x', frame=1, data=7))
+    writer.sync_now()
+
+    # later values that do not fit the inferred type are kept as written
+    writer.write(Point(exp_id=0, metric='status', frame=1, data=5))
+    writer.write(Point(exp_id=0, metric='n', frame=1, data=2.0))
+    writer.write(Point(exp_id=0, metric='stats', frame=1, data={'a': 2.5, 'b': 'y'}))
+    writer.sync_now()
+
+    writer.write(Point(exp_id=0, metric='n', frame=2, data=3))
+    writer.sync_now()
+
+    values = [p.measurement for p in writer.read_metric('status')]
+    assert values == ['start', 5] and isinstance(values[1], int)
+
+    values = [p.measurement for p in writer.read_metric('n')]
+    assert values == [1, 2.0, 3] and [type(v) for v in values] == [int, float, int]
+
+    values = [p.measurement['a'] for p in writer.read_metric('stats')]
+    assert [type(v) for v in values] == [int, float]
+
+    values = [p.measurement for p in writer.read_metric('x')]
+    assert values == [0.5, 7] and [type(v) for v in values] == [float, int]
+    writer.close()
+
+
+def test_long_layout1(tmp_path: Path):
+    writer = Writer(backend=LongSqlite(tmp_path / 'w.db'), low_watermark=7)
+    for i in range(20):
+        writer.write(Point(exp_id=i % 2, metric='a', frame=i // 2, data=i))
+        writer.write(Point(exp_id=0, metric='b', frame=0, data={'mean': i, 'max': 2 * i}))
+
+    # reads merge what is stored with what is still buffered
+    assert writer.read_metric('a', 1) == [SqlPoint(i // 2, 1, i) for i in range(1, 20, 2)]
+
+    writer.sync_now()
+    assert writer.metrics() == {'a', 'b'}
+
+    # several rows can share a frame, and are read back in the order written
+    points = writer.read_metric('b')
+    assert points == [SqlPoint(0, 0, {'mean': i, 'max': 2 * i}) for i in range(20)]
+
+    # metric names are interned, everything lives in two tables
+    con = sqlite3.connect(tmp_path / 'w.db')
+    tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert tables == {'_metrics_', '_points_'}
+    con.close()
+
+    writer.close()
+
+    backend = LongSqlite(tmp_path / 'w.db')
+    backend.init_db()
+    assert backend.get_tables() == {'a', 'b'}
+    assert backend.get_marks(['a', 'b', 'c']) == {'a': 20, 'b': 20, 'c': 0}
+    assert backend.read_metric('a', 0, until=6) == [SqlPoint(i // 2, 0, i) for i in range(0, 12, 2)][:3]
+    backend.close()
+
+
+def test_long_merge1(tmp_path: Path):
+    for i in range(3):
+        writer = Writer(backend=LongSqlite(tmp_path / f'w{i}.db'))
+        for j in range(10):
+            writer.write(Point(exp_id=i, metric=['a', 'b', 'c'][(i + j) % 3], frame=j, data=j))
+
+        writer.merge(str(tmp_path / 'total.db'))
+
+        # merging the same rows again keeps both copies, as the per-table layout does
+        if i == 0:
+            writer.merge(str(tmp_path / 'total.db'))
+
+        writer.close()
+
+    backend = LongSqlite(tmp_path / 'total.db')
+    backend.init_db()
+    assert backend.get_tables() == {'a', 'b', 'c'}
+    assert len(backend.read_metric('a', 0)) == 2 * 4
+    assert backend.read_metric('a', 1) == [SqlPoint(j, 1, j) for j in range(2, 10, 3)]
+    assert backend.read_metric('c', 2) == [SqlPoint(j, 2, j) for j in range(0, 10, 3)]
+    backend.close()
+
+    # the two layouts cannot be mixed in one file
+    writer = Writer(backend=Sqlite(tmp_path / 'w.db'))
+    writer.write(Point(exp_id=0, metric='a', frame=0, data=0))
+    with pytest.raises(ValueError):
+        writer.merge(str(tmp_path / 'total.db'))
+
+    writer.close()
+
+
+def test_indexes1(tmp_path: Path):
+    def _indexes(path: Path):
+        con = sqlite3.connect(path)
+        res = con.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall()
+        con.close()
+        return {r[0] for r in res}
+
+    writer = Writer(backend=Sqlite(tmp_path / 'w.db'))
+    for i in range(100):
+        writer.write(Point(exp_id=i % 10, metric='a', frame=i, data=i))
+
+    # nothing is indexed while ingesting
+    writer.sync_now()
+    assert _indexes(tmp_path / 'w.db') == set()
+
+    writer.merge(str(tmp_path / 'total.db'))
+    assert _indexes(tmp_path / 'total.db') == {'_idx_a'}
+
+    # indexes are built in bulk when closing
+    writer.close()
+    assert _indexes(tmp_path / 'w.db') == {'_idx_a'}
+
+    backend = Sqlite(tmp_path / 'w.db')
+    backend.init_db()
+    assert backend._indexed == {'a'}
+
+    # reading a single run uses the index
+    cur = backend._con.cursor()
+    cur.row_factory = None
+    plan = cur.execute('EXPLAIN QUERY PLAN SELECT * FROM "a" WHERE id=3').fetchall()
+    assert any('_idx_a' in r[-1] for r in plan)
+    assert backend.read_metric('a', 3) == [SqlPoint(i, 3, i) for i in range(3, 100, 10)]
+    backend.close()
+
+
 def test_merge_parallel1(tmp_path: Path):
     pool = Pool(10)
     pool.map(partial(_test_merge_parallel1, tmp_path=tmp_path), range(20))
@@ -129,3 +310,309 @@ def _test_merge_parallel1(i: int, tmp_path: Path):
         writer.write(Point(exp_id=i, metric='b', frame=j, data=f'{j} - {i}'))
 
     writer.merge(str(tmp_path / 'total.db'))
+
+
+@pytest.mark.parametrize('profile', ['default', 'safe', 'fast', 'unsafe'])
+def test_sqlite_profiles1(profile: str, tmp_path: Path):
+    backend = Sqlite(tmp_path / 'w.db', profile=profile)
+    writer = Writer(backend=backend)
+    for i in range(10):
+        writer.write(Point(exp_id=0, metric='a', frame=i, data=i))
+
+    writer.sync_now()
+    cur = backend._con.cursor()
+    cur.row_factory = None
+    mode = cur.execute('PRAGMA journal_mode').fetchone()[0]
+    assert mode == {'default': 'delete', 'safe': 'delete', 'fast': 'wal', 'unsafe': 'memory'}[profile]
+
+    # the profile is kept when the backend is sent to another process
+    other = pickle.loads(pickle.dumps(backend))
+    assert other._profile == profile
+    other.init_db()
+    assert other.read_metric('a') == [SqlPoint(i, 0, i) for i in range(10)]
+
+    other.close()
+    writer.close()
+
+
+def test_write_many_rollback1():
+    backend = Sqlite(':memory:')
+
+    good = Columns()
+    good.extend([0, 0], [0, 1], [1., 2.])
+    bad = Columns()
+    bad.extend([0, 0], [0, 1], [np.zeros(2), np.zeros(3)])
+
+    # a failure part way through leaves nothing behind
+    with pytest.raises(ValueError):
+        backend.write_many({'a': good, 'b': bad})
+
+    assert backend.get_tables() == set()
+    assert backend.read_metric('a') == []
+
+    backend.write_many({'a': good})
+    assert backend.read_metric('a') == [SqlPoint(0, 0, 1.), SqlPoint(1, 0, 2.)]
+    backend.close()
+
+
+def test_dump_load1(writer: Writer):
+    for i in range(10):
+        writer.write(Point(exp_id=0, metric='a', frame=i, data=i))
+
+    data = writer.dump()
+    assert isinstance(data, bytes)
+
+    w2 = Writer(backend=Sqlite(':memory:'))
+    w2.load(data)
+    assert w2.read_metric('a') == [SqlPoint(i, 0, i) for i in range(10)]
+    assert w2.metrics() == {'a'}
+    w2.close()
+
+
+def test_load_text_dump1():
+    # snapshots from older versions were stored as SQL text
+    con = sqlite3.connect(':memory:')
+    con.execute('CREATE TABLE "a"(frame INTEGER ASC, id, measurement)')
+    con.executemany('INSERT INTO "a" VALUES (?,?,?)', [(i, 0, i) for i in range(10)])
+    con.commit()
+    data = ''.join(con.iterdump())
+
+    writer = Writer(backend=Sqlite(':memory:'))
+    writer.load(data)
+    assert writer.read_metric('a') == [SqlPoint(i, 0, i) for i in range(10)]
+    writer.close()
+
+
+def _fill_slow_writer(backpressure: Backpressure):
+    writer = Writer(
+        backend=SlowSqlite(':memory:', delay=0.05),
+        low_watermark=10,
+        high_watermark=20,
+        backpressure=backpressure,
+    )
+
+    for i in range(100):
+        writer.write(Point(exp_id=0, metric='a', frame=i, data=i))
+
+    points = writer.read_metric('a')
+    writer.close()
+    return points
+
+
+def test_backpressure_block1():
+    policy = Block()
+    points = _fill_slow_writer(policy)
+
+    assert points == [SqlPoint(i, 0, i) for i in range(100)]
+    assert policy.blocked > 0
+    assert policy.blocked_time > 0
+
+
+def test_backpressure_spill1(tmp_path: Path):
+    policy = Spill(dir=str(tmp_path))
+    points = _fill_slow_writer(policy)
+
+    # no data is lost, just delayed
+    assert points == [SqlPoint(i, 0, i) for i in range(100)]
+    assert policy.spills > 0
+    assert policy.spilled_points > 0
+    assert list(tmp_path.glob('*.spill')) == []
+
+
+def test_backpressure_downsample1():
+    policy = Downsample(factor=2)
+    points = _fill_slow_writer(policy)
+
+    assert policy.downsampled > 0
+    assert len(points) == 100 - policy.dropped
+    assert [p.frame for p in points] == sorted(p.frame for p in points)
+
+
+def test_backpressure_drop_oldest1():
+    policy = DropOldest()
+    points = _fill_slow_writer(policy)
+
+    assert policy.drops > 0
+    assert len(points) == 100 - policy.dropped
+    assert points[-1] == SqlPoint(99, 0, 99)
+
+
+def test_process_writer1(tmp_path: Path):
+    writer = ProcessWriter(
+        backend=Sqlite(tmp_path / 'w.db'),
+        low_watermark=10,
+        high_watermark=20,
+        capacity=50,
+    )
+
+    for i in range(200):
+        writer.write(Point(exp_id=0, metric='a', frame=i, data=i * 0.5))
+        writer.write(Point(exp_id=0, metric='b', frame=i, data=i))
+        writer.write(Point(exp_id=0, metric='c', frame=i, data=f'{i}'))
+
+    assert writer.read_metric('a') == [SqlPoint(i, 0, i * 0.5) for i in range(200)]
+    assert writer.read_metric('b') == [SqlPoint(i, 0, i) for i in range(200)]
+    assert writer.read_metric('c') == [SqlPoint(i, 0, f'{i}') for i in range(200)]
+    assert writer.metrics() == {'a', 'b', 'c'}
+
+    # the child is the only writer, even for the strings
+    assert writer._write_future is None
+    writer.close()
+
+
+def test_process_writer_crash1(tmp_path: Path):
+    writer = ProcessWriter(
+        backend=Sqlite(tmp_path / 'w.db'),
+        low_watermark=10,
+        high_watermark=20,
+        capacity=50,
+    )
+
+    for i in range(100):
+        writer.write(Point(exp_id=0, metric='a', frame=i, data=i))
+        writer.write(Point(exp_id=0, metric='c', frame=i, data=f'{i}'))
+
+    writer._proc.kill()
+    writer._proc.join()
+
+    # the writer keeps working in-process and nothing is lost or duplicated
+    for i in range(100, 200):
+        writer.write(Point(exp_id=0, metric='a', frame=i, data=i))
+        writer.write(Point(exp_id=0, metric='c', frame=i, data=f'{i}'))
+
+    assert writer.read_metric('a') == [SqlPoint(i, 0, i) for i in range(200)]
+    assert writer.read_metric('c') == [SqlPoint(i, 0, f'{i}') for i in range(200)]
+    writer.close()
+
+
+def test_stats1(writer: Writer):
+    for i in range(10):
+        writer.write(Point(exp_id=0, metric='a', frame=i, data=i))
+        writer.write(Point(exp_id=0, metric='b', frame=i, data='hi'))
+
+    writer.sync_now()
+    stats = writer.stats()
+
+    assert stats['buffered'] == {'a': 10, 'b': 10}
+    assert stats['flushed'] == {'a': 10, 'b': 10}
+    assert stats['pending'] == 0
+    assert stats['bytes_written'] == 10 * (8 + 8 + 8) + 10 * (8 + 8 + 2)
+    assert sum(stats['flush_latency']['counts']) > 0
+
+
+def test_stats_blocked1():
+    writer = Writer(
+        backend=SlowSqlite(':memory:', delay=0.05),
+        low_watermark=10,
+        high_watermark=20,
+    )
+
+    for i in range(100):
+        writer.write(Point(exp_id=0, metric='a', frame=i, data=i))
+
+    stats = writer.stats()
+    assert stats['blocked'] > 0
+    assert stats['blocked_time'] > 0
+    assert stats['skipped_syncs'] > 0
+    assert stats['backpressure']['blocked'] == stats['blocked']
+    writer.close()
+
+
+def test_adaptive_watermarks1():
+    # ~1ms fixed overhead + 10us per point: flushing ~5k points hits the 50ms target
+    writer = Writer(
+        backend=SlowSqlite(':memory:', delay=0.001, per_point=1e-5),
+        low_watermark=10,
+        high_watermark=20,
+        adaptive=True,
+        target_latency=0.05,
+    )
+
+    for i in range(20_000):
+        writer.write(Point(exp_id=0, metric='a', frame=i, data=i))
+
+    writer.sync_now()
+    stats = writer.stats()
+    assert 1_000 < stats['low_watermark'] < 10_000
+    assert stats['high_watermark'] >= 4 * stats['low_watermark']
+    assert len(writer.read_metric('a')) == 20_000
+    writer.close()
+
+
+def test_flush_interval1():
+    writer = Writer(
+        backend=Sqlite(':memory:'),
+        low_watermark=1_000,
+        high_watermark=10_000,
+        flush_interval=0.01,
+    )
+
+    # well under the low watermark, and nothing else is ever written
+    writer.write(Point(exp_id=0, metric='a', frame=0, data=0))
+    time.sleep(0.05)
+
+    assert writer._i == 0
+    assert writer._write_future is not None
+    writer._write_future.result()
+    assert writer.stats()['flushed'] == {'a': 1}
+
+    # a buffer written while a flush is in flight is picked up by a later tick
+    writer.write(Point(exp_id=0, metric='a', frame=1, data=1))
+    time.sleep(0.05)
+    writer._write_future.result()
+    assert writer.stats()['flushed'] == {'a': 2}
+    writer.close()
+
+
+def test_flush_interval_unclosed1():
+    writer = Writer(backend=Sqlite(':memory:'), flush_interval=0.01)
+    writer.write(Point(exp_id=0, metric='a', frame=0, data=0))
+    time.sleep(0.05)
+
+    # the timer does not keep a writer that was never closed alive
+    ref = weakref.ref(writer)
+    timer = writer._timer
+    assert timer is not None
+    del writer
+
+    for _ in range(100):
+        gc.collect()
+        if ref() is None:
+            break
+        time.sleep(0.01)
+
+    assert ref() is None
+    timer.join(timeout=1)
+    assert not timer.is_alive()
+
+
+def test_read_your_writes1():
+    writer = Writer(
+        backend=SlowCommitSqlite(':memory:', delay=0.2),
+        low_watermark=10,
+        high_watermark=1_000,
+    )
+
+    for i in range(15):
+        writer.write(Point(exp_id=i % 2, metric='a', frame=i, data=i))
+
+    # the first flush is still in flight and a few points are buffered
+    assert writer._write_future is not None
+    time.sleep(0.05)
+    assert not writer._write_future.done()
+    assert writer._i > 0
+
+    start = time.perf_counter()
+    points = writer.read_metric('a')
+    assert time.perf_counter() - start < 0.1
+    assert [p.frame for p in points] == list(range(15))
+
+    points = writer.read_metric('a', exp_id=1)
+    assert [p.frame for p in points] == list(range(1, 15, 2))
+
+    # reads do not flush the buffer
+    assert writer._i > 0
+
+    writer.sync_now()
+    assert [p.frame for p in writer.read_metric('a')] == list(range(15))
+    writer.close()
@@ -1,7 +1,9 @@
 from functools import partial
 import jax
 import jax.experimental
+from ml_instrumentation.Accumulator import Accumulator, AccumulatorState
 from ml_instrumentation.Collector import Collector
+from ml_instrumentation.Sampler import Identity, Ignore, Subsample, Window
 from ml_instrumentation.Writer import SqlPoint
 
 def test_collector_jax_jit(basic_collector: Collector):
@@ -64,3 +66,131 @@ def test_collector_jax_vmap(basic_collector: Collector):
         SqlPoint(frame=0, id=0, measurement=56),
         SqlPoint(frame=0, id=0, measurement=60),
     ]
+
+
+def test_accumulator_scan1():
+    collector = Collector(
+        config={
+            'm1': Identity(),
+            'm2': Window(4),
+            'm3': Subsample(3),
+        },
+        default=Ignore(),
+        experiment_id=0,
+    )
+    acc = Accumulator(collector, ['m1', 'm2', 'm3', 'm4'], capacity=5)
+
+    @jax.jit
+    def run(state: AccumulatorState):
+        def _step(state: AccumulatorState, t: jax.Array):
+            x = t.astype(jax.numpy.float32)
+            state = acc.record(state, {'m1': x, 'm2': x, 'm3': x, 'm4': x}, t)
+            return state, None
+
+        state, _ = jax.lax.scan(_step, state, jax.numpy.arange(12))
+        return state
+
+    state = run(acc.init())
+    acc.flush(state)
+
+    assert collector.get('m1', 0) == [
+        SqlPoint(frame=i, id=0, measurement=float(i)) for i in range(12)
+    ]
+    assert collector.get('m2', 0) == [
+        SqlPoint(frame=3, id=0, measurement=1.5),
+        SqlPoint(frame=7, id=0, measurement=5.5),
+        SqlPoint(frame=11, id=0, measurement=9.5),
+    ]
+    assert collector.get('m3', 0) == [
+        SqlPoint(frame=i, id=0, measurement=float(i)) for i in range(0, 12, 3)
+    ]
+    assert collector.get('m4', 0) == []
+
+    # m1 fills its buffer twice, then one final manual flush
+    assert acc.callbacks == 3
+    collector.close()
+
+
+def test_collect_jax_when1():
+    collector = Collector(config={'m1': Subsample(2)}, experiment_id=0)
+    calls = 0
+
+    @jax.jit
+    def step(x: jax.Array, t: jax.Array):
+        # decided on the device, the host never has to call `skip`
+        collector.collect_jax('m1', x * 2, when=t % 2 == 0, frame=t)
+        collector.collect_jax('m2', x, when=t % 3 == 0, frame=t)
+        return x
+
+    original = collector._collect_at
+    def _counted(name: str, value: float, frame: int):
+        nonlocal calls
+        calls += 1
+        original(name, value, frame)
+
+    collector._collect_at = _counted
+
+    for i in range(9):
+        collector.next_frame()
+        step(jax.numpy.float32(i), jax.numpy.int32(i))
+
+    jax.effects_barrier()
+
+    # values only leave the device on steps where `when` is true
+    assert calls == 5 + 3
+    assert collector.get('m1', 0) == [
+        SqlPoint(frame=i, id=0, measurement=2. * i) for i in range(0, 9, 2)
+    ]
+    assert collector.get('m2', 0) == [
+        SqlPoint(frame=i, id=0, measurement=float(i)) for i in range(0, 9, 3)
+    ]
+    collector.close()
+
+
+def test_collect_jax_eager_skip1():
+    collector = Collector(config={'m1': Subsample(2)}, experiment_id=0)
+    for i in range(4):
+        collector.next_frame()
+        collector.collect_jax('m1', jax.numpy.float32(i))
+
+    jax.effects_barrier()
+    assert collector.get('m1', 0) == [
+        SqlPoint(frame=0, id=0, measurement=0.),
+        SqlPoint(frame=2, id=0, measurement=2.),
+    ]
+    collector.close()
+
+
+def test_accumulator_end1():
+    collector = Collector(config={'m1': Window(4), 'm2': Subsample(4)}, default=Ignore(), experiment_id=0)
+    acc = Accumulator(collector, ['m1', 'm2'], capacity=5)
+
+    # the same values through the scalar samplers
+    expected = Collector(config={'m1': Window(4), 'm2': Subsample(4)}, default=Ignore(), experiment_id=0)
+
+    state = acc.init()
+    for run in range(2):
+        for t in range(6):
+            x = jax.numpy.float32(t + 10 * run)
+            state = acc.record(state, {'m1': x, 'm2': x}, t)
+
+            expected.set_frame(t)
+            expected.collect('m1', float(x))
+            expected.collect('m2', float(x))
+
+        # partial windows are emitted on the frame after the last value
+        state = acc.end(state)
+        expected.reset()
+
+    for m in ['m1', 'm2']:
+        assert collector.get(m, 0) == expected.get(m, 0)
+
+    assert collector.get('m1', 0) == [
+        SqlPoint(frame=3, id=0, measurement=1.5),
+        SqlPoint(frame=6, id=0, measurement=4.5),
+        SqlPoint(frame=3, id=0, measurement=11.5),
+        SqlPoint(frame=6, id=0, measurement=14.5),
+    ]
+
+    collector.close()
+    expected.close()
@@ -0,0 +1,110 @@
+import sqlite3
+import numpy as np
+import polars as pl
+import pytest
+from pathlib import Path
+
+from ml_instrumentation.Collector import Collector
+from ml_instrumentation.backends.sqlite import Sqlite
+from ml_instrumentation.merge import main, merge_all
+from ml_instrumentation.metadata import attach_metadata
+from ml_instrumentation.reader import load_all_results
+
+
+def _job(path: Path, i: int, layout: str = 'tables'):
+    collector = Collector(tmp_file=str(path), experiment_id=i, sqlite_layout=layout)
+    for _ in range(10):
+        collector.next_frame()
+        collector.collect('a', i)
+        collector.collect('phase', ['train', 'eval'][i % 2])
+        collector.collect('q', np.full(3, i, dtype=np.float32))
+
+    collector.close()
+    attach_metadata(path, i, {'alpha': i / 10})
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_merge_all1(tmp_path: Path, workers: int):
+    for i in range(7):
+        _job(tmp_path / f'job-{i}.db', i)
+
+    out = merge_all(tmp_path, tmp_path / 'results' / 'all.db', workers=workers)
+
+    df = load_all_results(out, ['a', 'phase', 'q'])
+    assert df.shape == (70, 6)
+    assert df['id'].unique().sort().to_list() == list(range(7))
+    assert (df['a'] == df['id']).all()
+    assert isinstance(df['phase'].dtype, pl.Enum)
+    assert df['phase'].cast(str).to_list() == [['train', 'eval'][i % 2] for i in df['id']]
+    assert np.all(df['q'].to_numpy() == df['id'].to_numpy()[:, None])
+    assert df['alpha'].to_list() == [i / 10 for i in df['id']]
+
+    # the result is indexed and no intermediate files are left behind
+    con = sqlite3.connect(out)
+    indexes = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    assert indexes == {'_idx_a', '_idx_phase', '_idx_q'}
+    con.close()
+    assert list((tmp_path / 'results').iterdir()) == [out]
+
+    # the inputs are left untouched, and merging again appends to the result
+    merge_all(str(tmp_path / 'job-[0-2].db'), out, workers=workers)
+    con = sqlite3.connect(out)
+    assert con.execute('SELECT COUNT(*) FROM a').fetchone() == (100,)
+    con.close()
+
+
+def test_merge_all_long1(tmp_path: Path):
+    for i in range(5):
+        _job(tmp_path / f'job-{i}.db', i, layout='long')
+
+    # e.g. a job that died before writing anything
+    (tmp_path / 'job-5.db').touch()
+
+    main([str(tmp_path / 'job-*.db'), '-o', str(tmp_path / 'all.db'), '-j', '2'])
+
+    df = load_all_results(tmp_path / 'all.db', ['a', 'q'])
+    assert df.shape == (50, 5)
+    assert (df['a'] == df['id']).all()
+    assert df['alpha'].to_list() == [i / 10 for i in df['id']]
+
+    # the two layouts cannot be mixed in one file
+    _job(tmp_path / 'tables.db', 5)
+    with pytest.raises(ValueError):
+        merge_all([tmp_path / 'job-0.db', tmp_path / 'tables.db'], tmp_path / 'mixed.db', workers=1)
+
+    assert not (tmp_path / 'mixed.db').exists()
+    assert not any(p.name.startswith('.') for p in tmp_path.iterdir())
+
+
+def test_merge_all_empty1(tmp_path: Path):
+    with pytest.raises(ValueError):
+        merge_all(tmp_path, tmp_path / 'all.db')
+
+
+def test_merge_all_missing1(tmp_path: Path):
+    _job(tmp_path / 'job-0.db', 0)
+
+    # e.g. a typo in one of the paths
+    with pytest.raises(FileNotFoundError):
+        merge_all([tmp_path / 'job-0.db', tmp_path / 'job-1.db'], tmp_path / 'all.db', workers=1)
+
+    assert not (tmp_path / 'job-1.db').exists()
+    assert not (tmp_path / 'all.db').exists()
+
+
+def test_merge_all_types1(tmp_path: Path):
+    # the same metric is inferred as TEXT in one job and INTEGER in another
+    for i, values in enumerate([['a', 'b', 'c'], [0, 1, 2]]):
+        collector = Collector(tmp_file=str(tmp_path / f'job-{i}.db'), experiment_id=i)
+        for v in values:
+            collector.next_frame()
+            collector.collect('status', v)
+
+        collector.close()
+
+    out = merge_all(tmp_path, tmp_path / 'all.db', workers=1)
+
+    backend = Sqlite(out)
+    backend.init_db()
+    assert [p.measurement for p in backend.read_metric('status')] == ['a', 'b', 'c', 0, 1, 2]
+    backend.close()
@@ -0,0 +1,214 @@
+import sqlite3
+import numpy as np
+import polars as pl
+from pathlib import Path
+
+from ml_instrumentation.Collector import Collector
+from ml_instrumentation.Sampler import Identity, Quantile, Sketch, Summary, Window
+from ml_instrumentation.reader import build_indexes, load_all_results, read_quantiles
+
+def test_read_quantiles1(tmp_path: Path):
+    db = str(tmp_path / 'results.db')
+    collector = Collector(
+        tmp_file=db,
+        config={
+            'td': Sketch(100),
+            'td_p90': Quantile(100, 0.9),
+        },
+    )
+
+    rng = np.random.default_rng(0)
+    raw = rng.lognormal(size=(3, 200))
+    for seed in range(3):
+        collector.set_experiment_id(seed)
+        for i in range(200):
+            collector.next_frame()
+            collector.collect('td', raw[seed, i])
+            collector.collect('td_p90', raw[seed, i])
+
+    p90 = collector.get('td_p90', 0)
+    assert [p.frame for p in p90] == [99, 199]
+    assert abs(p90[0].measurement - np.quantile(raw[0, :100], 0.9, method='lower')) < 0.01 * p90[0].measurement
+
+    collector.close()
+
+    # cross-seed quantiles from the stored sketches only
+    df = read_quantiles(db, 'td', [0.5, 0.9])
+    assert df['frame'].to_list() == [99, 199]
+
+    for row, window in zip(df.iter_rows(named=True), [raw[:, :100], raw[:, 100:]], strict=True):
+        for q in [0.5, 0.9]:
+            expected = np.quantile(window, q, method='lower')
+            assert abs(row[f'td_{q}'] - expected) <= 0.01 * expected
+
+
+def test_summary1(tmp_path: Path):
+    db = str(tmp_path / 'results.db')
+    collector = Collector(
+        tmp_file=db,
+        config={
+            'loss': Summary(10, stats=['mean', 'std', 'min', 'max']),
+        },
+    )
+
+    rng = np.random.default_rng(0)
+    raw = rng.normal(size=(2, 25))
+    for seed in range(2):
+        collector.set_experiment_id(seed)
+        for i in range(25):
+            collector.next_frame()
+            collector.collect('loss', raw[seed, i])
+            collector.collect('other', i)
+
+        collector.reset()
+
+    # one row per window, with every statistic in it
+    points = collector.get('loss', 1)
+    assert [p.frame for p in points] == [9, 19, 25]
+    assert list(points[0].measurement) == ['mean', 'std', 'min', 'max']
+    np.testing.assert_allclose(points[0].measurement['mean'], raw[1, :10].mean())
+    np.testing.assert_allclose(points[0].measurement['std'], raw[1, :10].std())
+    assert points[2].measurement['max'] == raw[1, 20:].max()
+
+    collector.close()
+
+    df = load_all_results(db, ['loss', 'other'], ids=[0])
+    assert set(df.columns) == {'frame', 'id', 'loss_mean', 'loss_std', 'loss_min', 'loss_max', 'other'}
+
+    row = df.filter(df['frame'] == 19).row(0, named=True)
+    np.testing.assert_allclose(row['loss_mean'], raw[0, 10:20].mean())
+    assert row['other'] == 19
+
+
+def test_array_metrics1(tmp_path: Path):
+    db = str(tmp_path / 'results.db')
+    collector = Collector(
+        tmp_file=db,
+        config={
+            'q': Identity(),
+            'hist': Window(2),
+        },
+        experiment_id=0,
+    )
+
+    rng = np.random.default_rng(0)
+    q = rng.normal(size=(10, 4)).astype(np.float32)
+    hist = rng.integers(0, 100, size=(10, 2, 3))
+    for i in range(10):
+        collector.next_frame()
+        collector.collect('q', q[i])
+        collector.collect('hist', hist[i])
+
+    # buffered and stored arrays read back the same
+    for _ in range(2):
+        points = collector.get('q', 0)
+        np.testing.assert_array_equal(np.stack([p.measurement for p in points]), q)
+
+        points = collector.get('hist', 0)
+        assert [p.frame for p in points] == [1, 3, 5, 7, 9]
+        np.testing.assert_array_equal(points[0].measurement, hist[:2].mean(axis=0))
+
+        collector._writer.sync_now()
+
+    collector.close()
+
+    df = load_all_results(db, ['q', 'hist'])
+    assert df['q'].dtype == pl.Array(pl.Float32, 4)
+    np.testing.assert_array_equal(df['q'].to_numpy(), q)
+
+    hists = df.filter(df['hist'].is_not_null())['hist'].to_numpy()
+    np.testing.assert_array_equal(hists, hist.reshape(5, 2, 2, 3).mean(axis=1))
+
+
+def test_long_layout1(tmp_path: Path):
+    dfs: list[pl.DataFrame] = []
+    for layout in ('tables', 'long'):
+        db = str(tmp_path / f'{layout}.db')
+        collector = Collector(
+            tmp_file=db,
+            config={'s': Summary(2, stats=('mean', 'max'))},
+            sqlite_layout=layout,
+        )
+
+        for seed in range(3):
+            collector.set_experiment_id(seed)
+            for i in range(6):
+                collector.next_frame()
+                collector.collect('x', seed + i)
+                collector.collect('s', float(i))
+                collector.collect('name', f'env-{seed}')
+                collector.collect('q', np.full(3, i, dtype=np.float32))
+
+            collector.reset()
+
+        collector.close()
+        dfs.append(load_all_results(db).sort('id', 'frame'))
+
+    # both layouts read back to the same dataframe, except that
+    # repeated strings are only dictionary-encoded in per-metric tables
+    tables, long = dfs
+    assert set(tables.columns) == {'frame', 'id', 'x', 's_mean', 's_max', 'name', 'q'}
+    assert tables['name'].dtype == pl.Enum(['env-0', 'env-1', 'env-2'])
+    assert long['name'].dtype == pl.String
+
+    tables = tables.with_columns(pl.col('name').cast(pl.String))
+    assert long.select(tables.columns).equals(tables)
+
+
+def test_build_indexes1(tmp_path: Path):
+    # a results file written without indexes
+    db = tmp_path / 'results.db'
+    con = sqlite3.connect(db)
+    con.execute('CREATE TABLE a(frame INTEGER ASC, id, measurement)')
+    con.executemany('INSERT INTO a VALUES (?,?,?)', ((i // 5, i % 5, float(i)) for i in range(50)))
+    con.commit()
+
+    build_indexes(db)
+    build_indexes(db)
+
+    res = con.execute("SELECT name FROM sqlite_master WHERE type='index'").fetchall()
+    assert res == [('_idx_a',)]
+    con.close()
+
+    df = load_all_results(db, ids=[2])
+    assert df['a'].to_list() == [float(i) for i in range(2, 50, 5)]
+
+
+def test_typed_columns1(tmp_path: Path):
+    for job, phases in enumerate([['train', 'eval'], ['warmup', 'train']]):
+        collector = Collector(tmp_file=str(tmp_path / f'job{job}.db'), experiment_id=job)
+        for i in range(10):
+            collector.next_frame()
+            collector.collect('steps', i)
+            collector.collect('loss', i / 2)
+            collector.collect('note', f'step {i}')
+            collector.collect('phase', phases[i % 2])
+
+        # read back as strings before and after being stored
+        assert [p.measurement for p in collector.get('phase', job)][:2] == phases
+        collector._writer.sync_now()
+        assert [p.measurement for p in collector.get('phase', job)][:2] == phases
+
+        collector.merge(str(tmp_path / 'total.db'))
+        collector.close()
+
+    # column types are inferred from the first flush
+    con = sqlite3.connect(tmp_path / 'job0.db')
+    types = {
+        t: con.execute(f'PRAGMA table_info({t})').fetchall()[2][2]
+        for t in ('steps', 'loss', 'note', 'phase')
+    }
+    assert types == {'steps': 'INTEGER', 'loss': 'REAL', 'note': 'TEXT', 'phase': 'CODE'}
+
+    # repeated strings are only stored once per metric
+    assert con.execute('SELECT value FROM _strings_ ORDER BY code').fetchall() == [('train',), ('eval',)]
+    con.close()
+
+    # each job has its own codes, which are matched up by value when merging
+    df = load_all_results(tmp_path / 'total.db').sort('id', 'frame')
+    assert df['steps'].dtype == pl.Int64
+    assert df['loss'].dtype == pl.Float64
+    assert df['note'].dtype == pl.String
+    assert isinstance(df['phase'].dtype, pl.Enum)
+    assert set(df['phase'].dtype.categories) == {'train', 'eval', 'warmup'}
+    assert df['phase'].to_list() == ['train', 'eval'] * 5 + ['warmup', 'train'] * 5
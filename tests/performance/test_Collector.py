@@ -1,3 +1,4 @@
+import numpy as np
 import pytest
 from typing import Any
 from tests.fixtures.collector import basic_collector, disk_collector
@@ -41,3 +42,89 @@ def test_benchmark_read1(collector_fixture: Any, request: pytest.FixtureRequest,
         assert len(d) == 1_000
 
     benchmark(_inner)
+
+
+@pytest.mark.parametrize('collector_fixture', [basic_collector, disk_collector])
+def test_benchmark_collect_many1(collector_fixture: Any, request: pytest.FixtureRequest, benchmark: Any):
+    collector: Collector = request.getfixturevalue(collector_fixture.__name__)
+    collector.set_experiment_id(0)
+
+    def _inner():
+        for i in range(1_000):
+            collector.next_frame()
+            collector.collect_many({
+                'm1': i,
+                'm2': f'test string {i}',
+            })
+
+        collector._writer.sync_now()
+
+    benchmark(_inner)
+
+@pytest.mark.parametrize('collector_fixture', [basic_collector, disk_collector])
+def test_benchmark_collect_array1(collector_fixture: Any, request: pytest.FixtureRequest, benchmark: Any):
+    collector: Collector = request.getfixturevalue(collector_fixture.__name__)
+    collector.set_experiment_id(0)
+
+    frames = list(range(1_000))
+    m1 = list(range(1_000))
+    m2 = [f'test string {i}' for i in range(1_000)]
+
+    def _inner():
+        collector.collect_array('m1', m1, frames)
+        collector.collect_array('m2', m2, frames)
+        collector._writer.sync_now()
+
+    benchmark(_inner)
+
+@pytest.mark.parametrize('collector_fixture', [basic_collector, disk_collector])
+def test_benchmark_metric_handle1(collector_fixture: Any, request: pytest.FixtureRequest, benchmark: Any):
+    collector: Collector = request.getfixturevalue(collector_fixture.__name__)
+    collector.set_experiment_id(0)
+
+    m1 = collector.metric('m1')
+    m2 = collector.metric('m2')
+
+    def _inner():
+        for i in range(1_000):
+            collector.next_frame()
+            m1(i)
+            m2(f'test string {i}')
+
+        collector._writer.sync_now()
+
+    benchmark(_inner)
+
+@pytest.mark.parametrize('collector_fixture', [basic_collector, disk_collector])
+def test_benchmark_collect_vector1(collector_fixture: Any, request: pytest.FixtureRequest, benchmark: Any):
+    collector: Collector = request.getfixturevalue(collector_fixture.__name__)
+
+    seeds = np.arange(64)
+    values = np.random.default_rng(0).normal(size=64)
+
+    def _inner():
+        for _ in range(100):
+            collector.next_frame()
+            collector.collect_vector('m1', values, seeds)
+
+        collector._writer.sync_now()
+
+    benchmark(_inner)
+
+@pytest.mark.parametrize('collector_fixture', [basic_collector, disk_collector])
+def test_benchmark_collect_vector_loop1(collector_fixture: Any, request: pytest.FixtureRequest, benchmark: Any):
+    collector: Collector = request.getfixturevalue(collector_fixture.__name__)
+
+    seeds = list(range(64))
+    values = np.random.default_rng(0).normal(size=64).tolist()
+
+    def _inner():
+        for t in range(100):
+            for seed, v in zip(seeds, values, strict=True):
+                collector.set_experiment_id(seed)
+                collector.set_frame(t)
+                collector.collect('m1', v)
+
+        collector._writer.sync_now()
+
+    benchmark(_inner)
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+from typing import Any
+
+from ml_instrumentation.Sampler import Identity, MovingAverage, Sampler, Subsample, Window
+from ml_instrumentation.utils import Pipe
+
+SAMPLERS = {
+    'identity': lambda: Identity(),
+    'window': lambda: Window(100),
+    'subsample': lambda: Subsample(10),
+    'moving_average': lambda: MovingAverage(0.99),
+    'pipe': lambda: Pipe(MovingAverage(0.99), Subsample(10)),
+}
+
+@pytest.mark.parametrize('name', SAMPLERS.keys())
+def test_benchmark_next1(name: str, benchmark: Any):
+    sampler: Sampler = SAMPLERS[name]()
+    v = np.random.default_rng(0).normal(size=1_000)
+
+    def _inner():
+        for x in v:
+            sampler.next(x)
+
+    benchmark(_inner)
+
+@pytest.mark.parametrize('name', SAMPLERS.keys())
+def test_benchmark_next_many1(name: str, benchmark: Any):
+    sampler: Sampler = SAMPLERS[name]()
+    v = np.random.default_rng(0).normal(size=1_000)
+
+    def _inner():
+        sampler.next_many(v)
+
+    benchmark(_inner)
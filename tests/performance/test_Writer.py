@@ -0,0 +1,63 @@
+import time
+import numpy as np
+import pytest
+from pathlib import Path
+from typing import Any
+
+from ml_instrumentation.Collector import Collector
+from ml_instrumentation.Writer import Writer
+from tests.fixtures.writer import SlowSqlite
+
+def _train(collector: Collector, steps: int):
+    times = np.empty(steps)
+    for t in range(steps):
+        start = time.perf_counter()
+        collector.next_frame()
+
+        # pure-python work holds the GIL, like most of a training step's glue code
+        x = sum(i * i for i in range(2_000))
+        for j in range(20):
+            collector.collect(f'm{j}', x * 1e-9 + j)
+
+        times[t] = time.perf_counter() - start
+
+    return times
+
+@pytest.mark.parametrize('out_of_process', [False, True])
+def test_benchmark_step_time1(out_of_process: bool, tmp_path: Path, benchmark: Any):
+    collector = Collector(
+        tmp_file=str(tmp_path / 'test.db'),
+        experiment_id=0,
+        out_of_process=out_of_process,
+    )
+
+    p99s: list[float] = []
+    def _inner():
+        times = _train(collector, 2_000)
+        p99s.append(float(np.percentile(times, 99)))
+        collector._writer.sync_now()
+
+    benchmark.pedantic(_inner, rounds=5)
+    benchmark.extra_info['p99_step_time'] = float(np.median(p99s))
+    collector.close()
+
+@pytest.mark.parametrize('adaptive', [False, True])
+def test_benchmark_adaptive_watermarks1(adaptive: bool, benchmark: Any):
+    # a deliberately slow backend: 20ms per flush plus 2us per point
+    writer = Writer(
+        backend=SlowSqlite(':memory:', delay=0.02, per_point=2e-6),
+        low_watermark=1_000,
+        high_watermark=100_000,
+        adaptive=adaptive,
+        target_latency=0.05,
+    )
+
+    def _inner():
+        for i in range(50_000):
+            writer.append('a', 0, i, i)
+
+        writer.sync_now()
+
+    benchmark.pedantic(_inner, rounds=5)
+    benchmark.extra_info.update(writer.stats())
+    writer.close()
@@ -0,0 +1,69 @@
+import jax
+import pytest
+from typing import Any
+from tests.fixtures.collector import basic_collector
+
+from ml_instrumentation.Accumulator import Accumulator, AccumulatorState
+from ml_instrumentation.Collector import Collector
+
+@pytest.mark.parametrize('collector_fixture', [basic_collector])
+def test_benchmark_collect_jax1(collector_fixture: Any, request: pytest.FixtureRequest, benchmark: Any):
+    collector: Collector = request.getfixturevalue(collector_fixture.__name__)
+    collector.set_experiment_id(0)
+
+    calls = 0
+    collect = collector.collect
+
+    def _counted(name: str, value: Any):
+        nonlocal calls
+        calls += 1
+        collect(name, value)
+
+    collector.collect = _counted
+
+    @jax.jit
+    def run(x: jax.Array):
+        def _step(x: jax.Array, _: Any):
+            x = x + 1
+            collector.collect_jax('m1', x)
+            return x, None
+
+        x, _ = jax.lax.scan(_step, x, length=1_000)
+        return x
+
+    def _inner():
+        run(jax.numpy.float32(0)).block_until_ready()
+        jax.effects_barrier()
+        collector._writer.sync_now()
+
+    benchmark(_inner)
+    assert calls % 1_000 == 0
+
+@pytest.mark.parametrize('collector_fixture', [basic_collector])
+def test_benchmark_accumulator1(collector_fixture: Any, request: pytest.FixtureRequest, benchmark: Any):
+    collector: Collector = request.getfixturevalue(collector_fixture.__name__)
+    collector.set_experiment_id(0)
+
+    acc = Accumulator(collector, ['m1'], capacity=100)
+
+    @jax.jit
+    def run(x: jax.Array, state: AccumulatorState):
+        def _step(carry: tuple[jax.Array, AccumulatorState], t: jax.Array):
+            x, state = carry
+            x = x + 1
+            state = acc.record(state, {'m1': x}, t)
+            return (x, state), None
+
+        (x, state), _ = jax.lax.scan(_step, (x, state), jax.numpy.arange(1_000))
+        return x, state
+
+    def _inner():
+        acc.callbacks = 0
+        _, state = run(jax.numpy.float32(0), acc.init())
+        jax.effects_barrier()
+        collector._writer.sync_now()
+
+        # one callback per 100 values instead of one per value
+        assert acc.callbacks == 10
+
+    benchmark(_inner)
@@ -0,0 +1,56 @@
+import pickle
+import pytest
+from pathlib import Path
+from typing import Any, cast
+
+from ml_instrumentation.Collector import Collector
+from ml_instrumentation.backends.sqlite import Sqlite
+
+def _build_collector(rows: int):
+    collector = Collector(experiment_id=0)
+    collector.collect('m1', 0)
+    collector._writer.sync_now()
+
+    # fill the table directly, going through collect() would dominate setup time
+    con = cast(Sqlite, collector._backend)._con
+    con.execute(f'''
+        WITH RECURSIVE r(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM r WHERE i < {rows})
+        INSERT INTO "m1" SELECT i, 0, i * 0.5 FROM r
+    ''')
+    con.commit()
+    return collector
+
+@pytest.mark.parametrize('rows', [10_000, 1_000_000, 10_000_000])
+def test_benchmark_pickle1(rows: int, benchmark: Any):
+    collector = _build_collector(rows)
+    benchmark.pedantic(pickle.dumps, args=(collector,), rounds=3)
+    collector.close()
+
+@pytest.mark.parametrize('rows', [10_000, 1_000_000, 10_000_000])
+def test_benchmark_unpickle1(rows: int, benchmark: Any):
+    collector = _build_collector(rows)
+    byts = pickle.dumps(collector)
+    collector.close()
+
+    def _inner():
+        pickle.loads(byts).close()
+
+    benchmark.pedantic(_inner, rounds=3)
+
+@pytest.mark.parametrize('rows', [10_000, 1_000_000])
+def test_benchmark_incremental_pickle1(rows: int, tmp_path: Path, benchmark: Any):
+    collector = _build_collector(rows)
+    collector._checkpoint_path = str(tmp_path / 'chk')
+
+    # the base checkpoint holds every existing row
+    pickle.dumps(collector)
+
+    def _inner():
+        for i in range(1_000):
+            collector.next_frame()
+            collector.collect('m1', i)
+
+        pickle.dumps(collector)
+
+    benchmark.pedantic(_inner, rounds=3)
+    collector.close()
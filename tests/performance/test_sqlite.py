@@ -0,0 +1,160 @@
+import os
+import time
+import numpy as np
+import pytest
+from pathlib import Path
+from typing import Any
+
+from ml_instrumentation.backends.base import Columns
+from ml_instrumentation.backends.sqlite import LongSqlite, Sqlite
+from ml_instrumentation.merge import merge_all
+from ml_instrumentation.metadata import attach_metadata
+from ml_instrumentation.reader import load_all_results
+
+LAYOUTS = {'tables': Sqlite, 'long': LongSqlite}
+
+def _batch(metrics: int, rows: int, start: int):
+    out: dict[str, Columns] = {}
+    frames = list(range(start, start + rows))
+    values = np.random.default_rng(start).normal(size=rows).tolist()
+    for m in range(metrics):
+        cols = out[f'm{m}'] = Columns()
+        cols.extend([0] * rows, frames, values)
+
+    return out
+
+@pytest.mark.parametrize('profile', ['safe', 'default', 'fast', 'unsafe'])
+@pytest.mark.parametrize('rows', [100, 2_000])
+def test_benchmark_ingest1(profile: str, rows: int, tmp_path: Path, benchmark: Any):
+    # 20 metrics per flush, like a single Writer flush of a training loop
+    backend = Sqlite(tmp_path / 'test.db', profile=profile)
+    batches = [_batch(20, rows, i * rows) for i in range(10)]
+
+    elapsed: list[float] = []
+    def _inner():
+        start = time.perf_counter()
+        for batch in batches:
+            backend.write_many(batch)
+
+        elapsed.append(time.perf_counter() - start)
+
+    benchmark.pedantic(_inner, rounds=3)
+    benchmark.extra_info['rows_per_second'] = 10 * 20 * rows / float(np.median(elapsed))
+    backend.close()
+
+def _write_runs(path: Path, layout: str, runs: int, metrics: int = 300, rows: int = 100):
+    backend = LAYOUTS[layout](path)
+    for run in range(runs):
+        batch = _batch(metrics, rows, 0)
+        for cols in batch.values():
+            cols.ids = [run] * rows
+
+        backend.write_many(batch)
+
+    return backend
+
+@pytest.mark.parametrize('layout', ['tables', 'long'])
+def test_benchmark_layout_write1(layout: str, tmp_path: Path, benchmark: Any):
+    paths = iter(tmp_path / f'{i}.db' for i in range(100))
+
+    def _inner():
+        _write_runs(next(paths), layout, runs=5).close()
+
+    benchmark.pedantic(_inner, rounds=3)
+
+@pytest.mark.parametrize('layout', ['tables', 'long'])
+def test_benchmark_layout_merge1(layout: str, tmp_path: Path, benchmark: Any):
+    backends = [_write_runs(tmp_path / f'job{i}.db', layout, runs=1) for i in range(10)]
+    targets = iter(tmp_path / f'total{i}.db' for i in range(100))
+
+    def _inner():
+        target = str(next(targets))
+        for b in backends:
+            b.merge(target)
+
+    benchmark.pedantic(_inner, rounds=3)
+    for b in backends:
+        b.close()
+
+@pytest.mark.parametrize('layout', ['tables', 'long'])
+def test_benchmark_layout_read1(layout: str, tmp_path: Path, benchmark: Any):
+    path = tmp_path / 'results.db'
+    _write_runs(path, layout, runs=10, metrics=10).close()
+    for run in range(10):
+        attach_metadata(path, run, {'alpha': 0.1 * run})
+
+    def _inner():
+        # reads a couple of runs out of the file, including the metadata join
+        return load_all_results(path, ids=[3, 7])
+
+    df = benchmark.pedantic(_inner, rounds=3)
+    assert df.height == 2 * 100
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_benchmark_indexed_read1(indexed: bool, tmp_path: Path, benchmark: Any):
+    # one metric of 1000 runs merged into a single file
+    backend = _write_runs(tmp_path / 'results.db', 'tables', runs=1_000, metrics=1)
+    if indexed:
+        backend.build_indexes()
+
+    def _inner():
+        return backend.read_metric('m0', 500)
+
+    points = benchmark.pedantic(_inner, rounds=20)
+    assert len(points) == 100
+    backend._con.close()
+
+@pytest.mark.parametrize('encoded', [False, True])
+def test_benchmark_string_dict1(encoded: bool, tmp_path: Path, benchmark: Any):
+    path = tmp_path / 'results.db'
+    backend = Sqlite(path)
+    if not encoded:
+        # a plain text column, as written before dictionary encoding
+        backend._con.execute('CREATE TABLE phase(frame INTEGER ASC, id, measurement TEXT)')
+        backend.init_db()
+
+    phases = ['environment/warmup', 'environment/train', 'environment/evaluate']
+    for run in range(20):
+        cols = Columns()
+        cols.extend([run] * 10_000, range(10_000), [phases[i % 3] for i in range(10_000)])
+        backend.write_many({'phase': cols})
+
+    backend.close()
+
+    def _inner():
+        return load_all_results(path, ['phase'])
+
+    df = benchmark.pedantic(_inner, rounds=5)
+    assert df.height == 20 * 10_000
+    benchmark.extra_info['file_bytes'] = path.stat().st_size
+
+# merging thousands of inputs takes minutes, set ML_INSTRUMENTATION_LARGE_BENCHMARKS=1 to include them
+MERGE_INPUTS = [10, 100] + ([1_000, 5_000] if os.environ.get('ML_INSTRUMENTATION_LARGE_BENCHMARKS') else [])
+
+@pytest.mark.parametrize('strategy', ['serial', 'tree'])
+@pytest.mark.parametrize('inputs', MERGE_INPUTS)
+def test_benchmark_bulk_merge1(strategy: str, inputs: int, tmp_path: Path, benchmark: Any):
+    # one small file per job, like the output of a large array job
+    jobs = tmp_path / 'jobs'
+    jobs.mkdir()
+    for i in range(inputs):
+        _write_runs(jobs / f'job{i}.db', 'tables', runs=1, metrics=5).close()
+
+    paths = sorted(jobs.iterdir())
+    targets = iter(tmp_path / f'total{i}.db' for i in range(100))
+
+    elapsed: list[float] = []
+    def _inner():
+        target = next(targets)
+        start = time.perf_counter()
+        if strategy == 'tree':
+            merge_all(paths, target)
+        else:
+            # what every job does today, one after the other on the shared lock
+            for p in paths:
+                Sqlite(p).merge(str(target))
+
+        elapsed.append(time.perf_counter() - start)
+
+    benchmark.pedantic(_inner, rounds=3 if inputs <= 100 else 1)
+    benchmark.extra_info['inputs_per_second'] = inputs / float(np.median(elapsed))
@@ -0,0 +1,213 @@
+import numpy as np
+import pytest
+from typing import Any
+
+from ml_instrumentation.Sampler import LTTB, Batch, Identity, Ignore, LogSubsample, MinMax, MovingAverage, Reservoir, Sampler, Subsample, Window
+from ml_instrumentation.utils import Pipe
+
+class Every3rd(Sampler):
+    # no vectorized implementation, uses the default next_many
+    def __init__(self):
+        self._i = 0
+
+    def next(self, v: float):
+        self._i += 1
+        if self._i % 3 == 0:
+            return v
+
+
+def _scalar(sampler: Any, v: np.ndarray):
+    out: list[Any] = []
+    offsets: list[int] = []
+    for i, x in enumerate(v):
+        y = sampler.next(x)
+        if y is not None:
+            out.append(y)
+            offsets.append(i)
+
+    return out, offsets
+
+
+@pytest.mark.parametrize('make', [
+    lambda: Identity(),
+    lambda: Window(1),
+    lambda: Window(7),
+    lambda: Window(100),
+    lambda: Subsample(1),
+    lambda: Subsample(3),
+    lambda: MovingAverage(0.99),
+    lambda: LogSubsample(1.05),
+    lambda: Every3rd(),
+    lambda: Pipe(Subsample(2), Window(5)),
+    lambda: Pipe(MovingAverage(0.9), Subsample(4), Window(3)),
+    lambda: Pipe(Window(2), LogSubsample(1.2)),
+])
+def test_next_many_matches_next1(make: Any):
+    rng = np.random.default_rng(0)
+    a = make()
+    b = make()
+
+    # uneven chunks exercise state carried between calls
+    for n in [0, 1, 5, 13, 250, 1_000, 3]:
+        v = rng.normal(size=n)
+        expected, expected_offsets = _scalar(a, v)
+        out, offsets = b.next_many(v)
+
+        assert len(out) == len(expected)
+        assert out.tobytes() == np.asarray(expected, dtype=np.float64).tobytes()
+        assert offsets.tolist() == expected_offsets
+
+    assert a.end() == b.end()
+
+
+def test_next_many_ignore1():
+    out, offsets = Ignore().next_many(np.arange(10))
+    assert len(out) == 0
+    assert len(offsets) == 0
+
+
+def test_log_subsample1():
+    sampler = LogSubsample(ratio=1.1)
+    kept = [i for i in range(100_000) if sampler.next(i) is not None]
+
+    # dense at the start, then geometrically spaced
+    assert kept[:11] == list(range(11))
+    assert len(kept) < 120
+    assert all(b / a <= 1.1 + 1 / a for a, b in zip(kept[11:-1], kept[12:], strict=True))
+
+
+def test_reservoir1():
+    sampler = Reservoir(10, seed=0)
+    assert all(sampler.next(i) is None for i in range(5))
+
+    # fewer values than the reservoir size are all kept
+    assert sampler.end() == [{'index': i, 'value': i} for i in range(5)]
+
+    counts = np.zeros(100)
+    for _ in range(2_000):
+        for i in range(100):
+            sampler.next(i)
+
+        out = sampler.end()
+        assert isinstance(out, Batch)
+        assert len(out) == 10
+        assert [x['index'] for x in out] == sorted(x['index'] for x in out)
+        counts[[x['value'] for x in out]] += 1
+
+    # every value is equally likely to be kept
+    assert np.abs(counts / 2_000 - 0.1).max() < 0.03
+
+
+def test_pipe_end1():
+    sampler = Pipe(Window(2), Reservoir(5, seed=0))
+    for i in range(9):
+        sampler.next(i)
+
+    # the partial window is flushed into the reservoir before it ends
+    out = sampler.end()
+    assert isinstance(out, Batch)
+    assert [x['value'] for x in out] == [0.5, 2.5, 4.5, 6.5, 8.]
+
+
+def _framed(sampler: Any, v: np.ndarray):
+    frames: list[int] = []
+    values: list[Any] = []
+    for i, x in enumerate(v.tolist()):
+        out = sampler.next_at(x, 10 * i)
+        if out is not None:
+            frames += out.frames
+            values += out.values
+
+    out = sampler.end_at()
+    if out is not None:
+        frames += out.frames
+        values += out.values
+
+    return frames, values
+
+
+def test_lttb1():
+    rng = np.random.default_rng(0)
+    v = np.cumsum(rng.normal(size=1_050))
+    v[321] = 1_000.
+    v[777] = -1_000.
+
+    frames, values = _framed(LTTB(100, 10), v)
+
+    # a bounded number of points per window, including the partial one
+    assert len(frames) == 10 * 10 + 10
+    assert frames == sorted(frames)
+    assert all(values[i] == v[f // 10] for i, f in enumerate(frames))
+
+    # the first and last value of each window are kept, as are the spikes
+    assert {0, 990, 1_000, 10_490} <= set(frames)
+    assert {3_210, 7_770} <= set(frames)
+
+
+def test_min_max1():
+    rng = np.random.default_rng(0)
+    v = rng.normal(size=95)
+
+    frames, values = _framed(MinMax(50, 5), v)
+    assert len(frames) <= 2 * 5 * 2
+    assert frames == sorted(frames)
+
+    # every bucket keeps its extremes
+    for lo in range(0, 50, 10):
+        seg = v[lo:lo + 10]
+        assert 10 * (lo + int(seg.argmin())) in frames
+        assert 10 * (lo + int(seg.argmax())) in frames
+
+    assert 10 * (50 + int(v[50:].argmax())) in frames
+    assert values == [v[f // 10] for f in frames]
+
+
+def test_framed_pipe1():
+    sampler = Pipe(Subsample(2), MinMax(10, 1))
+    v = np.arange(50, dtype=np.float64)
+
+    frames, values = _framed(sampler, v)
+    assert sampler.framed
+    assert frames == [0, 180, 200, 380, 400, 480]
+    assert values == [0., 18., 20., 38., 40., 48.]
+
+    # the vectorized path gives the same result
+    sampler = Pipe(Subsample(2), MinMax(10, 1))
+    out = sampler.next_many_at(v, 10 * np.arange(50))
+    end = sampler.end_at()
+    assert out is not None and end is not None
+    assert out.frames + end.frames == frames
+
+
+@pytest.mark.parametrize('make', [
+    lambda: Identity(),
+    lambda: Ignore(),
+    lambda: Window(3),
+    lambda: Subsample(4),
+    lambda: LogSubsample(1.3),
+    lambda: Reservoir(5, seed=0),
+    lambda: MovingAverage(0.9),
+    lambda: Pipe(Subsample(2), Subsample(3)),
+    lambda: Pipe(LogSubsample(1.2), Window(2)),
+    lambda: Pipe(Window(2), Subsample(3)),
+])
+def test_will_emit1(make: Any):
+    a = make()
+    b = make()
+
+    def _fail():
+        raise AssertionError('value should not be needed')
+
+    for i in range(200):
+        expected = a.next(float(i))
+
+        # when a value will not be used, it is never evaluated
+        if b.will_emit():
+            out = b.next_eval(lambda i=i: float(i))
+        else:
+            out = b.next_eval(_fail)
+            assert expected is None
+
+        assert out == expected
+
+    assert a.end() == b.end()
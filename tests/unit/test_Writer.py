@@ -0,0 +1,50 @@
+from array import array
+from ml_instrumentation.backends.base import Columns
+
+def test_columns_typed1():
+    cols = Columns()
+    for i in range(3):
+        cols.append(0, i, i * 0.5)
+
+    assert isinstance(cols.frames, array)
+    assert isinstance(cols.ids, array)
+    assert isinstance(cols.values, array)
+    assert list(cols.rows()) == [(0, 0, 0.0), (1, 0, 0.5), (2, 0, 1.0)]
+
+def test_columns_widen1():
+    cols = Columns()
+    cols.append(0, 0, 1)
+    cols.append(0, 1, 'hi')
+    cols.extend(['a', 'b'], [2, 3], [2, 3])
+
+    assert isinstance(cols.values, list)
+    assert isinstance(cols.ids, list)
+    assert list(cols.rows()) == [
+        (0, 0, 1),
+        (1, 0, 'hi'),
+        (2, 'a', 2),
+        (3, 'b', 3),
+    ]
+
+def test_columns_widen_extend1():
+    # a failed extend of a typed array must not leave partial data behind
+    cols = Columns()
+    cols.extend([0, 0], [0, 1], [1, 2])
+    cols.extend([0, 0], [2, 3], [3, 4.5])
+
+    assert list(cols.values) == [1, 2, 3, 4.5]
+
+def test_columns_widen_float1():
+    # ints in a float column are kept as ints
+    cols = Columns()
+    cols.append(0, 0, 0.5)
+    cols.append(0, 1, 7)
+    cols.extend([0, 0], [2, 3], [1.5, 2])
+
+    assert list(cols.values) == [0.5, 7, 1.5, 2]
+    assert [type(v) for v in cols.values] == [float, int, float, int]
+
+    cols = Columns()
+    cols.extend([0, 0], [0, 1], [0.5, 1.5])
+    cols.extend([0, 0], [2, 3], [2.5, 3])
+    assert [type(v) for v in cols.values] == [float, float, float, int]
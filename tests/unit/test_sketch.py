@@ -0,0 +1,81 @@
+import numpy as np
+
+from ml_instrumentation.sketch import DDSketch, merge_sketches
+
+def test_quantiles1():
+    rng = np.random.default_rng(0)
+    v = np.concatenate((rng.lognormal(size=5_000), -rng.exponential(size=1_000), np.zeros(100)))
+
+    sketch = DDSketch(alpha=0.01)
+    for x in v:
+        sketch.add(x)
+
+    assert sketch.count == len(v)
+    for q in [0., 0.01, 0.1, 0.5, 0.9, 0.99, 1.]:
+        expected = np.quantile(v, q, method='lower')
+        assert abs(sketch.quantile(q) - expected) <= 0.01 * abs(expected) + 1e-12
+
+
+def test_merge1():
+    rng = np.random.default_rng(0)
+    runs = [rng.normal(loc=i, size=1_000) for i in range(5)]
+
+    blobs = []
+    for v in runs:
+        sketch = DDSketch(alpha=0.01)
+        for x in v:
+            sketch.add(x)
+
+        blobs.append(sketch.to_bytes())
+
+    merged = merge_sketches(blobs)
+    assert merged is not None
+
+    # merging serialized sketches is the same as sketching everything at once
+    full = DDSketch(alpha=0.01)
+    for x in np.concatenate(runs):
+        full.add(x)
+
+    qs = [0.05, 0.25, 0.5, 0.75, 0.95]
+    assert merged.quantiles(qs) == full.quantiles(qs)
+
+
+def test_bounded_bins1():
+    sketch = DDSketch(alpha=0.01, max_bins=64)
+    for x in np.geomspace(1e-6, 1e6, 10_000):
+        sketch.add(x)
+
+    assert len(sketch._pos) <= 64
+    assert sketch.count == 10_000
+
+    # collapsing only loses resolution near zero, the tail stays accurate
+    assert abs(sketch.quantile(0.99) - np.quantile(np.geomspace(1e-6, 1e6, 10_000), 0.99, method='lower')) < 0.02 * 1e6
+
+
+def test_non_finite1():
+    # nan has no rank and is only counted
+    sketch = DDSketch(alpha=0.01)
+    sketch.add(float('nan'))
+    assert sketch.count == 0
+    assert sketch.nan_count == 1
+    assert np.isnan(sketch.quantile(0.))
+
+    # infinities rank below and above every finite value
+    for x in [-np.inf, 1., 2., 3., np.inf, np.inf]:
+        sketch.add(x)
+
+    assert sketch.count == 6
+    assert sketch.quantile(0.) == -np.inf
+    assert abs(sketch.quantile(0.4) - 2.) <= 0.02
+    assert sketch.quantile(0.8) == np.inf
+    assert sketch.quantile(1.) == np.inf
+
+    # the counts survive serialization and merging
+    merged = merge_sketches([sketch.to_bytes(), sketch.to_bytes()])
+    assert merged is not None
+    assert (merged.count, merged.nan_count) == (12, 2)
+    assert merged.quantile(0.) == -np.inf
+
+    # sketches stored before the non-finite counts were added still load
+    old = DDSketch.from_bytes(sketch.to_bytes()[:-24])
+    assert old.count == 3 and old.nan_count == 0